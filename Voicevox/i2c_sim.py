@@ -0,0 +1,361 @@
+"""
+I2C デバイスのシミュレータ（PCA9685 / TSL2591 のレジスタを再現）
+
+Raspberry Pi が無い普通の Linux でも、ドライバや制御ループを動かして
+転送回数や所要時間を測れるようにするためのもの。
+
+ポイント
+- SimBus は smbus.SMBus と同じ呼び方ができるので、そのままドライバに渡せる
+    bus = SimBus.default()                       # 0x40: PCA9685, 0x29: TSL2591
+    pwm = PCA9685(bus=bus)
+- 環境変数 I2C_BACKEND=sim を付けて実行すると、i2c_bus.get_bus() が SimBus を返す
+    $ I2C_BACKEND=sim python3 lightsensor_cli.py
+- 1回の転送にかかる時間は「固定分 + バイト数 × 1バイト分」でモデル化
+  （既定は 100kHz の I2C + システムコール分）。realtime=True なら実際にその時間だけ待つ
+- 転送回数・バイト数・合計転送時間をデバイスごとに数える
+- TSL2591 の明るさは set_lux() や関数（経過秒 → lux）で台本どおりに変えられる
+- SimGPIO は RPi.GPIO の代わりに TSL2591 の INT ピン（割り込み出力）を読める
+"""
+
+import os
+import time
+
+I2C_HZ = 100000                       # バスクロック（標準モード）
+BYTE_TIME = 9.0 / I2C_HZ              # 1バイト = 8bit + ACK
+START_STOP_TIME = 2.0 / I2C_HZ
+SYSCALL_OVERHEAD = 60e-6              # i2c-dev の ioctl 1回あたりの固定コスト（Pi 4 の目安）
+
+
+class SimBus:
+    """SMBus 互換のシミュレーションバス"""
+
+    def __init__(self, devices=None, base_latency=START_STOP_TIME + SYSCALL_OVERHEAD, byte_time=BYTE_TIME,
+                 realtime=False):
+        self.devices = dict(devices or {})
+        self.base_latency = base_latency
+        self.byte_time = byte_time
+        self.realtime = realtime
+        self.transactions = 0
+        self.bytes = 0
+        self.bus_time = 0.0                 # モデル上の合計転送時間（秒）
+        self.per_device = {}                # addr -> [回数, バイト数]
+
+    @classmethod
+    def default(cls, lux=100.0, **kwargs):
+        """PCA9685(0x40) と TSL2591(0x29) がつながったバス"""
+        return cls({0x40: SimPCA9685(), 0x29: SimTSL2591(lux=lux)}, **kwargs)
+
+    # ---- 転送時間・回数の記録 ----
+    def _transfer(self, addr, nbytes):
+        dev = self.devices.get(addr)
+        if dev is None:
+            raise OSError(121, "Remote I/O error")   # 実機の smbus と同じ（NACK）
+        # アドレス + コマンドバイト + データ
+        latency = self.base_latency + (2 + nbytes) * self.byte_time
+        self.transactions += 1
+        self.bytes += nbytes
+        self.bus_time += latency
+        counts = self.per_device.setdefault(addr, [0, 0])
+        counts[0] += 1
+        counts[1] += nbytes
+        if self.realtime:
+            end = time.perf_counter() + latency
+            while time.perf_counter() < end:
+                pass
+        return dev
+
+    def reset_counters(self):
+        self.transactions = 0
+        self.bytes = 0
+        self.bus_time = 0.0
+        self.per_device = {}
+
+    # ---- smbus.SMBus 互換 ----
+    def read_byte_data(self, addr, cmd):
+        return self._transfer(addr, 1).read(cmd, 1)[0]
+
+    def write_byte_data(self, addr, cmd, value):
+        self._transfer(addr, 1).write(cmd, [value & 0xFF])
+
+    def read_word_data(self, addr, cmd):
+        lo, hi = self._transfer(addr, 2).read(cmd, 2)
+        return lo | (hi << 8)
+
+    def write_word_data(self, addr, cmd, value):
+        self._transfer(addr, 2).write(cmd, [value & 0xFF, (value >> 8) & 0xFF])
+
+    def read_i2c_block_data(self, addr, cmd, length):
+        return self._transfer(addr, length).read(cmd, length)
+
+    def write_i2c_block_data(self, addr, cmd, values):
+        values = [v & 0xFF for v in values]
+        if len(values) > 32:
+            raise OSError(22, "Invalid argument")    # SMBus ブロック転送は 32 バイトまで
+        self._transfer(addr, len(values)).write(cmd, values)
+
+    def close(self):
+        pass
+
+
+class SimPCA9685:
+    """PCA9685 のレジスタマップ（MODE1/MODE2, LEDn, ALL_LED, PRESCALE）"""
+
+    MODE1 = 0x00
+    MODE2 = 0x01
+    LED0_ON_L = 0x06
+    ALLLED_ON_L = 0xFA
+    PRESCALE = 0xFE
+
+    def __init__(self):
+        self.regs = [0] * 256
+        self.regs[self.MODE1] = 0x11           # 電源投入時: SLEEP | ALLCALL
+        self.regs[self.MODE2] = 0x04
+        self.regs[self.PRESCALE] = 0x1E        # 約200Hz
+        for ch in range(16):
+            self.regs[self.LED0_ON_L + 4 * ch + 3] = 0x10   # LEDn_OFF_H の full OFF
+
+    def _auto_increment(self):
+        return bool(self.regs[self.MODE1] & 0x20)
+
+    def read(self, reg, n):
+        if not self._auto_increment():
+            return [self.regs[reg]] * n
+        return [self.regs[(reg + i) & 0xFF] for i in range(n)]
+
+    def write(self, reg, values):
+        for v in values:
+            self._write_reg(reg, v)
+            if self._auto_increment():
+                reg = (reg + 1) & 0xFF
+
+    def _write_reg(self, reg, v):
+        if reg == self.PRESCALE and not (self.regs[self.MODE1] & 0x10):
+            return                              # PRESCALE は SLEEP 中しか書けない
+        if reg == self.MODE1:
+            v &= 0x7F                           # RESTART は書くと自動でクリアされる
+        self.regs[reg] = v
+        if self.ALLLED_ON_L <= reg <= self.ALLLED_ON_L + 3:
+            for ch in range(16):
+                self.regs[self.LED0_ON_L + 4 * ch + reg - self.ALLLED_ON_L] = v
+
+    def pwm(self, channel):
+        """(on, off) の 12bit 値"""
+        r = self.regs[self.LED0_ON_L + 4 * channel:self.LED0_ON_L + 4 * channel + 4]
+        return r[0] | (r[1] << 8), r[2] | (r[3] << 8)
+
+    @property
+    def freq(self):
+        return 25000000.0 / (4096.0 * (self.regs[self.PRESCALE] + 1))
+
+
+class SimTSL2591:
+    """
+    TSL2591 のレジスタマップ（ENABLE, CONTROL(AGAIN/ATIME), 閾値, STATUS, C0/C1 DATA, ID=0x50）
+    電源と ALS が ON の間、ATIME ごとに変換が終わり C0/C1 が更新される。
+    """
+
+    COMMAND_BIT = 0xA0
+    ENABLE = 0x00
+    CONTROL = 0x01
+    PERSIST = 0x0C
+    ID = 0x12
+    STATUS = 0x13
+    C0DATAL = 0x14
+    GAINS = {0x00: 1.0, 0x10: 25.0, 0x20: 428.0, 0x30: 9876.0}
+    LUX_DF = 762.0
+    PERSIST_COUNTS = [1, 1, 2, 3, 5, 10, 15, 20, 25, 30, 35, 40, 45, 50, 55, 60]
+
+    def __init__(self, lux=100.0, ir_ratio=0.25, clock=time.monotonic):
+        self.regs = [0] * 32
+        self.regs[self.ID] = 0x50
+        self.ir_ratio = ir_ratio               # CH1(IR) / CH0(全光)
+        self.clock = clock
+        self.t_start = clock()
+        self.set_lux(lux)
+        self._cycle_start = None               # いまの変換の開始時刻
+        self._out_of_range = 0
+
+    # ---- 明るさの台本 ----
+    def set_lux(self, lux):
+        """一定値、または「開始からの経過秒 → lux」の関数を設定する"""
+        self.light = lux if callable(lux) else (lambda t, v=float(lux): v)
+
+    def lux_now(self):
+        return self.light(self.clock() - self.t_start)
+
+    # ---- 変換の進み具合 ----
+    @property
+    def integration_time(self):
+        return ((self.regs[self.CONTROL] & 0x07) + 1) * 0.1
+
+    def _counts(self, lux):
+        atime_ms = self.integration_time * 1000.0
+        cpl = atime_ms * self.GAINS[self.regs[self.CONTROL] & 0x30] / self.LUX_DF
+        ch0 = lux * cpl / max(1.0 - 2.0 * self.ir_ratio, 1e-3)
+        max_count = 36863 if (self.regs[self.CONTROL] & 0x07) == 0 else 65535
+        ch0 = int(min(max(ch0, 0.0), max_count))
+        ch1 = int(min(ch0 * self.ir_ratio, max_count))
+        return ch0, ch1
+
+    def _update(self):
+        running = (self.regs[self.ENABLE] & 0x03) == 0x03     # PON と AEN
+        if not running:
+            self._cycle_start = None
+            return
+        now = self.clock()
+        if self._cycle_start is None:
+            self._cycle_start = now
+        while now - self._cycle_start >= self.integration_time:
+            self._cycle_start += self.integration_time
+            self._complete(self.light(self._cycle_start - self.t_start))
+
+    def _complete(self, lux):
+        ch0, ch1 = self._counts(lux)
+        r = self.regs
+        r[self.C0DATAL:self.C0DATAL + 4] = [ch0 & 0xFF, ch0 >> 8, ch1 & 0xFF, ch1 >> 8]
+        status = r[self.STATUS] | 0x01                        # AVALID
+        ailt = r[0x04] | (r[0x05] << 8)
+        aiht = r[0x06] | (r[0x07] << 8)
+        npailt = r[0x08] | (r[0x09] << 8)
+        npaiht = r[0x0A] | (r[0x0B] << 8)
+        if ch0 < ailt or ch0 > aiht:
+            self._out_of_range += 1
+            persist = r[self.PERSIST] & 0x0F
+            if persist == 0 or self._out_of_range >= self.PERSIST_COUNTS[persist]:
+                status |= 0x10                                # AINT
+        else:
+            self._out_of_range = 0
+        if ch0 < npailt or ch0 > npaiht:
+            status |= 0x20                                    # NPINTR
+        r[self.STATUS] = status
+
+    @property
+    def int_asserted(self):
+        """INT ピンが出力されているか（実機ではオープンドレインで Low）"""
+        self._update()
+        en, st = self.regs[self.ENABLE], self.regs[self.STATUS]
+        return bool((en & 0x10 and st & 0x10) or (en & 0x80 and st & 0x20))
+
+    # ---- レジスタアクセス ----
+    def read(self, cmd, n):
+        self._update()
+        reg = cmd & 0x1F
+        return [self.regs[(reg + i) & 0x1F] for i in range(n)]
+
+    def write(self, cmd, values):
+        if cmd & 0xE0 == 0xE0:                                # スペシャルファンクション
+            func = cmd & 0x1F
+            if func in (0x06, 0x07):                          # ALS 割り込みクリア
+                self.regs[self.STATUS] &= ~0x10
+            if func in (0x07, 0x0A):                          # 非持続割り込みクリア
+                self.regs[self.STATUS] &= ~0x20
+            return
+        self._update()
+        reg = cmd & 0x1F
+        for i, v in enumerate(values):
+            r = (reg + i) & 0x1F
+            if r == self.CONTROL and v & 0x80:                # SRESET
+                self.__init__(lux=self.light, ir_ratio=self.ir_ratio, clock=self.clock)
+                return
+            if r in (self.ID, self.STATUS) or self.C0DATAL <= r <= self.C0DATAL + 3:
+                continue                                      # 読み出し専用
+            if r == self.ENABLE and (v & 0x03) != 0x03:
+                self._cycle_start = None
+            self.regs[r] = v
+        self._update()
+
+
+class SimGPIO:
+    """
+    RPi.GPIO の代わり（入力ピンのみ）。pins = {ピン番号: int_asserted を持つシミュレータ}
+    例: SimGPIO({4: bus.devices[0x29]}) で TSL2591 の INT を GPIO4 につないだことになる
+    """
+
+    BCM = 11
+    IN = 1
+    OUT = 0
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self, pins, poll=0.002):
+        self.pins = dict(pins)
+        self.poll = poll
+
+    def setmode(self, mode):
+        pass
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None):
+        pass
+
+    def cleanup(self, *args):
+        pass
+
+    def input(self, pin):
+        dev = self.pins.get(pin)
+        return self.LOW if dev is not None and dev.int_asserted else self.HIGH
+
+    def wait_for_edge(self, pin, edge, timeout=None):
+        """RPi.GPIO と同じく timeout はミリ秒。エッジが来たら pin、タイムアウトなら None"""
+        deadline = None if timeout is None else time.monotonic() + timeout / 1000.0
+        prev = self.input(pin)
+        while deadline is None or time.monotonic() < deadline:
+            time.sleep(self.poll)
+            cur = self.input(pin)
+            if cur != prev and (edge == self.BOTH
+                                or (edge == self.FALLING and cur == self.LOW)
+                                or (edge == self.RISING and cur == self.HIGH)):
+                return pin
+            prev = cur
+        return None
+
+
+def from_env():
+    """環境変数 I2C_BACKEND=sim のときに i2c_bus から呼ばれる"""
+    lux = float(os.environ.get("I2C_SIM_LUX", "100"))
+    realtime = os.environ.get("I2C_SIM_REALTIME", "0") == "1"
+    return SimBus.default(lux=lux, realtime=realtime)
+
+
+# ---- 簡単なベンチマーク（python3 i2c_sim.py）----
+if __name__ == "__main__":
+    bus = SimBus.default()
+
+    try:
+        from PCA9685 import PCA9685
+    except ImportError:
+        PCA9685 = None
+    if PCA9685 is not None:
+        pwm = PCA9685(bus=bus)
+        pwm.setPWMFreq(50)
+        bus.reset_counters()
+        for i in range(100):
+            pwm.setRotationAngle(0, 60 + i * 0.5)
+            pwm.setRotationAngle(1, 100 - i * 0.5)
+        print("PCA9685 setRotationAngle x2 (100 frames): %d transactions, %.1f ms"
+              % (bus.transactions, bus.bus_time * 1000))
+        bus.reset_counters()
+        for i in range(100):
+            pwm.setRotationAngles({0: 120 - i * 0.5, 1: 50 + i * 0.5})
+        print("PCA9685 setRotationAngles   (100 frames): %d transactions, %.1f ms"
+              % (bus.transactions, bus.bus_time * 1000))
+
+    try:
+        import TSL2591
+    except ImportError:
+        TSL2591 = None
+    if TSL2591 is not None:
+        sensor = TSL2591.TSL2591(bus=bus)
+        bus.reset_counters()
+        t0 = time.perf_counter()
+        lux = sensor.Lux
+        print("TSL2591 Lux = %s: %d transactions, %.2f ms on the bus, %.0f ms wall"
+              % (lux, bus.transactions, bus.bus_time * 1000, (time.perf_counter() - t0) * 1000))
@@ -1,30 +1,51 @@
-import time
 import wave
 import pyaudio
 import TSL2591              # 照度センサ TSL2591
 from PCA9685 import PCA9685  # サーボ制御用
+from servo_worker import ServoWorker  # サーボ出力を別スレッドで行う
+from servo_motion import plan_move    # なめらかな動きを事前計算
+from servo_calib import load_calibration, apply_calibration
+from lux_events import LuxEventWatcher  # 明るさのしきい値を割り込みで待つ
+from lux_daemon import LuxClient, daemon_running  # センサを共有する配信サービス
 
 
 # ===== サーボ設定 =====
 SERVO_FREQ_HZ   = 50
 SERVO_CH_X      = 0          # 左右
 SERVO_CH_Y      = 1          # 上下
-SERVO_MIN       = 30         # 暗いときの向きなどに利用
-SERVO_MAX       = 150        # 明るいときの向き
-SERVO_CENTER_X  = 90
-SERVO_CENTER_Y  = 90
+# 角度の範囲（soft_min: 暗いとき / soft_max: 明るいとき）と中心は servo_calib.json で設定
+SERVO_V_MAX     = 90.0       # 姿勢を変えるときの最大角速度（度/秒）
+SERVO_A_MAX     = 300.0      # 最大角加速度（度/秒^2）
+
+# ===== 明るさのしきい値 =====
+BRIGHT_LUX      = 500        # これを超えると「明るい」
+DARK_LUX        = 10         # これ未満で「暗い」
 
 # ===== センサ初期化 =====
-sensor = TSL2591.TSL2591()
+# lux_daemon.py が動いていれば、センサには触らずにその配信を受け取る
+# （lightsensor_gui.py などと同時に動かしてもセンサの設定を取り合わない）
+if daemon_running():
+    client = LuxClient()
+    sensor = None
+else:
+    client = None
+    sensor = TSL2591.TSL2591()
 
 # ===== サーボ初期化 =====
 pwm = PCA9685()
 pwm.setPWMFreq(SERVO_FREQ_HZ)
+calib = apply_calibration(pwm, load_calibration())
+cal_x = calib[SERVO_CH_X]
+cal_y = calib[SERVO_CH_Y]
+
+sx = cal_x.center
+sy = cal_y.center
+pwm.setRotationAngles({SERVO_CH_X: sx, SERVO_CH_Y: sy})  # 2軸まとめて1回のI2C転送
 
-sx = SERVO_CENTER_X
-sy = SERVO_CENTER_Y
-pwm.setRotationAngle(SERVO_CH_X, sx)
-pwm.setRotationAngle(SERVO_CH_Y, sy)
+# サーボへの書き込みは別スレッドで 50Hz ごとに最新の目標だけを反映
+# （メインループは I2C の完了を待たない）
+servo = ServoWorker(pwm, rate_hz=SERVO_FREQ_HZ)
+servo.start()
 
 
 def play_wav(
@@ -78,56 +99,98 @@ def play_wav(
     print(f"再生完了: {path}")
 
 
-# ===== メインループ =====
+# ===== 明るさに応じた反応 =====
 prev_state = None  # "bright" / "dark" / "normal"
 
+
+def lux_state(lux):
+    """明るさから状態（bright / dark / normal）を決める"""
+    if lux > BRIGHT_LUX:
+        return "bright"
+    if lux < DARK_LUX:
+        return "dark"
+    return "normal"
+
+
+def update_state(lux):
+    """明るさから状態を決め、サーボを動かし、状態が変わったら音を鳴らす"""
+    global sx, sy, prev_state
+    print(f"現在の照度: {lux} lux")
+
+    # 状態判定
+    state = lux_state(lux)
+    if state == "bright":
+        # 明るいときのサーボ姿勢（例: どちらも最大側）
+        tx = cal_x.soft_max
+        ty = cal_y.soft_max
+
+    elif state == "dark":
+        # 暗いときのサーボ姿勢（例: どちらも最小側）
+        tx = cal_x.soft_min
+        ty = cal_y.soft_min
+
+    else:
+        # ふつうの明るさのときは中央
+        tx = cal_x.center
+        ty = cal_y.center
+
+    # 姿勢が変わるときだけ、いまの角度から目標までの動きを計算して再生
+    # （前の動きの途中でも、実際に書き込まれている角度から動き出す）
+    if (tx, ty) != (sx, sy):
+        now = {SERVO_CH_X: sx, SERVO_CH_Y: sy}
+        now.update(servo.angles)
+        servo.play(plan_move(now, {SERVO_CH_X: tx, SERVO_CH_Y: ty},
+                             v_max=SERVO_V_MAX, a_max=SERVO_A_MAX, kind="scurve",
+                             tables=pwm.tables))
+        sx, sy = tx, ty
+
+    # 状態が変わったときだけ音声を再生
+    if state != prev_state:
+        if state == "bright":
+            play_wav("./output1.wav", output_device_index=2)
+        elif state == "dark":
+            play_wav("./output2.wav", output_device_index=2)
+        # normal になったときは何も再生しない例
+        prev_state = state
+
+
+def on_cross(lux, rising):
+    """しきい値をまたいだときだけ呼ばれる（割り込み）"""
+    update_state(lux)
+
+
+def follow_daemon():
+    """配信サービスから変換ごとの値を受け取り、しきい値をまたいだときだけ反応する"""
+    sample = client.latest() or client.get()
+    update_state(sample.lux)   # 起動時の明るさで最初の姿勢を決める
+    prev = sample.lux
+    for sample in client:
+        lux = sample.lux
+        if lux_state(lux) != lux_state(prev):
+            on_cross(lux, lux > prev)
+        prev = lux
+
+
+# ===== メイン =====
 try:
-    while True:
-        # ---- Lux値（照度）を取得 ----
-        lux = sensor.Lux
-        print(f"現在の照度: {lux} lux")
-
-        # 状態判定
-        if lux > 500:
-            state = "bright"
-            # 明るいときのサーボ姿勢（例: どちらも最大側）
-            sx = SERVO_MAX
-            sy = SERVO_MAX
-            pwm.setRotationAngle(SERVO_CH_X, sx)
-            pwm.setRotationAngle(SERVO_CH_Y, sy)
-
-        elif lux < 10:
-            state = "dark"
-            # 暗いときのサーボ姿勢（例: どちらも最小側）
-            sx = SERVO_MIN
-            sy = SERVO_MIN
-            pwm.setRotationAngle(SERVO_CH_X, sx)
-            pwm.setRotationAngle(SERVO_CH_Y, sy)
-
-        else:
-            state = "normal"
-            # ふつうの明るさのときは中央
-            sx = SERVO_CENTER_X
-            sy = SERVO_CENTER_Y
-            pwm.setRotationAngle(SERVO_CH_X, sx)
-            pwm.setRotationAngle(SERVO_CH_Y, sy)
-
-        # 状態が変わったときだけ音声を再生
-        if state != prev_state:
-            if state == "bright":
-                play_wav("./output1.wav", output_device_index=2)
-            elif state == "dark":
-                play_wav("./output2.wav", output_device_index=2)
-            # normal になったときは何も再生しない例
-            prev_state = state
-
-        # ---- 割り込み閾値を設定（任意）----
-        # 例: 暗すぎる（50以下）または明るすぎる（200以上）でハード側割り込み
-        sensor.TSL2591_SET_LuxInterrupt(50, 200)
-
-        # ---- 取得間隔 ----
-        time.sleep(1.0)  # 1秒ごとに更新
+    if client is not None:
+        follow_daemon()
+    else:
+        # 1秒ごとに読みに行く代わりに、センサの割り込み（INT ピン）でしきい値の通過を待つ。
+        # 待っている間は CPU をほとんど使わず、通過してから1回の積分時間以内に反応できる。
+        watcher = LuxEventWatcher(sensor)
+        watcher.watch(DARK_LUX, on_cross)
+        # lux は整数なので「BRIGHT_LUX を超える」＝「BRIGHT_LUX + 1 以上」（watch はその値以上になったら呼ぶ）
+        watcher.watch(BRIGHT_LUX + 1, on_cross)
+        sensor.Start_Continuous()
+        update_state(sensor.Lux)   # 起動時の明るさで最初の姿勢を決める
+        watcher.run()              # Ctrl+C まで割り込みを待ち続ける
 
 except KeyboardInterrupt:
     print("\n停止しました。プログラムを終了します。")
+    if sensor is not None:
+        sensor.Stop_Continuous()
+    if client is not None:
+        client.close()
+    servo.stop()
     pwm.exit_PCA9685()
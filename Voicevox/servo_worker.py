@@ -0,0 +1,156 @@
+"""
+PCA9685 へのサーボ出力をバックグラウンドスレッドで行うワーカー
+
+ポイント
+- カメラやセンサのループは set_angles() で目標角度を置くだけ（I2C の完了を待たない）
+- ワーカーは一定周期（既定 50Hz = サーボの PWM 周期）で最新の目標だけを書き込む
+- 書き込み前に届いた古い目標は最新値で上書きされる（コアレッシング）
+- 目標を置いてから実際に書き込むまでの遅延（キュー遅延）を計測できる
+- play() で事前計算した動き（servo_motion.Trajectory）を周期に合わせて再生できる
+
+使い方
+    worker = ServoWorker(pwm)
+    worker.start()
+    worker.set_angles({0: sx, 1: sy})   # どのスレッドから呼んでもよい
+    worker.stop()
+"""
+
+import threading
+import time
+
+
+class ServoWorker:
+    def __init__(self, pwm, rate_hz=50.0):
+        self.pwm = pwm
+        self.period = 1.0 / rate_hz
+
+        self._lock = threading.Lock()
+        self._pending = {}          # channel -> angle（まだ書いていない最新の目標）
+        self._pending_since = None  # 未送信の目標のうち最も古いものを置いた時刻
+        self._traj = None           # 再生中の Trajectory
+        self._traj_t0 = 0.0
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.angles = {}            # 最後に書き込んだ角度（channel -> angle）
+
+        # 統計
+        self.updates = 0            # 実際に書き込んだ回数
+        self.coalesced = 0          # 上書きされて捨てられた目標の数
+        self.latency_last = 0.0     # 直近のキュー遅延（秒）
+        self.latency_max = 0.0
+        self._latency_sum = 0.0
+
+    # ---- 開始・停止 ----
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="ServoWorker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        """スレッドを止める。残っている目標は最後に書き込んでから終了する。"""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+        self._thread = None
+        self._flush()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ---- 目標の投入（ブロックしない） ----
+    def set_angle(self, channel, angle):
+        self.set_angles({channel: angle})
+
+    def set_angles(self, angles):
+        """目標角度 {channel: angle} を置く。再生中の動きは中止される。"""
+        now = time.perf_counter()
+        with self._lock:
+            self._traj = None
+            for channel, angle in angles.items():
+                if channel in self._pending:
+                    self.coalesced += 1
+                self._pending[channel] = angle
+            if self._pending_since is None:
+                self._pending_since = now
+
+    def play(self, traj):
+        """事前計算した動きを再生する。各周期で経過時間に対応するステップを書き込む。"""
+        with self._lock:
+            self._pending = {}
+            self._pending_since = None
+            self._traj = traj
+            self._traj_t0 = time.perf_counter()
+
+    @property
+    def moving(self):
+        return self._traj is not None
+
+    # ---- 統計 ----
+    @property
+    def latency_avg(self):
+        return self._latency_sum / self.updates if self.updates else 0.0
+
+    def stats(self):
+        return {
+            "updates": self.updates,
+            "coalesced": self.coalesced,
+            "latency_last_ms": self.latency_last * 1000.0,
+            "latency_avg_ms": self.latency_avg * 1000.0,
+            "latency_max_ms": self.latency_max * 1000.0,
+        }
+
+    # ---- ワーカースレッド本体 ----
+    def _run(self):
+        next_t = time.perf_counter()
+        while not self._stop_event.is_set():
+            self._flush()
+            next_t += self.period
+            delay = next_t - time.perf_counter()
+            if delay > 0:
+                self._stop_event.wait(delay)
+            else:
+                # 遅れを取り戻そうと連続で書かず、周期を今から数え直す
+                next_t = time.perf_counter()
+
+    def _flush(self):
+        with self._lock:
+            pending, since = self._pending, self._pending_since
+            self._pending = {}
+            self._pending_since = None
+            traj, t0 = self._traj, self._traj_t0
+        if traj is not None:
+            self._step(traj, t0)
+        if not pending:
+            return
+        try:
+            self.pwm.setRotationAngles(pending)
+        except OSError as e:
+            # I2C エラーでスレッドが止まらないように、表示だけして次の周期へ
+            print(f"サーボ書き込みエラー: {e}")
+            return
+        self.angles.update(pending)
+        latency = time.perf_counter() - since
+        self.updates += 1
+        self.latency_last = latency
+        self.latency_max = max(self.latency_max, latency)
+        self._latency_sum += latency
+
+    def _step(self, traj, t0):
+        k = min(int((time.perf_counter() - t0) / traj.dt), len(traj) - 1)
+        if k == len(traj) - 1:
+            with self._lock:
+                if self._traj is traj:
+                    self._traj = None
+        try:
+            self.pwm.setPWMs({ch: (0, tick) for ch, tick in zip(traj.channels, traj.ticks[k].tolist())})
+        except OSError as e:
+            print(f"サーボ書き込みエラー: {e}")
+            return
+        self.angles.update(zip(traj.channels, traj.angles[k].tolist()))
@@ -4,39 +4,32 @@ PiCamera2 + OpenCV でカメラ映像をリアルタイム表示するサンプ
 
 ポイント:
 - Picamera2 のプレビュー設定を使って画像を取得
+- 取得は frame_grabber.FrameGrabber が別スレッドで行い、ループは最新フレームを受け取るだけ
+- 環境変数 FRAME_SOURCE で動画ファイル・画像フォルダ・合成映像にも切り替えられる（frame_source.py）
 - OpenCV (cv2) の imshow() で表示
 - ESCキーで終了
 """
 
 import cv2
-from picamera2 import Picamera2
-from libcamera import controls
+from frame_source import open_source
 
 # ===== カメラの初期化 =====
-picam2 = Picamera2()
-
 # カメラ設定:
-# main={"format": 'XRGB8888', "size": (640, 480)}
-# → XRGB8888 は 4ch (透明度含む) のRGB形式
-# → 640x480 は標準的なVGAサイズ（軽くて速い）
-config = picam2.create_preview_configuration(
-    main={"format": 'XRGB8888', "size": (640, 480)}
-)
-picam2.configure(config)
-
-# カメラ起動
-picam2.start()
-
-# オートフォーカスを連続モードに設定（レンズ付きモジュールのみ有効）
-picam2.set_controls({"AfMode": controls.AfModeEnum.Continuous})
-
+# "XRGB8888" → 4ch (透明度含む) のRGB形式
+# (640, 480) → 標準的なVGAサイズ（軽くて速い）
+# 起動・オートフォーカス（連続モード）の設定・別スレッドでの取得までまとめて行う
+# （上下反転も取得のときに一緒に行う。左右反転なら flip=1）
+source = open_source((640, 480), "XRGB8888", flip=0)
 
 try:
     while True:
         # ==== フレームを取得 ====
-        im = picam2.capture_array()  # 現在のカメラ映像を取得 (RGB配列)
-        im = cv2.flip(im, 0)         # 上下反転（取り付け向きに合わせて）
-        # im = cv2.flip(im, 1)       # 左右反転したい場合はこちら
+        frame = source.read()        # 新しいフレームを待って受け取る（上下反転済み）
+        if frame is None:            # 1秒待っても来なかった
+            if source.finished:      # 動画ファイルなどを最後まで読んだ
+                break
+            continue
+        im = frame.image
 
         # ==== ウィンドウに表示 ====
         cv2.imshow("Camera", im)
@@ -48,6 +41,6 @@ try:
 
 finally:
     # ==== 後始末（安全に停止） ====
-    picam2.stop()
+    source.stop()
     cv2.destroyAllWindows()
  
\ No newline at end of file
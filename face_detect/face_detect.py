@@ -5,11 +5,14 @@ PiCamera2 + OpenCV 顔検出サンプル（初心者向けコメント付き）
 - Haar Cascade を使ってカメラ映像から顔を検出する。
 - 検出された顔を矩形で囲んで表示。
 - ESCキーで終了。
+- カメラの取得は別スレッド（frame_grabber）で行い、検出中も次のフレームを撮り続ける。
+- 環境変数 FRAME_SOURCE で動画・画像フォルダ・合成映像（synth:faces:<フォルダ>）でも試せる。
+- グレースケール画像の配列は毎フレーム作らず、buffer_pool のものを使い回す。
 """
 
 import cv2
-from picamera2 import Picamera2
-from libcamera import controls
+from frame_source import open_source
+from buffer_pool import BufferPool
 
 # ===== 顔検出器の設定 =====
 # OpenCV の Haar Cascade（顔検出モデル）のパスを指定
@@ -28,30 +31,28 @@ else:
 cv2.startWindowThread()
 
 # ===== カメラ初期化 =====
-picam2 = Picamera2()
+# 640x480, XRGB8888 形式で起動し、オートフォーカスを連続モードに（レンズ付きモジュールの場合）
+# フレームの取得は別スレッドで（上下反転もそこで行う。取り付け方向により必要）
+source = open_source((640, 480), "XRGB8888", flip=0)
 
-# 640x480, XRGB8888 形式でプレビュー設定
-picam2.configure(
-    picam2.create_preview_configuration(
-        main={"format": 'XRGB8888', "size": (640, 480)}
-    )
-)
-
-picam2.start()
-
-# オートフォーカスを連続モードに（レンズ付きモジュールの場合）
-picam2.set_controls({"AfMode": controls.AfModeEnum.Continuous})
+# グレースケール変換の出力先（1回目に確保し、あとは同じ配列に書き込む）
+buffers = BufferPool()
 
 print("カメラ起動中。ESCキーで終了します。")
 
 try:
     while True:
         # ---- カメラ画像を取得 ----
-        im = picam2.capture_array()  # RGB (XRGB8888形式)
-        im = cv2.flip(im, 0)         # 上下反転（取り付け方向により必要）
+        # 検出が遅れても、いちばん新しいフレームが来る（間のフレームは捨てられる）
+        frame = source.read()        # XRGB8888形式、上下反転済み
+        if frame is None:
+            if source.finished:      # 動画・画像フォルダを最後まで読んだ
+                break
+            continue
+        im = frame.image
 
         # ---- 顔検出のためにグレースケール変換 ----
-        grey = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY)
+        grey = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY, dst=buffers.get("grey", im.shape[:2]))
 
         # ---- 顔検出 ----
         # detectMultiScale(image, scaleFactor, minNeighbors)
@@ -76,6 +77,6 @@ try:
 
 finally:
     # ===== 終了処理 =====
-    picam2.stop()
+    source.stop()
     cv2.destroyAllWindows()
     print("カメラを停止し、ウィンドウを閉じました。")
@@ -0,0 +1,139 @@
+"""
+Picamera2 のフレーム取得を別スレッドで行う「最新フレーム取り出し口」
+
+ポイント
+- これまでのループは picam2.capture_array() で次のフレームを待ってから処理していたので、
+  「撮影の待ち時間」と「画像処理」が順番にしか進まなかった
+- FrameGrabber はスレッドの中でフレームを受け取り続け、メインのループは
+  read() でいちばん新しいフレームを取り出すだけ（撮影と処理が同時に進む）
+- 処理がカメラより遅いときは、間に合わなかったフレームを捨てて最新だけを渡す
+  → 古いフレームを順番に処理して遅れがたまる、ということがない
+- バッファは2枚（ダブルバッファ）を使い回す
+  - 裏（back）: スレッドがカメラの画像をコピーする側（上下反転もこのコピーで一緒に行う）
+  - 表（front）: read() が返した側。次に read() を呼ぶまでスレッドは書き換えない
+  - read() のときに新しいフレームがあれば表と裏を入れ替える（コピーしない）
+- フレームごとに通し番号（seq）とセンサの撮影時刻（SensorTimestamp）が付く
+  → seq が飛んだぶんだけ処理が追いつかなかった、とわかる
+
+使い方
+    picam2.start()
+    grabber = FrameGrabber(picam2, flip=0).start()
+    while True:
+        frame = grabber.read()              # 新しいフレームが来るまで待つ（最大 timeout 秒）
+        if frame is None:
+            continue
+        process(frame.image)                # frame.seq, frame.timestamp も使える
+    grabber.stop()
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+import cv2
+
+# seq: 通し番号（1から）、timestamp: 撮影時刻（秒。SensorTimestamp / 1e9。
+# ふつうは time.monotonic() と同じ時計）、image: 画像（次の read() まで有効）
+Frame = namedtuple("Frame", "seq timestamp image")
+
+
+class FrameGrabber:
+    def __init__(self, picam2, stream="main", flip=None):
+        """flip: cv2.flip の向き（0: 上下, 1: 左右, -1: 両方, None: そのまま）"""
+        self.picam2 = picam2
+        self.stream = stream
+        self.flip = flip
+        self.captured = 0           # カメラから受け取ったフレーム数
+        self.dropped = 0            # read() される前に上書きされたフレーム数
+        self.errors = 0
+
+        self._lock = threading.Lock()
+        self._new_frame = threading.Condition(self._lock)
+        self._front = None          # read() が返したバッファ
+        self._back = None           # スレッドが書き込むバッファ
+        self._front_info = (0, 0.0)     # (seq, timestamp)
+        self._back_info = (0, 0.0)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    # ---- 開始・停止 ----
+    def start(self):
+        """picam2.start() の後に呼ぶ"""
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="FrameGrabber", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        """スレッドを止める（picam2.stop() の前に呼ぶ）"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        with self._new_frame:
+            self._new_frame.notify_all()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ---- 取り出し ----
+    def read(self, wait=True, timeout=1.0):
+        """
+        いちばん新しいフレーム（Frame）を返す
+        wait=True  … 前回の read() より新しいフレームが来るまで待つ（時間切れなら None）
+        wait=False … 待たずに、その時点で最新のもの（まだ1枚も無ければ None）
+        """
+        with self._new_frame:
+            if wait:
+                self._new_frame.wait_for(
+                    lambda: self._back_info[0] > self._front_info[0] or self._stop_event.is_set(),
+                    timeout)
+            if self._back_info[0] > self._front_info[0]:
+                # 表と裏を入れ替える（次はさっきまでの表にスレッドが書く）
+                self._front, self._back = self._back, self._front
+                self._front_info, self._back_info = self._back_info, self._front_info
+            elif wait or self._front is None:
+                return None
+        seq, timestamp = self._front_info
+        return Frame(seq, timestamp, self._front)
+
+    # ---- 本体 ----
+    def _run(self):
+        from picamera2 import MappedArray      # カメラのあるときだけ必要（Frame は単体で使える）
+        picam2 = self.picam2
+        while not self._stop_event.is_set():
+            try:
+                request = picam2.capture_request()
+            except Exception as e:          # カメラ停止中など
+                self.errors += 1
+                print("フレーム取得エラー:", e)
+                self._stop_event.wait(0.1)
+                continue
+            try:
+                stamp = request.get_metadata().get("SensorTimestamp")
+                timestamp = stamp / 1e9 if stamp else time.monotonic()
+                # カメラのバッファを直接見る（コピーは裏バッファへの1回だけ）
+                with MappedArray(request, self.stream) as m:
+                    with self._lock:
+                        self._store(m.array)
+                        self.captured += 1
+                        if self._back_info[0] > self._front_info[0]:
+                            self.dropped += 1       # 前のフレームは読まれずに上書き
+                        self._back_info = (self.captured, timestamp)
+                        self._new_frame.notify_all()
+            finally:
+                request.release()                   # バッファをすぐカメラへ返す
+
+    def _store(self, src):
+        """カメラの画像を裏バッファへ（必要なら反転しながら）コピーする"""
+        if self._back is None or self._back.shape != src.shape:
+            self._back = np.empty(src.shape, src.dtype)
+        if self.flip is None:
+            np.copyto(self._back, src)
+        else:
+            cv2.flip(src, self.flip, dst=self._back)
@@ -0,0 +1,370 @@
+"""
+カメラ以外からもフレームを受け取れるようにする「フレームの入手先」の切り替え口
+
+ポイント
+- open_source() が返すものは、どれも frame_grabber.FrameGrabber と同じ使い方
+    frame = source.read()       # Frame(seq, timestamp, image) か None
+- 入手先は環境変数 FRAME_SOURCE で選ぶ（スクリプトは書き換えなくてよい）
+    （なし）/ camera         … Picamera2（実機のカメラ。FrameGrabber で別スレッド取得）
+    video:<ファイル>         … 動画ファイル（cv2.VideoCapture）
+    images:<フォルダ>        … フォルダ内の画像を名前順に
+    synth                    … 動く色つきの円（赤い物体の追尾のテスト用）
+    synth:faces:<フォルダ>   … フォルダ内の顔画像が動き回る（顔検出のテスト用）
+    （ファイルやフォルダのパスをそのまま書いてもよい）
+- 進め方は環境変数 FRAME_PACE で選ぶ
+    realtime（既定） … FRAME_FPS（動画はファイルの fps）の速さで進む。処理が遅いと
+                       間のフレームを飛ばして最新を渡す（カメラと同じふるまい）
+    fast             … 待たずに次々と渡す（処理の速さを測る用。フレームは飛ばさない）
+- 動画・画像は Picamera2 と同じ形にそろえて渡す
+  （サイズを合わせ、"RGB888" なら3ch・"XRGB8888" なら4ch。色の並びは OpenCV の BGR）
+- 動画・画像フォルダは最後まで読むと read() が None を返し、source.finished が True になる
+  （FRAME_LOOP=1 なら先頭に戻ってくり返す）
+- measure(source, 関数) で、関数1回あたりの処理時間を同じ入力でくり返し測れる
+
+使い方
+    source = open_source(FRAME_SIZE, "RGB888", flip=0)
+    while True:
+        frame = source.read()
+        if frame is None:
+            if source.finished:
+                break
+            continue
+        process(frame.image)
+    source.stop()
+
+    $ FRAME_SOURCE=synth FRAME_PACE=fast python3 frame_source.py 300   # 渡す速さを測る
+"""
+
+import abc
+import glob
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import cv2
+
+from frame_grabber import Frame, FrameGrabber
+
+DEFAULT_FPS = 30.0
+PACES = ("realtime", "fast")
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+# ===== Picamera2 =====
+class CameraSource:
+    """Picamera2 を設定して起動し、FrameGrabber で別スレッド取得する"""
+
+    finished = False
+
+    def __init__(self, size=(640, 480), fmt="RGB888", flip=None, af=True):
+        from picamera2 import Picamera2         # カメラを使うときだけ読み込む
+        from libcamera import controls
+        self.size = size
+        self.picam2 = Picamera2()
+        self.picam2.configure(self.picam2.create_preview_configuration(
+            main={"format": fmt, "size": size}))
+        self.picam2.start()
+        if af:
+            # オートフォーカスを連続モードに（レンズ付きモジュールのみ有効）
+            self.picam2.set_controls({"AfMode": controls.AfModeEnum.Continuous})
+        self.grabber = FrameGrabber(self.picam2, flip=flip)
+
+    @property
+    def dropped(self):
+        return self.grabber.dropped
+
+    def start(self):
+        self.grabber.start()
+        return self
+
+    def read(self, wait=True, timeout=1.0):
+        return self.grabber.read(wait, timeout)
+
+    def stop(self):
+        self.grabber.stop()
+        self.picam2.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+# ===== カメラ以外（番号 index のフレームを作って渡す） =====
+class PacedSource(abc.ABC):
+    """
+    動画・画像・合成の共通部分
+    サブクラスは _frame(index) で index 番目の画像（BGR、大きさは何でもよい）を返す
+    （終わりなら None）
+    """
+
+    def __init__(self, size=(640, 480), fmt="RGB888", flip=None, fps=DEFAULT_FPS, pace="realtime"):
+        if pace not in PACES:
+            raise ValueError(f"pace は {PACES} のどれか: {pace!r}")
+        self.size = size
+        self.channels = 4 if fmt == "XRGB8888" else 3
+        self.flip = flip
+        self.fps = fps
+        self.pace = pace
+        self.finished = False
+        self.dropped = 0            # 処理が間に合わず飛ばしたフレーム数（realtime のみ）
+        self._next = 0              # 次に渡すフレームの番号
+        self._t0 = None
+        self._last = None
+        w, h = size
+        self._resized = np.empty((h, w, 3), np.uint8)
+        # 渡す画像は2枚を交互に使う（FrameGrabber と同じく、次の read() まで書き換えない）
+        self._buffers = [np.empty((h, w, self.channels), np.uint8) for _ in range(2)]
+
+    def start(self):
+        self._t0 = time.monotonic()
+        return self
+
+    def stop(self):
+        pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def read(self, wait=True, timeout=1.0):
+        if self._t0 is None:
+            self.start()
+        if self.finished:
+            return None
+        index = self._next
+        if self.pace == "realtime":
+            # いまの時刻に出ているはずのフレーム（遅れていたらそこまで飛ばす）
+            now = time.monotonic()
+            index = max(index, int((now - self._t0) * self.fps))
+            delay = self._t0 + index / self.fps - now
+            if delay > 0:
+                if not wait:
+                    return self._last
+                time.sleep(min(delay, timeout))
+                if delay > timeout:
+                    return None
+        image = self._frame(index)
+        if image is None:
+            self.finished = True
+            return None
+        self.dropped += index - self._next
+        self._next = index + 1
+        out = self._convert(image, self._buffers[index % 2])
+        self._last = Frame(index + 1, self._t0 + index / self.fps, out)
+        return self._last
+
+    def _convert(self, image, out):
+        """大きさ・チャンネル数・向きを Picamera2 の出力にそろえて out に書く"""
+        if image.shape[1::-1] != self.size:
+            image = cv2.resize(image, self.size, dst=self._resized, interpolation=cv2.INTER_AREA)
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        if self.channels == 4:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+        if self.flip is None:
+            np.copyto(out, image)
+        else:
+            cv2.flip(image, self.flip, dst=out)
+        return out
+
+    @abc.abstractmethod
+    def _frame(self, index):
+        """index 番目の画像（BGR、大きさは何でもよい）。終わりなら None"""
+
+
+class VideoSource(PacedSource):
+    def __init__(self, path, size=(640, 480), fmt="RGB888", flip=None, fps=None,
+                 pace="realtime", loop=False):
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise OSError(f"動画を開けません: {path}")
+        fps = fps or self.cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+        super().__init__(size, fmt, flip, fps, pace)
+        self.loop = loop
+        self._pos = 0               # 次に cap から出てくるフレームの番号
+        self._image = None
+
+    def _frame(self, index):
+        # 飛ばすフレームは grab() だけ（デコードしない）
+        while self._pos < index:
+            if not self._grab():
+                return None
+        ok, self._image = self.cap.read(self._image)
+        if not ok:
+            if not (self.loop and self._rewind()):
+                return None
+            ok, self._image = self.cap.read(self._image)
+            if not ok:
+                return None
+        self._pos += 1
+        return self._image
+
+    def _grab(self):
+        if self.cap.grab() or (self.loop and self._rewind() and self.cap.grab()):
+            self._pos += 1
+            return True
+        return False
+
+    def _rewind(self):
+        return self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def stop(self):
+        self.cap.release()
+
+
+class ImageDirSource(PacedSource):
+    def __init__(self, path, size=(640, 480), fmt="RGB888", flip=None, fps=DEFAULT_FPS,
+                 pace="realtime", loop=False):
+        super().__init__(size, fmt, flip, fps, pace)
+        self.files = sorted(f for f in glob.glob(os.path.join(path, "*"))
+                            if f.lower().endswith(IMAGE_EXTS))
+        if not self.files:
+            raise OSError(f"画像がありません: {path}")
+        self.loop = loop
+
+    def _frame(self, index):
+        if index >= len(self.files) and not self.loop:
+            return None
+        return cv2.imread(self.files[index % len(self.files)], cv2.IMREAD_COLOR)
+
+
+class SyntheticSource(PacedSource):
+    """
+    テスト用の映像を作る（同じ index なら毎回同じ画像）
+    kind="blobs": 灰色の背景の上を、赤（大・小）・緑・青の円がそれぞれの軌道で動く
+    kind="faces": faces_dir の画像（顔写真）が背景の上を動き回る
+    """
+
+    # (色 BGR, 半径, x 振幅, y 振幅, x 周期(秒), y 周期(秒))
+    BLOBS = (
+        ((0, 0, 220), 45, 0.35, 0.30, 7.0, 5.0),
+        ((0, 0, 200), 12, 0.40, 0.35, 3.0, 4.0),
+        ((0, 180, 0), 35, 0.30, 0.25, 6.0, 9.0),
+        ((200, 60, 0), 30, 0.25, 0.35, 8.0, 4.5),
+    )
+
+    def __init__(self, size=(640, 480), fmt="RGB888", flip=None, fps=DEFAULT_FPS,
+                 pace="realtime", kind="blobs", faces_dir=None, seed=0):
+        super().__init__(size, fmt, flip, fps, pace)
+        self.kind = kind
+        w, h = size
+        rng = np.random.default_rng(seed)
+        # 少しざらつきのある背景（ノイズ処理の効果がわかるように）
+        self.background = rng.normal(110, 12, (h, w, 3)).clip(0, 255).astype(np.uint8)
+        self._canvas = np.empty_like(self.background)
+        self.faces = []
+        if kind == "faces":
+            if faces_dir is None:
+                raise ValueError("kind='faces' には faces_dir が必要です")
+            for f in sorted(glob.glob(os.path.join(faces_dir, "*"))):
+                if f.lower().endswith(IMAGE_EXTS):
+                    img = cv2.imread(f, cv2.IMREAD_COLOR)
+                    if img is not None:
+                        scale = 0.4 * h / img.shape[0]
+                        self.faces.append(cv2.resize(img, None, fx=scale, fy=scale))
+            if not self.faces:
+                raise OSError(f"顔画像がありません: {faces_dir}")
+        elif kind != "blobs":
+            raise ValueError(f"kind は 'blobs' か 'faces': {kind!r}")
+
+    def _frame(self, index):
+        t = index / self.fps
+        w, h = self.size
+        img = self._canvas
+        np.copyto(img, self.background)
+        if self.kind == "blobs":
+            for color, r, ax, ay, px, py in self.BLOBS:
+                x = int(w / 2 + ax * w * np.sin(2 * np.pi * t / px))
+                y = int(h / 2 + ay * h * np.sin(2 * np.pi * t / py))
+                cv2.circle(img, (x, y), r, color, -1, cv2.LINE_AA)
+        else:
+            for i, face in enumerate(self.faces):
+                fh, fw = face.shape[:2]
+                # 顔ごとに位相をずらして、画面の中を往復させる
+                x = int((w - fw) * (0.5 + 0.5 * np.sin(2 * np.pi * t / 6.0 + 2.1 * i)))
+                y = int((h - fh) * (0.5 + 0.5 * np.sin(2 * np.pi * t / 8.0 + 1.3 * i)))
+                x, y = max(0, min(w - fw, x)), max(0, min(h - fh, y))
+                img[y:y + fh, x:x + fw] = face[:h - y, :w - x]
+        return img
+
+
+# ===== 環境変数から選ぶ =====
+def open_source(size=(640, 480), fmt="RGB888", flip=None, spec=None, pace=None, fps=None):
+    """
+    FRAME_SOURCE（または spec）で選んだ入手先を開いて start() して返す
+    flip はカメラの取り付け向きの補正なので、カメラのときだけ使う
+    """
+    spec = spec if spec is not None else os.environ.get("FRAME_SOURCE", "camera")
+    pace = pace or os.environ.get("FRAME_PACE", "realtime")
+    fps = fps or float(os.environ.get("FRAME_FPS", "0")) or None
+    loop = os.environ.get("FRAME_LOOP", "0") == "1"
+
+    kind, _, arg = spec.partition(":")
+    if kind in ("", "camera"):
+        return CameraSource(size, fmt, flip).start()
+    if kind == "video":
+        return VideoSource(arg, size, fmt, None, fps, pace, loop).start()
+    if kind == "images":
+        return ImageDirSource(arg, size, fmt, None, fps or DEFAULT_FPS, pace, loop).start()
+    if kind == "synth":
+        sub, _, faces_dir = arg.partition(":")
+        return SyntheticSource(size, fmt, None, fps or DEFAULT_FPS, pace,
+                               kind=sub or "blobs", faces_dir=faces_dir or None).start()
+    if os.path.isdir(spec):
+        return ImageDirSource(spec, size, fmt, None, fps or DEFAULT_FPS, pace, loop).start()
+    if os.path.isfile(spec):
+        return VideoSource(spec, size, fmt, None, fps, pace, loop).start()
+    raise ValueError(f"FRAME_SOURCE がわかりません: {spec!r}")
+
+
+def measure(source, func, frames=300, warmup=10):
+    """
+    source のフレームを func(image) に渡して、1回あたりの処理時間を測る
+    （フレームを作る時間は含まない。pace="fast" の source で使うと入力が毎回同じになる）
+    """
+    times = []
+    for i in range(frames + warmup):
+        frame = source.read()
+        if frame is None:
+            if source.finished:
+                break
+            continue
+        t0 = time.perf_counter()
+        func(frame.image)
+        if i >= warmup:
+            times.append(time.perf_counter() - t0)
+    if not times:
+        return None
+    times.sort()
+    return {
+        "frames": len(times),
+        "mean_ms": statistics.fmean(times) * 1e3,
+        "p50_ms": times[len(times) // 2] * 1e3,
+        "p95_ms": times[int(len(times) * 0.95)] * 1e3,
+        "fps": len(times) / sum(times),
+    }
+
+
+if __name__ == "__main__":
+    # 入手先がフレームを渡す速さを測る: FRAME_SOURCE=... python3 frame_source.py [枚数]
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    source = open_source()
+    t0 = time.perf_counter()
+    n, shape = 0, None
+    while n < count:
+        frame = source.read()
+        if frame is None:
+            if source.finished:
+                break
+            continue
+        n += 1
+        shape = frame.image.shape
+    dt = time.perf_counter() - t0
+    source.stop()
+    print(f"{n} フレーム / {dt:.2f} 秒 = {n / dt:.1f} fps（飛ばした {source.dropped}）  形: {shape}")
@@ -4,8 +4,12 @@
 import sys
 import time
 import math
-import smbus
-import RPi.GPIO as GPIO
+from collections import namedtuple
+import i2c_bus
+try:
+    import RPi.GPIO as GPIO
+except ImportError:    # not on a Raspberry Pi (e.g. I2C_BACKEND=sim)
+    GPIO = None
 
 ADDR                = (0x29)
 
@@ -65,11 +69,12 @@ PERSIST_REGISTER    = (0x0C)
 ID_REGISTER         = (0x12)
 
 STATUS_REGISTER     = (0x13)#read only
+STATUS_AVALID       = (0x01)#ALS data valid (a conversion has completed)
 
 CHAN0_LOW           = (0x14)
 CHAN0_HIGH          = (0x15)
 CHAN1_LOW           = (0x16)
-CHAN1_HIGH          = (0x14)
+CHAN1_HIGH          = (0x17)
 
 #LUX_DF = GA * 53   GA is the Glass Attenuation factor 
 LUX_DF              = 762.0
@@ -77,14 +82,80 @@ LUX_DF              = 762.0
 MAX_COUNT_100MS     = (36863) # 0x8FFF
 MAX_COUNT           = (65535) # 0xFFFF
 
+GAIN_FACTOR         = {LOW_AGAIN: 1.0, MEDIUM_AGAIN: 25.0, HIGH_AGAIN: 428.0, MAX_AGAIN: 9876.0}
+#Auto range: keep the current gain/ATIME while the larger channel stays within
+#AUTO_LOW..AUTO_HIGH of full scale (unless a shorter ATIME would do); otherwise
+#take the shortest integration time whose predicted fill lands in that same band,
+#with the most sensitive gain that keeps it at or below AUTO_TARGET_HIGH
+AUTO_LOW            = 0.02
+AUTO_HIGH           = 0.80
+AUTO_TARGET_HIGH    = 0.50
+
+def Counts_Per_Lux(gain, atime):
+    return ((100.0 * atime + 100.0) * GAIN_FACTOR[gain]) / LUX_DF
+
+class RawSample(namedtuple('RawSample', 'ch0 ch1 gain atime timestamp')):
+    """
+    One conversion: both channels read in a single block transfer, plus the
+    gain/ATIME it was taken with and its time.monotonic() timestamp.
+    Everything else is derived from these five fields.
+    """
+    __slots__ = ()
+
+    @property
+    def full(self):         # CH0: visible + IR
+        return self.ch0
+
+    @property
+    def ir(self):           # CH1: IR only
+        return self.ch1
+
+    @property
+    def visible(self):
+        return max(self.ch0 - self.ch1, 0)
+
+    @property
+    def cpl(self):
+        return Counts_Per_Lux(self.gain, self.atime)
+
+    @property
+    def lux1(self):         # fluorescent and incandescent light
+        return (self.ch0 - (2 * self.ch1)) / self.cpl
+
+    @property
+    def lux2(self):         # dimmed incandescent light
+        return ((0.6 * self.ch0) - (self.ch1)) / self.cpl
+
+    @property
+    def lux(self):
+        return max(int(self.lux1), int(0))
+
+    @property
+    def saturated(self):
+        max_counts = MAX_COUNT_100MS if self.atime == ATIME_100MS else MAX_COUNT
+        return self.ch0 >= max_counts or self.ch1 >= max_counts
+
+    @property
+    def range_name(self):
+        return "%gx %dms" % (GAIN_FACTOR[self.gain], 100 * self.atime + 100)
+
 class TSL2591:
-    def __init__(self, address=ADDR):
-        self.i2c = smbus.SMBus(1)
+    def __init__(self, address=ADDR, bus=None):
+        self.i2c = i2c_bus.as_shared(bus)    # shared with other drivers on bus 1
         self.address = address
+        self.Continuous = False
+        self.Latest = None                   # (lux, timestamp) in continuous mode
+        self.Last_Sample = None              # RawSample of the latest valid conversion
+        self.Auto_Range = False              # True: pick gain/ATIME from the counts (see Choose_Range)
+        self.Max_IntegralTime = ATIME_600MS  # longest ATIME Auto_Range may pick (sets the minimum rate)
+        self.Settle_Until = 0.0              # continuous mode: data before this used an old range
+        self.Threshold_Regs = [None] * 8     # last values written to AILTL..NPAIHTH (None: unknown)
+        self.Lux_Thresholds = None           # (low, high) lux of the last TSL2591_SET_LuxInterrupt
         
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setwarnings(False)
-        GPIO.setup(4, GPIO.IN)
+        if GPIO is not None:
+            GPIO.setmode(GPIO.BCM)
+            GPIO.setwarnings(False)
+            GPIO.setup(4, GPIO.IN)
         
         self.ID = self.Read_Byte(ID_REGISTER)
         if(self.ID != 0x50):
@@ -130,10 +201,11 @@ class TSL2591:
         if(Val == LOW_AGAIN or Val == MEDIUM_AGAIN \
             or Val == HIGH_AGAIN or Val == MAX_AGAIN
         ):
-            control = self.Read_Byte(CONTROL_REGISTER)
-            control &= 0b11001111
-            control |= Val
-            self.Write_Byte(CONTROL_REGISTER, control)
+            with self.i2c.lock:    # read-modify-write without interleaving
+                control = self.Read_Byte(CONTROL_REGISTER)
+                control &= 0b11001111
+                control |= Val
+                self.Write_Byte(CONTROL_REGISTER, control)
             self.Gain = Val
         else :
             print("Gain Parameter Error")
@@ -150,10 +222,11 @@ class TSL2591:
 
     def Set_IntegralTime(self, val):
         if(val & 0x07 < 0x06):
-            control = self.Read_Byte(CONTROL_REGISTER)
-            control &= 0b11111000
-            control |= val
-            self.Write_Byte(CONTROL_REGISTER, control)
+            with self.i2c.lock:
+                control = self.Read_Byte(CONTROL_REGISTER)
+                control &= 0b11111000
+                control |= val
+                self.Write_Byte(CONTROL_REGISTER, control)
             self.IntegralTime = val
         else:
             print("Integral Time Parameter Error")
@@ -163,137 +236,262 @@ class TSL2591:
     
     def Read_CHAN1(self):
         return self.Read_Word(CHAN1_LOW) 
-    
-    @property
-    def Read_FullSpectrum(self):
-        """Read the full spectrum (IR + visible) light and return its value"""
+
+    def Read_Raw(self):
+        """Reads CH0_LOW..CH1_HIGH in one 4-byte transfer (both from the same conversion)"""
+        stamp = time.monotonic()
+        d = self.i2c.read_i2c_block_data(self.address, COMMAND_BIT | CHAN0_LOW, 4)
+        return RawSample(d[0] | (d[1] << 8), d[2] | (d[3] << 8),
+                         self.Gain, self.IntegralTime, stamp)
+
+    def Read_Sample(self):
+        """Powers up, waits one integration, returns a RawSample and powers down"""
         self.Enable()
         for i in range(0, self.IntegralTime+2):
             time.sleep(0.1)
-        data = (self.Read_CHAN1()  << 16) | self.Read_CHAN0()
+        sample = self.Read_Raw()
         self.Disable()
-        return data
+        return sample
+    
+    @property
+    def Read_FullSpectrum(self):
+        """
+        Read the full spectrum (IR + visible) light and return its value,
+        packed as (CH1 << 16) | CH0 (RawSample.full is CH0 alone)
+        """
+        sample = self.Read_Sample()
+        return (sample.ch1 << 16) | sample.ch0
     @property   
     def Read_Infrared(self):
-        '''Read the infrared light and return its value as a 16-bit unsigned number'''
-        self.Enable()
-        for i in range(0, self.IntegralTime+2):
-            time.sleep(0.1)
-        data = self.Read_CHAN0()
-        self.Disable()
-        return data
+        '''
+        Read the infrared light and return its value as a 16-bit unsigned number
+        (RawSample.ir: CH1, the IR-only photodiode).
+        Changed: this used to return CH0 (visible + IR).
+        '''
+        return self.Read_Sample().ir
     
     @property
     def Read_Visible(self):#Visible light
-        self.Enable()
-        for i in range(0, self.IntegralTime+2):
-            time.sleep(0.1)
-        Ch1 = self.Read_CHAN1()
-        Ch0 = self.Read_CHAN0()
-        self.Disable()
-        full = (Ch1 << 16) | Ch0
-        return full - Ch1
+        '''
+        Read the visible light and return its value (RawSample.visible: CH0 - CH1,
+        clipped at 0).
+        Changed: this used to return ((CH1 << 16) | CH0) - CH1.
+        '''
+        return self.Read_Sample().visible
     
     @property
     def Lux(self):
-        self.Enable()
-        for i in range(0, self.IntegralTime+2):
-            time.sleep(0.1)
-        # if(GPIO.input(4) == GPIO.HIGH):
-            # print 'INT 0'
-        # else:
-            # print 'INT 1'
-        channel_0 = self.Read_CHAN0()
-        channel_1 = self.Read_CHAN1()
-        self.Disable()
+        if self.Continuous:
+            lux, stamp = self.Read_Latest()
+            while lux is None:                # first conversion not finished yet
+                time.sleep(0.01)
+                lux, stamp = self.Read_Latest()
+            return lux
+        # Saturated readings are re-taken once per range step with the predicted
+        # range; otherwise the new range only applies to the next call
+        for attempt in range(len(GAIN_FACTOR) * 6):
+            self.Enable()
+            for i in range(0, self.IntegralTime+2):
+                time.sleep(0.1)
+            # if(GPIO.input(4) == GPIO.HIGH):
+                # print 'INT 0'
+            # else:
+                # print 'INT 1'
+            sample = self.Read_Raw()
+            self.Clear_Interrupt()
+            self.Disable()
 
-        self.Enable()
-        self.Write_Byte(0xE7, 0x13)
-        self.Disable()
+            if not self.Update_Range(sample):
+                self.Last_Sample = sample
+                return sample.lux
+        raise RuntimeError('Numerical overflow!')
+
+    def Max_Count(self, IntegralTime=None):
+        if IntegralTime is None:
+            IntegralTime = self.IntegralTime
+        return MAX_COUNT_100MS if IntegralTime == ATIME_100MS else MAX_COUNT
+
+    def Set_Range(self, Gain, IntegralTime):
+        """Sets gain and integration time with a single CONTROL write"""
+        with self.i2c.lock:
+            control = self.Read_Byte(CONTROL_REGISTER)
+            control &= 0b11001000
+            control |= Gain | IntegralTime
+            self.Write_Byte(CONTROL_REGISTER, control)
+        self.Gain = Gain
+        self.IntegralTime = IntegralTime
+        if self.Continuous:
+            # the conversion in flight finishes with the old range; the first one
+            # taken entirely with the new range ends one new period after that
+            old_period = self.Period
+            self.Period = 0.1 * (IntegralTime + 1)
+            self.Settle_Until = time.monotonic() + old_period + self.Period
+            self.Next_Due = self.Settle_Until
+
+    def Choose_Range(self, channel_0, channel_1, Gain=None, IntegralTime=None):
+        """
+        Returns the (gain, atime) to use after a conversion that gave these counts.
+        Counts scale with gain * integration time, so the counts of every other
+        range are predicted from this one sample instead of trying them in turn.
+        """
+        if Gain is None:
+            Gain, IntegralTime = self.Gain, self.IntegralTime
+        full = self.Max_Count(IntegralTime)
+        peak = max(channel_0, channel_1)
+        if peak >= full:
+            # saturated counts only give a lower bound: measure once in the least
+            # sensitive range, the next sample then predicts the right one
+            return (LOW_AGAIN, ATIME_100MS)
+        in_band = (AUTO_LOW * full <= peak <= AUTO_HIGH * full
+                   and IntegralTime <= self.Max_IntegralTime)
+        rate = max(peak, 1) / self.Get_Cpl(Gain, IntegralTime)
+        best, best_fill = (LOW_AGAIN, ATIME_100MS), 0.0
+        for atime in range(ATIME_100MS, self.Max_IntegralTime + 1):
+            if in_band and atime >= IntegralTime:
+                return (Gain, IntegralTime)              # hysteresis: stay put
+            full = self.Max_Count(atime)
+            for gain in (MAX_AGAIN, HIGH_AGAIN, MEDIUM_AGAIN, LOW_AGAIN):
+                fill = rate * self.Get_Cpl(gain, atime) / full
+                if AUTO_LOW <= fill <= AUTO_TARGET_HIGH:
+                    return (gain, atime)                 # shortest ATIME that fits
+                if best_fill < fill <= AUTO_TARGET_HIGH:
+                    best, best_fill = (gain, atime), fill
+        return best    # too dark: most sensitive range; too bright: least sensitive
 
-        atime = 100.0 * self.IntegralTime + 100.0
-       
-        # Set the maximum sensor counts based on the integration time (atime) setting
-        if self.IntegralTime == ATIME_100MS:
-            max_counts = MAX_COUNT_100MS
+    def Update_Range(self, sample):
+        """
+        Applies the next range after a conversion (RawSample).
+        Returns True when the counts were saturated and must be discarded;
+        raises RuntimeError if they are saturated in the least sensitive range.
+        """
+        gain, atime, saturated = sample.gain, sample.atime, sample.saturated
+        if self.Auto_Range:
+            new = self.Choose_Range(sample.ch0, sample.ch1, gain, atime)
+        elif saturated and gain != LOW_AGAIN:
+            new = (((gain>>4)-1)<<4, atime)
         else:
-            max_counts = MAX_COUNT
-
-        if channel_0 >= max_counts or channel_1 >= max_counts:
-            gain_t = self.Get_Gain()
-            if(gain_t != LOW_AGAIN):
-                gain_t = ((gain_t>>4)-1)<<4
-                self.Set_Gain(gain_t)
-                channel_0 = 0
-                channel_1 = 0
-                while(channel_0 <= 0 and channel_1 <=0):
-                    channel_0 = self.Read_CHAN0()
-                    channel_1 = self.Read_CHAN1()
-                    time.sleep(0.1)
-            else :
-                raise RuntimeError('Numerical overflow!')
-        again = 1.0
-        if self.Gain == MEDIUM_AGAIN:
-            again = 25.0
-        elif self.Gain == HIGH_AGAIN:
-            again = 428.0
-        elif self.Gain == MAX_AGAIN:
-            again = 9876.0
-        
-        Cpl = (atime * again) / LUX_DF
-        lux1 = (channel_0 - (2 * channel_1)) / Cpl
-        # lux2 = ((0.6 * channel_0) - (channel_1)) / Cpl
+            new = (gain, atime)
+        if new != (self.Gain, self.IntegralTime):
+            self.Set_Range(*new)
+        if saturated and new == (gain, atime):
+            raise RuntimeError('Numerical overflow!')
+        return saturated
+
+    def Range_Name(self):
+        """e.g. '25x 100ms': the range of Last_Sample (or the current one)"""
+        if self.Last_Sample is not None:
+            return self.Last_Sample.range_name
+        return RawSample(0, 0, self.Gain, self.IntegralTime, 0.0).range_name
+
+    def Get_Cpl(self, Gain=None, IntegralTime=None):
+        """Counts per lux at the given (default: current) gain and integration time"""
+        if Gain is None:
+            Gain = self.Gain
+        if IntegralTime is None:
+            IntegralTime = self.IntegralTime
+        return Counts_Per_Lux(Gain, IntegralTime)
+
+    def Calc_Lux(self, channel_0, channel_1, Gain=None, IntegralTime=None):
+        """Lux from raw channel counts taken with the given (default: current) range"""
         # This is a two segment lux equation where the first 
         # segment (Lux1) covers fluorescent and incandescent light 
         # and the second segment (Lux2) covers dimmed incandescent light
-        
-        return max(int(lux1), int(0))
-    
-    def SET_InterruptThreshold(self, HIGH, LOW):
+        # (see RawSample.lux1 / lux2); Lux reports lux1
+        if Gain is None:
+            Gain = self.Gain
+        if IntegralTime is None:
+            IntegralTime = self.IntegralTime
+        return RawSample(channel_0, channel_1, Gain, IntegralTime, 0.0).lux
+
+    def Start_Continuous(self):
+        """Keeps the ALS powered so that Read_Latest() never waits for an integration"""
         self.Enable()
-        self.Write_Byte(AILTL_REGISTER, LOW & 0xFF)
-        self.Write_Byte(AILTH_REGISTER, LOW >> 8)
-        
-        self.Write_Byte(AIHTL_REGISTER, HIGH & 0xFF)
-        self.Write_Byte(AIHTH_REGISTER, HIGH >> 8)
-        
-        self.Write_Byte(NPAILTL_REGISTER, 0 )
-        self.Write_Byte(NPAILTH_REGISTER, 0 )
-        
-        self.Write_Byte(NPAIHTL_REGISTER, 0xff )
-        self.Write_Byte(NPAIHTH_REGISTER, 0xff )
+        self.Continuous = True
+        self.Latest = None
+        self.Period = 0.1 * (self.IntegralTime + 1)
+        self.Next_Due = time.monotonic() + self.Period
+        self.Settle_Until = 0.0
+
+    def Stop_Continuous(self):
+        self.Continuous = False
         self.Disable()
+
+    def Read_Latest(self, force=False):
+        """
+        Returns (lux, timestamp) of the newest completed conversion without waiting.
+        The bus is only touched once per integration period (or when force is set,
+        e.g. right after an interrupt); in between the cached value is returned.
+        lux is None until the first conversion has finished. With Auto_Range the
+        gain/ATIME may change after any conversion; Last_Sample holds the raw
+        counts and the range the returned value was measured with.
+        """
+        now = time.monotonic()
+        if now < self.Settle_Until or (now < self.Next_Due and not force):
+            return self.Latest if self.Latest is not None else (None, None)
+        if not self.Read_Byte(STATUS_REGISTER) & STATUS_AVALID:
+            return self.Latest if self.Latest is not None else (None, None)
+        stamp = min(self.Next_Due, now)
+        while self.Next_Due <= now:
+            stamp = self.Next_Due
+            self.Next_Due += self.Period
+        sample = self.Read_Raw()._replace(timestamp=stamp)
+
+        if self.Update_Range(sample):
+            return self.Latest if self.Latest is not None else (None, None)
+        self.Last_Sample = sample
+        self.Latest = (sample.lux, stamp)
+        return self.Latest
+    
+    def Clear_Interrupt(self):
+        """Clears the ALS and no-persist interrupts (releases the INT pin)"""
+        self.Write_Byte(0xE7, 0x13)
+
+    def Lux_To_Count(self, lux, channel_1):
+        """CH0 count at which Calc_Lux() reaches lux, for the given CH1 count"""
+        return max(0, min(0xFFFF, int(self.Get_Cpl() * lux) + 2 * channel_1))
+
+    def Write_Thresholds(self, Regs):
+        """
+        Programs AILTL..NPAIHTH (8 bytes), skipping bytes that already hold the
+        value. The differing span goes out as one auto-increment block write.
+        Returns True if anything was written.
+        """
+        cache = self.Threshold_Regs
+        diff = [i for i in range(8) if cache[i] != Regs[i]]
+        if not diff:
+            return False
+        first, last = diff[0], diff[-1]
+        if not self.Continuous:
+            self.Enable()
+        self.i2c.write_i2c_block_data(self.address, COMMAND_BIT | (AILTL_REGISTER + first),
+                                      Regs[first:last+1])
+        if not self.Continuous:
+            self.Disable()
+        cache[first:last+1] = Regs[first:last+1]
+        return True
+
+    def Get_InterruptThreshold(self):
+        """(HIGH, LOW) ALS counts currently programmed, or None if not known"""
+        r = self.Threshold_Regs
+        if None in r[0:4]:
+            return None
+        return (r[2] | (r[3] << 8), r[0] | (r[1] << 8))
+
+    def SET_InterruptThreshold(self, HIGH, LOW):
+        HIGH = max(0, min(0xFFFF, HIGH))
+        LOW = max(0, min(0xFFFF, LOW))
+        return self.Write_Thresholds([LOW & 0xFF, LOW >> 8, HIGH & 0xFF, HIGH >> 8,
+                                      0, 0,            # no-persist low
+                                      0xff, 0xff])     # no-persist high
         
     def TSL2591_SET_LuxInterrupt(self, SET_LOW, SET_HIGH):
-        atime  = 100 * self.IntegralTime + 100
-        again = 1.0;
-        if(self.Gain == MEDIUM_AGAIN):
-            again = 25.0;
-        elif(self.Gain == HIGH_AGAIN):
-            again = 428.0
-        elif(self.Gain == MAX_AGAIN):
-            again = 9876.0;
-        Cpl = (atime * again) / LUX_DF
-        channel_1 = self.Read_CHAN1()
+        Cpl = self.Get_Cpl()
+        sample = self.Last_Sample
+        if sample is None:
+            sample = self.Read_Raw()
+        channel_1 = int(sample.ch1 * Cpl / sample.cpl)    # IR count in the current range
         
+        self.Lux_Thresholds = (SET_LOW, SET_HIGH)
         SET_HIGH =  (int)(Cpl * SET_HIGH)+ 2*channel_1-1
         SET_LOW = (int)(Cpl * SET_LOW)+ 2*channel_1+1
-            
-        self.Enable()
-        self.Write_Byte(AILTL_REGISTER, SET_LOW & 0xFF)
-        self.Write_Byte(AILTH_REGISTER, SET_LOW >> 8)
-        
-        self.Write_Byte(AIHTL_REGISTER, SET_HIGH & 0xFF)
-        self.Write_Byte(AIHTH_REGISTER, SET_HIGH >> 8)
-        
-        self.Write_Byte(NPAILTL_REGISTER, 0 )
-        self.Write_Byte(NPAILTH_REGISTER, 0 )
-        
-        self.Write_Byte(NPAIHTL_REGISTER, 0xff )
-        self.Write_Byte(NPAIHTH_REGISTER, 0xff )
-        self.Disable()
-        
-        
-        
-        
-        
\ No newline at end of file
+        return self.SET_InterruptThreshold(SET_HIGH, SET_LOW)
@@ -0,0 +1,161 @@
+"""
+I2C 転送のトレーサ（どのレジスタへのアクセスに時間がかかっているかを調べる）
+
+ポイント
+- TracingBus は SMBus（またはシミュレータ）を包み、1回の転送ごとに
+  デバイス・レジスタ・種類・バイト数・開始時刻・所要時間を記録する
+- 記録は起動時に確保したリングバッファに入る（実行中にメモリを確保しない）
+  → 新しい記録が古い記録を上書きする
+- 集計（回数・合計時間・所要時間のヒストグラム）はデバイス×レジスタごとに常に更新
+- CSV / JSON に書き出せる
+
+使い方
+    $ I2C_TRACE=1 python3 lightsensor_cli.py               # 終了時に集計を表示
+    $ I2C_TRACE=trace.csv python3 lightsensor_cli.py       # 終了時に CSV へ書き出し
+    $ I2C_TRACE=trace.json python3 lightsensor_cli.py      # JSON へ書き出し
+
+    プログラムの中から: i2c_bus.get_trace().summary()
+"""
+
+import json
+import time
+from array import array
+
+# 操作の種類
+OPS = ("read_byte", "write_byte", "read_word", "write_word", "read_block", "write_block")
+READ_BYTE, WRITE_BYTE, READ_WORD, WRITE_WORD, READ_BLOCK, WRITE_BLOCK = range(len(OPS))
+
+# 所要時間ヒストグラムの区切り（マイクロ秒）。最後のビンはそれ以上すべて
+HIST_EDGES_US = (50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class TracingBus:
+    def __init__(self, backend, capacity=8192, clock=time.perf_counter):
+        self.backend = backend
+        self.capacity = capacity
+        self.clock = clock
+        # リングバッファ（列ごとの配列をあらかじめ確保）
+        self.addr = array("B", bytes(capacity))
+        self.reg = array("B", bytes(capacity))
+        self.op = array("B", bytes(capacity))
+        self.nbytes = array("H", [0]) * capacity
+        self.start = array("d", [0.0]) * capacity
+        self.duration = array("d", [0.0]) * capacity
+        self.count = 0                     # これまでの総転送数（リングの書き込み位置にも使う）
+        self.t0 = clock()
+        # (addr, reg, op) -> [回数, 合計秒, 最大秒, ヒストグラム...]
+        self.stats = {}
+
+    # ---- 記録 ----
+    def _record(self, addr, reg, op, nbytes, start, end):
+        i = self.count % self.capacity
+        dur = end - start
+        self.addr[i] = addr & 0xFF
+        self.reg[i] = reg & 0xFF
+        self.op[i] = op
+        self.nbytes[i] = nbytes
+        self.start[i] = start - self.t0
+        self.duration[i] = dur
+        self.count += 1
+
+        key = (addr, reg, op)
+        st = self.stats.get(key)
+        if st is None:
+            st = self.stats[key] = [0, 0.0, 0.0] + [0] * (len(HIST_EDGES_US) + 1)
+        st[0] += 1
+        st[1] += dur
+        if dur > st[2]:
+            st[2] = dur
+        us = dur * 1e6
+        b = 0
+        while b < len(HIST_EDGES_US) and us >= HIST_EDGES_US[b]:
+            b += 1
+        st[3 + b] += 1
+
+    def _call(self, op, addr, reg, nbytes, func, *args):
+        start = self.clock()
+        try:
+            return func(addr, reg, *args)
+        finally:
+            self._record(addr, reg, op, nbytes, start, self.clock())
+
+    # ---- smbus.SMBus 互換 ----
+    def read_byte_data(self, addr, reg):
+        return self._call(READ_BYTE, addr, reg, 1, self.backend.read_byte_data)
+
+    def write_byte_data(self, addr, reg, value):
+        self._call(WRITE_BYTE, addr, reg, 1, self.backend.write_byte_data, value)
+
+    def read_word_data(self, addr, reg):
+        return self._call(READ_WORD, addr, reg, 2, self.backend.read_word_data)
+
+    def write_word_data(self, addr, reg, value):
+        self._call(WRITE_WORD, addr, reg, 2, self.backend.write_word_data, value)
+
+    def read_i2c_block_data(self, addr, reg, length):
+        return self._call(READ_BLOCK, addr, reg, length, self.backend.read_i2c_block_data, length)
+
+    def write_i2c_block_data(self, addr, reg, values):
+        values = list(values)
+        self._call(WRITE_BLOCK, addr, reg, len(values), self.backend.write_i2c_block_data, values)
+
+    def close(self):
+        self.backend.close()
+
+    # ---- 取り出し・集計 ----
+    def records(self):
+        """リングに残っている記録を古い順に (addr, reg, op名, nbytes, 開始秒, 所要秒) で返す"""
+        n = min(self.count, self.capacity)
+        first = self.count - n
+        for k in range(first, self.count):
+            i = k % self.capacity
+            yield (self.addr[i], self.reg[i], OPS[self.op[i]], self.nbytes[i],
+                   self.start[i], self.duration[i])
+
+    def summary_rows(self):
+        """合計時間の多い順に並べた集計"""
+        rows = []
+        for (addr, reg, op), st in self.stats.items():
+            rows.append({
+                "addr": addr, "reg": reg, "op": OPS[op], "count": st[0],
+                "total_ms": st[1] * 1e3, "avg_us": st[1] / st[0] * 1e6, "max_us": st[2] * 1e6,
+                "hist": dict(zip([f"<{e}us" for e in HIST_EDGES_US] + [f">={HIST_EDGES_US[-1]}us"],
+                                 st[3:])),
+            })
+        rows.sort(key=lambda r: r["total_ms"], reverse=True)
+        return rows
+
+    def summary(self):
+        lines = [f"I2C trace: {self.count} transactions"]
+        lines.append("  addr  reg   op            count   total[ms]   avg[us]   max[us]")
+        for r in self.summary_rows():
+            lines.append("  0x%02X  0x%02X  %-12s %6d  %10.2f  %8.1f  %8.1f"
+                         % (r["addr"], r["reg"], r["op"], r["count"],
+                            r["total_ms"], r["avg_us"], r["max_us"]))
+        return "\n".join(lines)
+
+    def dump_csv(self, path):
+        with open(path, "w") as f:
+            f.write("addr,reg,op,nbytes,start_s,duration_us\n")
+            for addr, reg, op, nbytes, start, dur in self.records():
+                f.write("0x%02X,0x%02X,%s,%d,%.6f,%.1f\n" % (addr, reg, op, nbytes, start, dur * 1e6))
+
+    def dump_json(self, path):
+        with open(path, "w") as f:
+            json.dump({
+                "transactions": self.count,
+                "summary": self.summary_rows(),
+                "records": [
+                    {"addr": a, "reg": r, "op": op, "nbytes": n, "start_s": s, "duration_us": d * 1e6}
+                    for a, r, op, n, s, d in self.records()
+                ],
+            }, f, indent=1)
+
+    def dump(self, dest):
+        """I2C_TRACE の値に合わせて出力する（*.csv / *.json / それ以外は集計を表示）"""
+        if dest.endswith(".csv"):
+            self.dump_csv(dest)
+        elif dest.endswith(".json"):
+            self.dump_json(dest)
+        else:
+            print(self.summary())
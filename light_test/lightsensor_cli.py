@@ -11,43 +11,76 @@ TSL2591 照度センサ テストプログラム（初心者向けコメント
 - Python用のライブラリ "TSL2591" がインストール済みであること。
 """
 
-import time
 import TSL2591  # センサドライバモジュールの読み込み
+from lux_stream import LuxStream, median  # センサを裏で読み続けて、値を順に受け取る
+from lux_store import LuxStore  # 全サンプルをファイルに記録（python3 lux_store.py で振り返り）
+
+PRINT_INTERVAL_SEC = 1.0  # 表示の間隔（秒）。記録は変換ごとに行う
 
 # ===== センサ初期化 =====
 sensor = TSL2591.TSL2591()  # TSL2591クラスのインスタンスを作成
+sensor.Auto_Range = True    # 明るさに合わせてゲイン・積分時間を自動で切り替える（表示のレンジ）
 
 # 必要に応じて割り込み閾値を設定（下限値, 上限値）
 # センサがこの範囲を超えるとハードウェア割り込み信号が出る
 # ここではデフォルトのままコメントアウトしています
 # sensor.SET_InterruptThreshold(0xff00, 0x0010)
 
+# ---- 記録ファイルを開く ----
+# ほかのプログラム（lightsensor_gui.py など）が記録中なら、こちらは記録しない
+store = LuxStore()
+if store.readonly:
+    print("ほかのプログラムが記録中のため、このプログラムでは記録しません。")
+
+# ---- 読み取りを開始 ----
+# 読み取りは別スレッドで行い、ここでは変換が終わるたびに結果を受け取る
+# （sleep で待つ代わりに、新しい値が届くまで for が待つ）
+stream = LuxStream(sensor).start()
+smooth = median(3)  # 直近3回の中央値で、たまに混ざる飛び値を消す（表示用）
+next_print = 0.0
+
 print("TSL2591 照度センサのテストを開始します。Ctrl+C で終了できます。")
 
 try:
-    while True:
+    # policy="drop_oldest": 記録のため、届いた値はすべて順に受け取る
+    for sample in stream.subscribe(policy="drop_oldest"):
+        # ---- 記録（ファイルへの書き出しは数秒ごとにまとめて行われる）----
+        if not store.readonly:
+            store.append(sample)
+
         # ---- Lux値（照度）を取得 ----
-        lux = sensor.Lux  # 現在の照度を Lux 単位で取得
+        lux = smooth(sample).lux  # 現在の照度（Lux 単位）
+
+        # ---- 表示は PRINT_INTERVAL_SEC ごと ----
+        if sample.timestamp < next_print:
+            continue
+        next_print = sample.timestamp + PRINT_INTERVAL_SEC
 
         # ---- 結果を表示 ----
-        print(f"現在の照度: {lux} lux")
+        # ゲインと積分時間は明るさに合わせて自動で選ばれる（暗いほど高感度・長め）
+        print(f"現在の照度: {lux} lux  (レンジ: {sample.raw.range_name})")
 
         # ---- 割り込み閾値を設定（任意）----
         # 例えば、暗すぎる（50以下）または明るすぎる（200以上）で反応
+        # 前回書いた値を覚えているので、毎回呼んでも変わったレジスタだけを書き込む
+        # （いまの設定は sensor.Get_InterruptThreshold() / sensor.Lux_Thresholds で確認できる）
         sensor.TSL2591_SET_LuxInterrupt(50, 200)
 
         # ---- 詳細データを個別に読みたい場合 ----
         # 以下のコメントを外すと、各チャンネルの値を取得できます。
-        # infrared = sensor.Read_Infrared
+        # （照度と同じ1回の変換の生データ sample.raw から計算するので、追加の読み取りは不要）
+        # infrared = sample.raw.ir
         # print(f"赤外線成分: {infrared}")
-        # visible = sensor.Read_Visible
+        # visible = sample.raw.visible
         # print(f"可視光成分: {visible}")
-        # full_spectrum = sensor.Read_FullSpectrum
+        # full_spectrum = sample.raw.full
         # print(f"全光成分(IR+可視光): {full_spectrum}")
 
         # ---- 取得間隔 ----
-        time.sleep(1.0)  # 1秒ごとに更新（必要に応じて調整）
+        # 表示は上の PRINT_INTERVAL_SEC ごと（必要に応じて調整）
 
 except KeyboardInterrupt:
     # Ctrl+Cで安全に終了
     print("\n停止しました。プログラムを終了します。")
+    stream.stop()
+    store.close()
@@ -5,6 +5,7 @@ TSL2591 照度センサ + OpenCV 可視化（初心者向けコメント付き
 - 現在のLux値を大きな文字とバーグラフで表示
 - 直近の履歴（スパークライン）を折れ線で描画
 - 表示レンジは固定MAXまたは自動レンジ（AUTO_RANGE）が選べる
+- 取得した値は lux_store でファイルに記録し、D キーで直近24時間の推移に切り替えられる
 
 依存:
 - pip install TSL2591 opencv-python
@@ -12,15 +13,18 @@ TSL2591 照度センサ + OpenCV 可視化（初心者向けコメント付き
 """
 
 import time
-from collections import deque
-import numpy as np
 import cv2
 import TSL2591
+from lux_render import LuxRenderer   # 描画（背景のキャッシュ・折れ線の一括描画）
+from lux_stream import LuxStream     # センサを別スレッドで読み続ける
+from lux_daemon import LuxClient, daemon_running
+from lux_store import LuxStore       # 長期間の記録（最小・最大・平均のピラミッド付き）
 
 # ===================== 設定（ここを調整） =====================
 WINDOW_NAME         = "Lux Monitor"
-SAMPLE_INTERVAL_SEC = 0.1        # 取得間隔（秒）
-HISTORY_LEN         = 300        # スパークラインに保持する点数（描画幅に応じて）
+SAMPLE_INTERVAL_SEC = 0.1        # 取得間隔（秒）。実際は積分時間（100〜600ms）ごとより速くはならない
+UI_FPS              = 30         # 画面の更新回数（1秒あたり）。センサの速さとは無関係
+HISTORY_LEN         = 300        # スパークラインに保持する点数（数千点にしても描画は軽い）
 EMA_ALPHA           = 0.2        # 指数移動平均（0〜1、小さいほどなめらか）
 AUTO_RANGE          = True       # Trueで自動レンジ、Falseで固定レンジ
 MAX_LUX_DISPLAY     = 1000.0     # 固定レンジ時の最大Lux（AUTO_RANGE=Falseのとき使用）
@@ -28,95 +32,52 @@ AUTO_DECAY          = 0.995      # 自動レンジの上限を徐々に下げる
 MARGIN              = 20         # 余白（ピクセル）
 IMG_W, IMG_H        = 800, 300   # ウィンドウのサイズ
 BAR_H               = 60         # バーの高さ（ピクセル）
-FONT                = cv2.FONT_HERSHEY_SIMPLEX
+DAY_VIEW_SEC        = 24 * 3600  # D キーで表示する長期推移の長さ（秒）
 # ============================================================
 
 # センサ初期化
-sensor = TSL2591.TSL2591()
-
-# 履歴とスムージング用
-history = deque(maxlen=HISTORY_LEN)
+# lux_daemon.py が動いていれば、センサには触らずにその配信を受け取る
+# （他のプログラムと同時に動かしてもセンサの設定を取り合わない）
+if daemon_running():
+    client = LuxClient(min_rate_hz=1.0 / SAMPLE_INTERVAL_SEC)
+    stream = None
+else:
+    # センサの読み取りは別スレッド（LuxStream）で行い、画面側は最新値を見るだけ
+    # → 積分時間のあいだ画面が固まらず、ESC キーにもすぐ反応する
+    client = None
+    sensor = TSL2591.TSL2591()
+    sensor.Auto_Range = True     # 明るさに合わせてゲイン・積分時間を自動で切り替える
+    stream = LuxStream(sensor, rate_hz=1.0 / SAMPLE_INTERVAL_SEC)
+
+# 描画エンジン（履歴もここで保持）とスムージング用
+renderer = LuxRenderer(IMG_W, IMG_H, history_len=HISTORY_LEN, bar_h=BAR_H,
+                       margin=MARGIN, auto_range=AUTO_RANGE)
 lux_smooth = None
 auto_max = 50.0  # 自動レンジの初期上限（暗い部屋想定で控えめに開始）
 
-def lerp_color(a, b, t):
-    """2色（BGR）をtで線形補間（0〜1）"""
-    return tuple(int(a[i] + (b[i] - a[i]) * t) for i in range(3))
-
-def draw_ui(img, lux, lux_disp_max, hist):
-    """OpenCVでUIを描画"""
-    # 背景
-    img[:] = (245, 245, 245)
-
-    # タイトル
-    cv2.putText(img, "TSL2591 Lux Monitor", (MARGIN, 40),
-                FONT, 0.9, (0, 0, 0), 2, cv2.LINE_AA)
-
-    # 現在のLux表示（大きく）
-    cv2.putText(img, f"Lux: {lux:.1f}", (MARGIN, 100),
-                FONT, 1.2, (20, 20, 20), 3, cv2.LINE_AA)
-
-    # レンジ表示
-    range_text = f"Range: 0 - {lux_disp_max:.0f}  {'(AUTO)' if AUTO_RANGE else '(FIXED)'}"
-    cv2.putText(img, range_text, (MARGIN, 135),
-                FONT, 0.7, (60, 60, 60), 2, cv2.LINE_AA)
-
-    # バーの枠
-    bar_x1 = MARGIN
-    bar_x2 = IMG_W - MARGIN
-    bar_y1 = 160
-    bar_y2 = bar_y1 + BAR_H
-    cv2.rectangle(img, (bar_x1, bar_y1), (bar_x2, bar_y2), (180, 180, 180), 2)
-
-    # バーの長さ（0〜1 に正規化）
-    t = max(0.0, min(1.0, lux / max(lux_disp_max, 1e-6)))
-    bar_w = int((bar_x2 - bar_x1 - 2) * t)
-
-    # バーの色（暗→明で 青→緑→黄→赤 に近づく感じ）
-    # 青(255,100,0) → 緑(0,200,0) → 黄(0,255,255) → 赤(0,0,255)
-    if t < 0.33:
-        c = lerp_color((255, 100, 0), (0, 200, 0), t / 0.33)
-    elif t < 0.66:
-        c = lerp_color((0, 200, 0), (0, 255, 255), (t - 0.33) / 0.33)
-    else:
-        c = lerp_color((0, 255, 255), (0, 0, 255), (t - 0.66) / 0.34)
-
-    # バー本体
-    cv2.rectangle(img, (bar_x1 + 1, bar_y1 + 1), (bar_x1 + 1 + bar_w, bar_y2 - 1), c, -1)
-
-    # 目盛（25%, 50%, 75%, 100%）
-    for frac in (0.25, 0.5, 0.75, 1.0):
-        x = int(bar_x1 + (bar_x2 - bar_x1) * frac)
-        cv2.line(img, (x, bar_y1), (x, bar_y2), (200, 200, 200), 1)
-        cv2.putText(img, f"{int(lux_disp_max * frac)}", (x - 20, bar_y2 + 20),
-                    FONT, 0.5, (100, 100, 100), 1, cv2.LINE_AA)
-
-    # スパークライン（履歴）
-    spark_x1 = MARGIN
-    spark_x2 = IMG_W - MARGIN
-    spark_y1 = bar_y2 + 40
-    spark_y2 = IMG_H - MARGIN
-    cv2.rectangle(img, (spark_x1, spark_y1), (spark_x2, spark_y2), (210, 210, 210), 2)
-
-    if len(hist) >= 2:
-        # ヒストリを0〜1に正規化して下から上へ描く
-        vals = np.array(hist, dtype=np.float32)
-        vmax = max(lux_disp_max, float(vals.max()), 1.0)
-        vmin = 0.0
-        norm = (vals - vmin) / (vmax - vmin + 1e-9)
-        # 横方向は等間隔に敷き詰め
-        w = spark_x2 - spark_x1 - 2
-        h = spark_y2 - spark_y1 - 2
-        xs = np.linspace(spark_x1 + 1, spark_x2 - 1, len(vals)).astype(int)
-        ys = (spark_y2 - 1 - (norm * h)).astype(int)
-
-        # 折れ線描画
-        for i in range(1, len(xs)):
-            cv2.line(img, (xs[i-1], ys[i-1]), (xs[i], ys[i]), (80, 80, 220), 2)
-
-        # 最新点を強調
-        cv2.circle(img, (xs[-1], ys[-1]), 4, (0, 0, 255), -1)
-
+# 記録ファイル（ほかのプログラムが記録中なら読むだけ）
+# 前回までの記録があれば、スパークラインの履歴をそこから始める
+store = LuxStore()
+now = time.time()
+for v in store.query(now - HISTORY_LEN * SAMPLE_INTERVAL_SEC, now, max_points=HISTORY_LEN)["mean"]:
+    renderer.push(v)
+
+def latest_sample():
+    """最新のサンプルを待たずに返す（まだ無ければ None）"""
+    if client is not None:
+        return client.latest()      # 共有メモリの最新値
+    return stream.latest            # 読み取りスレッドが差し替える最新値（ロック不要）
+
+def interpolate(prev, last, now):
+    """
+    直前2つのサンプルの間を補間して、画面の各フレームでなめらかに動かす
+    prev, last: (時刻, 値)。表示はサンプル1つ分だけ遅れて last に追いつく
+    """
+    if prev is None:
+        return last[1]
+    span = last[0] - prev[0]
+    t = 1.0 if span <= 0 else min(1.0, max(0.0, (now - last[0]) / span))
+    return prev[1] + (last[1] - prev[1]) * t
 
 def main():
     global lux_smooth, auto_max
@@ -126,42 +87,86 @@ def main():
 
     print("TSL2591 + OpenCV 可視化を開始します。ESCで終了。")
 
+    if stream is not None:
+        stream.start()
+
+    frame_dt = 1.0 / UI_FPS
+    next_frame = time.monotonic()
+    last_stamp = None
+    prev_point = last_point = None      # 補間用の (時刻, なめらかにした値)
+    sensor_range = ""
+    lux_disp_max = MAX_LUX_DISPLAY
+    day_view = False                    # True: 直近 DAY_VIEW_SEC の推移を表示
+    day_series = None
+
     try:
         while True:
-            # ---- センサからLux取得 ----
-            lux = float(sensor.Lux)
-
-            # ---- スムージング（指数移動平均）----
-            if lux_smooth is None:
-                lux_smooth = lux
-            else:
-                lux_smooth = (1 - EMA_ALPHA) * lux_smooth + EMA_ALPHA * lux
-
-            # ---- 履歴更新 ----
-            history.append(lux_smooth)
-
-            # ---- 表示レンジの決定 ----
-            if AUTO_RANGE:
-                # 新しい値で上限を押し上げ、徐々に減衰させて追従
-                auto_max = max(auto_max * AUTO_DECAY, lux_smooth * 1.1, 10.0)
-                lux_disp_max = auto_max
-            else:
-                lux_disp_max = MAX_LUX_DISPLAY
-
-            # ---- 描画キャンバス作成 ----
-            canvas = np.zeros((IMG_H, IMG_W, 3), dtype=np.uint8)
-            draw_ui(canvas, lux_smooth, lux_disp_max, history)
-
-            # ---- 表示 ----
-            cv2.imshow(WINDOW_NAME, canvas)
-
-            # ---- キー判定（ESCで終了）----
-            if (cv2.waitKey(1) & 0xFF) == 27:
+            # ---- 新しいサンプルが届いていれば取り込む（待たない）----
+            sample = latest_sample()
+            if sample is not None and sample.timestamp != last_stamp:
+                last_stamp = sample.timestamp
+                lux = float(sample.lux)
+                if not store.readonly:
+                    store.append(sample)    # ファイルへの書き出しは数秒ごとにまとめて行われる
+                sensor_range = sample.raw.range_name
+
+                # ---- スムージング（指数移動平均）----
+                if lux_smooth is None:
+                    lux_smooth = lux
+                else:
+                    lux_smooth = (1 - EMA_ALPHA) * lux_smooth + EMA_ALPHA * lux
+
+                # ---- 履歴更新（サンプルごとに1点）----
+                renderer.push(lux_smooth)
+                prev_point, last_point = last_point, (sample.timestamp, lux_smooth)
+
+                # ---- 表示レンジの決定 ----
+                if AUTO_RANGE:
+                    # 新しい値で上限を押し上げ、徐々に減衰させて追従
+                    auto_max = max(auto_max * AUTO_DECAY, lux_smooth * 1.1, 10.0)
+                    lux_disp_max = auto_max
+                else:
+                    lux_disp_max = MAX_LUX_DISPLAY
+
+                # ---- 長期推移（画面の幅ぶんの点数で、区切りごとの平均）----
+                if day_view:
+                    now = time.time()
+                    day_series = store.query(now - DAY_VIEW_SEC, now, max_points=IMG_W)["mean"]
+
+            # ---- 描画 ----
+            # 変わらない背景は使い回し、文字は値が変わったときだけ描き直す
+            if last_point is not None:
+                lux_disp = interpolate(prev_point, last_point, time.monotonic())
+                if day_view:
+                    canvas = renderer.render(lux_disp, lux_disp_max, sensor_range + "  [24h]",
+                                             series=day_series)
+                else:
+                    canvas = renderer.render(lux_disp, lux_disp_max, sensor_range)
+
+                # ---- 表示 ----
+                cv2.imshow(WINDOW_NAME, canvas)
+
+            # ---- 次のフレームまでキー入力を待つ（ESCで終了、D で長期推移の表示切り替え）----
+            # 待ち時間は時刻で決める（描画にかかった時間の分だけ短く待つ）
+            next_frame += frame_dt
+            wait_ms = int((next_frame - time.monotonic()) * 1000)
+            if wait_ms < 1:
+                next_frame = time.monotonic()   # 遅れたら追いつこうとせず、今から数え直す
+                wait_ms = 1
+            key = cv2.waitKey(wait_ms) & 0xFF
+            if key == 27:
                 break
-
-            time.sleep(SAMPLE_INTERVAL_SEC)
+            elif key in (ord('d'), ord('D')):
+                day_view = not day_view
+                now = time.time()
+                day_series = store.query(now - DAY_VIEW_SEC, now, max_points=IMG_W)["mean"]
 
     finally:
+        if stream is not None:
+            stream.stop()
+        if client is not None:
+            client.close()
+        store.close()
         cv2.destroyAllWindows()
         print("終了しました。")
 
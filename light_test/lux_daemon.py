@@ -0,0 +1,272 @@
+"""
+TSL2591 を1つのプロセスだけが読み、照度を複数のプログラムへ配る常駐サービス
+
+ポイント
+- センサを持つのは lux_daemon.py だけ。lightsensor_gui.py や lux_interactive.py を
+  同時に動かしても、センサの電源 ON/OFF やレジスタ設定を取り合わない
+- センサは変換1回につき1回だけ読み、購読者が何人いても同じ値を配る
+- 配り方は2通り
+  1) Unix ソケット（SOCK_SEQPACKET）: 変換ごとに1レコードを全購読者へ送る
+     読み手が遅くて送れないときは、そのレコードはその読み手にだけ送らない（たまらない）
+  2) 共有メモリの「最新値スロット」: シーケンスロック（書き込み中は番号が奇数）で守った
+     1レコード分の領域。読み手はシステムコールなしで数マイクロ秒で最新値を読める
+- 購読者は "rate <Hz>" を送ると最低サンプリング周波数を要求できる
+  → 要求の最大値に合わせて自動レンジの最長積分時間（Max_IntegralTime）を制限する
+
+使い方
+    $ python3 lux_daemon.py                 # サービスを起動（Ctrl+C で終了）
+
+    from lux_daemon import LuxClient, daemon_running
+    if daemon_running():
+        with LuxClient(min_rate_hz=5) as client:
+            print(client.latest())          # 共有メモリから最新値
+            for s in client:                # ソケットから変換ごとの値
+                print(s.timestamp, s.lux)
+"""
+
+import mmap
+import os
+import selectors
+import socket
+import struct
+import threading
+
+import TSL2591
+from lux_stream import LuxStream, LuxSample
+
+SOCKET_PATH = "/tmp/tsl2591.sock"
+SHM_PATH = "/dev/shm/tsl2591_latest" if os.path.isdir("/dev/shm") else "/tmp/tsl2591_latest"
+
+# 1サンプル = 通し番号, 変換終了時刻(time.monotonic), lux, CH0, CH1, ゲイン, 積分時間
+RECORD = struct.Struct("<QddHHBB")
+SEQLOCK = struct.Struct("<Q")
+SLOT_SIZE = SEQLOCK.size + RECORD.size
+
+
+def _to_sample(fields):
+    seq, stamp, lux, ch0, ch1, gain, atime = fields
+    return seq, LuxSample(stamp, lux, TSL2591.RawSample(ch0, ch1, gain, atime, stamp))
+
+
+def rate_to_integral_time(rate_hz):
+    """最低 rate_hz で読めるいちばん長い積分時間（ATIME_100MS〜ATIME_600MS）"""
+    if not rate_hz:
+        return TSL2591.ATIME_600MS
+    return max(TSL2591.ATIME_100MS, min(TSL2591.ATIME_600MS, int(10.0 / rate_hz) - 1))
+
+
+# ===== 共有メモリの最新値スロット =====
+class LatestSlot:
+    def __init__(self, path=SHM_PATH, writer=False):
+        self.path = path
+        self.writer = writer
+        if writer:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            os.ftruncate(fd, SLOT_SIZE)
+            self.mm = mmap.mmap(fd, SLOT_SIZE)
+        else:
+            fd = os.open(path, os.O_RDONLY)
+            self.mm = mmap.mmap(fd, SLOT_SIZE, access=mmap.ACCESS_READ)
+        os.close(fd)
+        self.version = SEQLOCK.unpack_from(self.mm, 0)[0] & ~1
+
+    def write(self, record):
+        """書き込み側（デーモンのみ）: 番号を奇数にして書き、偶数に戻す"""
+        self.version += 1
+        SEQLOCK.pack_into(self.mm, 0, self.version)
+        self.mm[SEQLOCK.size:] = record
+        self.version += 1
+        SEQLOCK.pack_into(self.mm, 0, self.version)
+
+    def read(self, retries=1000):
+        """(通し番号, LuxSample) を返す（まだ1回も書かれていなければ None）"""
+        for _ in range(retries):
+            v1 = SEQLOCK.unpack_from(self.mm, 0)[0]
+            if v1 & 1:
+                continue                        # 書き込み中
+            fields = RECORD.unpack_from(self.mm, SEQLOCK.size)
+            if SEQLOCK.unpack_from(self.mm, 0)[0] == v1:
+                return _to_sample(fields) if v1 else None
+        return None
+
+    def close(self):
+        self.mm.close()
+        if self.writer:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+
+# ===== サービス本体 =====
+class LuxDaemon:
+    def __init__(self, sensor, socket_path=SOCKET_PATH, shm_path=SHM_PATH):
+        self.sensor = sensor
+        self.socket_path = socket_path
+        self.shm_path = shm_path
+        self.seq = 0                # 配ったサンプル数（通し番号）
+        self.dropped = 0            # 読み手が遅くて送らなかった数
+        self.clients = {}           # 接続 -> 要求された最低周波数（Hz, 無ければ None）
+        self._clients_lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            if daemon_running(self.socket_path):
+                raise RuntimeError(f"すでに起動しています: {self.socket_path}")
+            os.unlink(self.socket_path)             # 前回の残り
+        self.slot = LatestSlot(self.shm_path, writer=True)    # 購読者が接続する前に用意
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        server.bind(self.socket_path)
+        server.listen()
+        server.setblocking(False)
+        sel = selectors.DefaultSelector()
+        sel.register(server, selectors.EVENT_READ)
+
+        stream = LuxStream(self.sensor).start()
+        sub = stream.subscribe(policy="latest")
+        publisher = threading.Thread(target=self._publish_loop, args=(sub,),
+                                     name="LuxDaemon", daemon=True)
+        publisher.start()
+        try:
+            while not self._stop_event.is_set():
+                for key, _ in sel.select(timeout=0.5):
+                    if key.fileobj is server:
+                        conn, _ = server.accept()
+                        conn.setblocking(False)
+                        sel.register(conn, selectors.EVENT_READ)
+                        with self._clients_lock:
+                            self.clients[conn] = None
+                    else:
+                        self._handle_request(sel, key.fileobj)
+        finally:
+            self._stop_event.set()
+            stream.stop()
+            publisher.join()
+            with self._clients_lock:
+                for conn in self.clients:
+                    conn.close()
+                self.clients.clear()
+            sel.close()
+            server.close()
+            os.unlink(self.socket_path)
+            self.slot.close()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _handle_request(self, sel, conn):
+        try:
+            data = conn.recv(64)
+        except OSError:
+            data = b""
+        if not data:                                # 切断
+            sel.unregister(conn)
+            with self._clients_lock:
+                self.clients.pop(conn, None)
+            conn.close()
+        else:
+            words = data.decode(errors="replace").split()
+            if len(words) == 2 and words[0] == "rate":
+                try:
+                    rate = float(words[1])
+                except ValueError:
+                    return
+                with self._clients_lock:
+                    self.clients[conn] = rate if rate > 0 else None
+        self._apply_rates()
+
+    def _apply_rates(self):
+        """いちばん高い要求に合わせて、自動レンジの最長積分時間を決める"""
+        with self._clients_lock:
+            rates = [r for r in self.clients.values() if r]
+        self.sensor.Max_IntegralTime = rate_to_integral_time(max(rates) if rates else None)
+
+    def _publish_loop(self, sub):
+        for sample in sub:
+            self.seq += 1
+            raw = sample.raw
+            record = RECORD.pack(self.seq, sample.timestamp, sample.lux,
+                                 raw.ch0, raw.ch1, raw.gain, raw.atime)
+            self.slot.write(record)
+            with self._clients_lock:
+                conns = list(self.clients)
+            for conn in conns:
+                try:
+                    conn.send(record)
+                except BlockingIOError:
+                    self.dropped += 1
+                except OSError:
+                    pass                            # 切断はメインループが片付ける
+
+
+# ===== 購読側 =====
+def daemon_running(socket_path=SOCKET_PATH):
+    """lux_daemon.py が動いていれば True"""
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    try:
+        s.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        s.close()
+
+
+class LuxClient:
+    def __init__(self, min_rate_hz=None, socket_path=SOCKET_PATH, shm_path=SHM_PATH):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.sock.connect(socket_path)
+        if min_rate_hz:
+            self.sock.send(b"rate %g" % min_rate_hz)
+        self.slot = LatestSlot(shm_path)
+        self.last_seq = None
+        self.missed = 0             # 通し番号が飛んだ数（自分が受け取れなかったサンプル）
+
+    def latest(self):
+        """共有メモリから最新のサンプルを読む（ソケットは使わない。まだ無ければ None）"""
+        got = self.slot.read()
+        return got[1] if got else None
+
+    def get(self, timeout=None):
+        """ソケットから次のサンプルを待って返す（時間切れ・デーモン終了で None）"""
+        self.sock.settimeout(timeout)
+        try:
+            data = self.sock.recv(RECORD.size)
+        except socket.timeout:
+            return None
+        if not data:
+            return None
+        seq, sample = _to_sample(RECORD.unpack(data))
+        if self.last_seq is not None and seq > self.last_seq + 1:
+            self.missed += seq - self.last_seq - 1
+        self.last_seq = seq
+        return sample
+
+    def __iter__(self):
+        while True:
+            sample = self.get()
+            if sample is None:
+                return
+            yield sample
+
+    def close(self):
+        self.sock.close()
+        self.slot.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    sensor = TSL2591.TSL2591()
+    sensor.Auto_Range = True     # 明るさに合わせてゲイン・積分時間を自動で切り替える（"rate" の要求で上限を決める）
+    daemon = LuxDaemon(sensor)
+    print(f"TSL2591 配信サービスを開始します: {SOCKET_PATH} / {SHM_PATH}（Ctrl+C で終了）")
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n停止しました（配信 {daemon.seq} 件, 送れなかった分 {daemon.dropped} 件）")
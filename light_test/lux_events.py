@@ -0,0 +1,120 @@
+"""
+TSL2591 の割り込み（INT ピン）を使った「明るさのしきい値イベント」
+
+ポイント
+- watch(しきい値lux, コールバック) で、明るさがしきい値をまたいだときに呼ばれる関数を登録
+- センサには「いまの明るさをはさむ上下のしきい値」だけを書き込み、
+  明るさがその範囲を出るとセンサが INT ピンを Low にする
+- プログラムは GPIO のエッジを待って眠っている（ポーリングしないので CPU をほぼ使わない）
+- 割り込みが来たときだけセンサを読み、コールバックを呼び、割り込みをクリアして
+  新しい明るさに合わせて上下のしきい値を書き直す
+- Raspberry Pi 以外（I2C_BACKEND=sim）では i2c_sim.SimGPIO が自動で使われる
+
+使い方
+    def on_cross(lux, rising):
+        print("明るくなった" if rising else "暗くなった", lux)
+
+    watcher = LuxEventWatcher(sensor)
+    watcher.watch(10, on_cross)
+    watcher.watch(500, on_cross)
+    watcher.run()          # Ctrl+C まで待ち続ける（別スレッドなら start() / stop()）
+"""
+
+import threading
+
+INT_PIN = 4                 # TSL2591 の INT をつないだ GPIO（BCM 番号）
+WAKE_TIMEOUT_MS = 5000      # エッジを取りこぼしても、この間隔で状態を確認し直す
+
+
+def default_gpio(sensor):
+    """実機なら RPi.GPIO、シミュレータのバスなら SimGPIO を返す"""
+    backend = getattr(sensor.i2c, "backend", None)
+    backend = getattr(backend, "backend", backend)     # I2C_TRACE で包まれている場合
+    if hasattr(backend, "devices"):
+        import i2c_sim
+        return i2c_sim.SimGPIO({INT_PIN: backend.devices[sensor.address]})
+    import RPi.GPIO as GPIO
+    GPIO.setmode(GPIO.BCM)
+    GPIO.setwarnings(False)
+    GPIO.setup(INT_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)   # INT はオープンドレイン
+    return GPIO
+
+
+class LuxEventWatcher:
+    def __init__(self, sensor, gpio=None, pin=INT_PIN):
+        self.sensor = sensor
+        self.gpio = gpio if gpio is not None else default_gpio(sensor)
+        self.pin = pin
+        self.callbacks = []         # [(しきい値lux, callback)]（しきい値の昇順）
+        self.lux = None             # 最後に読んだ明るさ
+        self.window = None          # いまセンサに書いてある (下限lux, 上限lux)
+        self.wakeups = 0            # 割り込みで起きた回数
+        self.events = 0             # コールバックを呼んだ回数
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def watch(self, threshold, callback):
+        """明るさが threshold をまたいだら callback(lux, rising) を呼ぶ"""
+        self.callbacks.append((float(threshold), callback))
+        self.callbacks.sort(key=lambda tc: tc[0])
+        if self.lux is not None:
+            self._arm()
+
+    # ---- 実行 ----
+    def run(self):
+        """stop() が呼ばれるまでイベントを待つ（呼び出したスレッドをブロックする）"""
+        self._stop_event.clear()
+        if not self.sensor.Continuous:
+            self.sensor.Start_Continuous()
+        self.lux = self.sensor.Lux
+        self._arm()
+        while not self._stop_event.is_set():
+            if self.gpio.input(self.pin) != self.gpio.LOW:
+                edge = self.gpio.wait_for_edge(self.pin, self.gpio.FALLING,
+                                               timeout=WAKE_TIMEOUT_MS)
+                if edge is None:
+                    continue
+            self.wakeups += 1
+            lux, stamp = self.sensor.Read_Latest(force=True)
+            self.sensor.Clear_Interrupt()
+            if lux is not None:
+                self._dispatch(lux)
+            self._arm()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="LuxEventWatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """待ち続けているスレッドを止める（最大で WAKE_TIMEOUT_MS 後に抜ける）"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    # ---- 内部処理 ----
+    def _dispatch(self, lux):
+        prev, self.lux = self.lux, lux
+        for threshold, callback in self.callbacks:
+            if prev < threshold <= lux:
+                self.events += 1
+                callback(lux, True)
+            elif lux < threshold <= prev:
+                self.events += 1
+                callback(lux, False)
+
+    def _arm(self):
+        """いまの明るさをはさむ上下のしきい値をセンサの割り込み範囲に書く"""
+        below = [t for t, _ in self.callbacks if t <= self.lux]
+        above = [t for t, _ in self.callbacks if t > self.lux]
+        low = below[-1] if below else None
+        high = above[0] if above else None
+        # 範囲（ゲイン・積分時間）が自動で変わっていても、IR のカウントをいまの範囲に換算する
+        sample = self.sensor.Last_Sample
+        channel_1 = 0
+        if sample is not None:
+            channel_1 = int(sample.ch1 * self.sensor.Get_Cpl() / sample.cpl)
+        low_count = self.sensor.Lux_To_Count(low, channel_1) if low is not None else 0
+        high_count = self.sensor.Lux_To_Count(high, channel_1) if high is not None else 0xFFFF
+        self.sensor.SET_InterruptThreshold(high_count, low_count)
+        self.window = (low, high)
@@ -0,0 +1,190 @@
+"""
+照度モニタ（lightsensor_gui.py）の描画エンジン
+
+ポイント
+- 毎フレーム作り直していたものを「変わらない部分」と「変わる部分」に分ける
+  - 背景・タイトル・枠線: 起動時に1回だけ描いて background に保存
+  - 文字（Lux 値・レンジ・目盛の数字）: 表示する文字列が変わったときだけ、
+    その文字の領域を background から戻して描き直す（結果は base に保存）
+  - バー・目盛線・スパークライン: 毎フレーム base をコピーした上に描く
+- 履歴は NumPy のリングバッファ（同じ値を2か所に書く方式）なので、
+  古い順の並びがコピーなしで連続した配列として取り出せる
+- スパークラインは cv2.polylines 1回で描く（点の数だけ cv2.line を呼ばない）
+  → 数千点の履歴でも画面のリフレッシュレートで描ける
+
+使い方
+    renderer = LuxRenderer(800, 300, history_len=2000)
+    renderer.push(lux)                                  # 新しいサンプルごと
+    img = renderer.render(lux, disp_max, "25x 100ms")   # 毎フレーム（img は使い回し）
+"""
+
+import time
+import numpy as np
+import cv2
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+BG_COLOR = (245, 245, 245)
+LINE_COLOR = (80, 80, 220)
+TICKS = (0.25, 0.5, 0.75, 1.0)
+
+
+def lerp_color(a, b, t):
+    """2色（BGR）をtで線形補間（0〜1）"""
+    return tuple(int(a[i] + (b[i] - a[i]) * t) for i in range(3))
+
+
+def bar_color(t):
+    """バーの色（暗→明で 青→緑→黄→赤 に近づく感じ）"""
+    # 青(255,100,0) → 緑(0,200,0) → 黄(0,255,255) → 赤(0,0,255)
+    if t < 0.33:
+        return lerp_color((255, 100, 0), (0, 200, 0), t / 0.33)
+    elif t < 0.66:
+        return lerp_color((0, 200, 0), (0, 255, 255), (t - 0.33) / 0.33)
+    return lerp_color((0, 255, 255), (0, 0, 255), (t - 0.66) / 0.34)
+
+
+class HistoryRing:
+    """固定長の履歴。values() は古い順の float32 配列（コピーしないビュー）"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buf = np.zeros(2 * capacity, dtype=np.float32)
+        self.count = 0
+
+    def append(self, value):
+        i = self.count % self.capacity
+        self.buf[i] = self.buf[i + self.capacity] = value
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def values(self):
+        n = len(self)
+        start = self.count % self.capacity if self.count > self.capacity else 0
+        return self.buf[start:start + n]
+
+
+class LuxRenderer:
+    def __init__(self, width=800, height=300, history_len=300, bar_h=60, margin=20, auto_range=True):
+        self.width, self.height = width, height
+        self.auto_range = auto_range
+        self.history = HistoryRing(history_len)
+
+        # ---- レイアウト（固定） ----
+        self.bar = (margin, 160, width - margin, 160 + bar_h)
+        bx1, by1, bx2, by2 = self.bar
+        self.spark = (margin, by2 + 40, width - margin, height - margin)
+        self.tick_xs = np.array([int(bx1 + (bx2 - bx1) * f) for f in TICKS])
+        # 文字の置き場所: 名前 -> (描き直すときに消す領域 (x1, y1, x2, y2))
+        self.slots = {
+            "lux": (0, 62, width, 112),
+            "range": (0, 112, width - 270, 146),
+            "sensor": (width - 270, 112, width, 146),
+            "ticks": (0, by2 + 2, width, by2 + 30),
+        }
+
+        # ---- 変わらない層（1回だけ描く） ----
+        bg = np.empty((height, width, 3), dtype=np.uint8)
+        bg[:] = BG_COLOR
+        cv2.putText(bg, "TSL2591 Lux Monitor", (margin, 40), FONT, 0.9, (0, 0, 0), 2, cv2.LINE_AA)
+        cv2.rectangle(bg, (bx1, by1), (bx2, by2), (180, 180, 180), 2)
+        sx1, sy1, sx2, sy2 = self.spark
+        cv2.rectangle(bg, (sx1, sy1), (sx2, sy2), (210, 210, 210), 2)
+        self.background = bg
+        self.base = bg.copy()           # 背景 + いまの文字
+        self.canvas = bg.copy()         # 毎フレームの出力（使い回す）
+        self.texts = {}                 # 名前 -> いま描いてある文字列
+        self.text_renders = 0           # 文字を描き直した回数
+        self._xs_cache = {}             # 点の数 -> スパークラインの x 座標
+
+    def push(self, lux):
+        self.history.append(lux)
+
+    # ---- 文字 ----
+    def _set_text(self, name, key, draw):
+        """表示内容 key が前回と違うときだけ、その領域を消して draw(base) で描き直す"""
+        if self.texts.get(name) == key:
+            return
+        x1, y1, x2, y2 = self.slots[name]
+        self.base[y1:y2, x1:x2] = self.background[y1:y2, x1:x2]
+        draw(self.base)
+        self.texts[name] = key
+        self.text_renders += 1
+
+    def _update_texts(self, lux, disp_max, sensor_range):
+        margin = self.bar[0]
+        by2 = self.bar[3]
+        lux_text = f"Lux: {lux:.1f}"
+        self._set_text("lux", lux_text, lambda img: cv2.putText(
+            img, lux_text, (margin, 100), FONT, 1.2, (20, 20, 20), 3, cv2.LINE_AA))
+
+        range_text = f"Range: 0 - {disp_max:.0f}  {'(AUTO)' if self.auto_range else '(FIXED)'}"
+        self._set_text("range", range_text, lambda img: cv2.putText(
+            img, range_text, (margin, 135), FONT, 0.7, (60, 60, 60), 2, cv2.LINE_AA))
+
+        # センサの測定レンジ（ゲインと積分時間は明るさに合わせて自動で切り替わる）
+        sensor_text = f"Sensor: {sensor_range}"
+        self._set_text("sensor", sensor_text, lambda img: cv2.putText(
+            img, sensor_text, (self.width - 260, 135), FONT, 0.7, (60, 60, 60), 2, cv2.LINE_AA))
+
+        # 目盛の数字（25%, 50%, 75%, 100%）
+        labels = tuple(int(disp_max * f) for f in TICKS)
+
+        def draw_ticks(img):
+            for x, label in zip(self.tick_xs, labels):
+                cv2.putText(img, f"{label}", (int(x) - 20, by2 + 20),
+                            FONT, 0.5, (100, 100, 100), 1, cv2.LINE_AA)
+        self._set_text("ticks", labels, draw_ticks)
+
+    # ---- 1フレーム ----
+    def render(self, lux, disp_max, sensor_range="", series=None):
+        """series を渡すと、履歴の代わりにその配列（例: lux_store の長期データ）を折れ線にする"""
+        self._update_texts(lux, disp_max, sensor_range)
+        img = self.canvas
+        np.copyto(img, self.base)
+
+        # バー本体（長さは 0〜1 に正規化）と目盛線
+        bx1, by1, bx2, by2 = self.bar
+        t = max(0.0, min(1.0, lux / max(disp_max, 1e-6)))
+        bar_w = int((bx2 - bx1 - 2) * t)
+        img[by1 + 1:by2, bx1 + 1:bx1 + 2 + bar_w] = bar_color(t)
+        img[by1:by2 + 1, self.tick_xs] = (200, 200, 200)
+
+        # スパークライン（履歴）
+        vals = self.history.values() if series is None else series
+        n = len(vals)
+        if n >= 2:
+            sx1, sy1, sx2, sy2 = self.spark
+            h = sy2 - sy1 - 2
+            vmax = max(disp_max, float(vals.max()), 1.0)
+            pts = self._xs_cache.get(n)
+            if pts is None:
+                # 横方向は等間隔に敷き詰め（点の数が同じあいだは使い回す）
+                pts = np.empty((n, 2), dtype=np.int32)
+                pts[:, 0] = np.linspace(sx1 + 1, sx2 - 1, n)
+                self._xs_cache = {n: pts}
+            # 0〜vmax を下から上へ
+            np.multiply(vals, -h / (vmax + 1e-9), out=pts[:, 1], casting="unsafe")
+            pts[:, 1] += sy2 - 1
+            cv2.polylines(img, [pts], False, LINE_COLOR, 2)
+            # 最新点を強調
+            cv2.circle(img, (int(pts[-1, 0]), int(pts[-1, 1])), 4, (0, 0, 255), -1)
+        return img
+
+
+if __name__ == "__main__":
+    # 簡単なベンチマーク: python3 lux_render.py
+    rng = np.random.default_rng(0)
+    for n in (300, 3000):
+        r = LuxRenderer(history_len=n)
+        for v in rng.uniform(0, 900, n):
+            r.push(v)
+        frames = 500
+        t0 = time.perf_counter()
+        for i in range(frames):
+            lux = 400 + 5 * np.sin(i / 20)
+            r.push(lux)
+            r.render(lux, 1000.0, "25x 100ms")
+        dt = (time.perf_counter() - t0) / frames
+        print(f"history {n:5d}: {dt * 1e3:.3f} ms/frame, text redraws {r.text_renders}")
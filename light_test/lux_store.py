@@ -0,0 +1,243 @@
+"""
+照度サンプルを長期間ためておく時系列ファイル（追記専用・メモリマップ）
+
+ポイント
+- 1サンプル（時刻, lux, CH0, CH1, ゲイン, 積分時間）= 18バイトの固定長レコードを
+  raw.bin に追記していく。ファイルは np.memmap で開くので、追記はメモリへの書き込みだけ
+- 同時に、1秒・10秒・1分・10分・1時間ごとの「最小・最大・平均」（ピラミッド）を作り、
+  区切りが終わるたびに level_<秒>s.bin に1レコード追記する
+- query(t0, t1, max_points) は、その時間幅を max_points 点以内で表せる
+  いちばん細かい段を選び、二分探索で範囲を切り出すだけ
+  → 1日分でも1か月分でも、返す点の数（と手間）はほぼ一定
+- SD カードを傷めないよう、ディスクへの書き出し（msync）は FLUSH_SEC ごとにまとめて行う
+  （電源が落ちても失うのは最後の FLUSH_SEC 秒ぶんだけ。件数はデータの後に更新する）
+- 書き込めるのは1プロセスだけ（ロックファイル）。取れなければ読み取り専用で開く
+- 保存先は環境変数 LUX_STORE_DIR で変えられる（既定は ~/.local/share/lux_log/。
+  XDG_DATA_HOME があればその下）。ソースのフォルダには書かない
+
+使い方
+    store = LuxStore()                        # ~/.local/share/lux_log/ に保存
+    store.append(sample)                      # lux_stream.LuxSample を渡す
+    rows = store.query(time.time() - 86400, time.time(), max_points=800)
+    rows["t"], rows["min"], rows["max"], rows["mean"]
+
+    $ python3 lux_store.py 3600               # 直近1時間の様子を表示
+"""
+
+import bisect
+import fcntl
+import os
+import sys
+import time
+import numpy as np
+
+STORE_DIR = os.environ.get("LUX_STORE_DIR") or os.path.join(
+    os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share"), "lux_log")
+LEVELS = (1, 10, 60, 600, 3600)     # ピラミッドの区切り（秒）
+FLUSH_SEC = 5.0                     # ディスクへ書き出す間隔（秒）
+CHUNK = 65536                       # ファイルを伸ばすときの単位（レコード数）
+MAGIC = b"LUXSTOR1"
+
+# t は UNIX 時刻（time.time()）
+RAW_DTYPE = np.dtype([("t", "<f8"), ("lux", "<f4"), ("ch0", "<u2"), ("ch1", "<u2"),
+                      ("gain", "u1"), ("atime", "u1")])
+LEVEL_DTYPE = np.dtype([("t", "<f8"), ("min", "<f4"), ("max", "<f4"), ("mean", "<f4"),
+                        ("count", "<u4")])
+HEADER_DTYPE = np.dtype([("magic", "S8"), ("count", "<u8"), ("itemsize", "<u4"), ("_pad", "V44")])
+
+
+def search(times, t):
+    """times（昇順）の中で t 以上になる最初の位置。np.searchsorted と違って
+    memmap の列をまるごとコピーしないので、件数が増えても O(log n) のまま"""
+    return bisect.bisect_left(times, t)
+
+
+class Series:
+    """ヘッダ（件数）+ 固定長レコードの配列、を1ファイルに持つ追記専用の列"""
+
+    def __init__(self, path, dtype, readonly=False):
+        self.path = path
+        self.dtype = dtype
+        self.readonly = readonly
+        self.count = 0
+        self.data = np.empty(0, dtype)
+        self.header = None
+        if not os.path.exists(path):
+            if readonly:
+                return
+            header = np.zeros(1, HEADER_DTYPE)
+            header["magic"] = MAGIC
+            header["itemsize"] = dtype.itemsize
+            with open(path, "wb") as f:
+                f.write(header.tobytes())
+        self._map()
+        self.count = int(self.header["count"][0])
+
+    def _map(self):
+        mode = "r" if self.readonly else "r+"
+        self.header = np.memmap(self.path, HEADER_DTYPE, mode, shape=(1,))
+        if self.header["magic"][0] != MAGIC or self.header["itemsize"][0] != self.dtype.itemsize:
+            raise ValueError(f"形式の違うファイルです: {self.path}")
+        capacity = (os.path.getsize(self.path) - HEADER_DTYPE.itemsize) // self.dtype.itemsize
+        if capacity > 0:
+            self.data = np.memmap(self.path, self.dtype, mode, offset=HEADER_DTYPE.itemsize,
+                                  shape=(capacity,))
+
+    def append(self, record):
+        if self.count == len(self.data):
+            self._grow()
+        self.data[self.count] = record
+        self.count += 1
+
+    def _grow(self):
+        self.flush()
+        size = HEADER_DTYPE.itemsize + (len(self.data) + CHUNK) * self.dtype.itemsize
+        self.data = self.header = None          # いまのマップを閉じてから伸ばす
+        with open(self.path, "r+b") as f:
+            f.truncate(size)
+        self._map()
+
+    def flush(self):
+        """データ → 件数の順にディスクへ書き出す（件数は書き出し済みのデータだけを指す）"""
+        if self.header is None:
+            return
+        if isinstance(self.data, np.memmap):
+            self.data.flush()
+        self.header["count"] = self.count
+        self.header.flush()
+
+    def view(self):
+        """書かれているレコード（読み取り専用なら、ほかのプロセスの追記も読み直す）"""
+        if self.readonly:
+            if self.header is None:
+                if not os.path.exists(self.path):
+                    return self.data[:0]
+                self._map()
+            self.count = int(self.header["count"][0])
+            if self.count > len(self.data):
+                self._map()
+        return self.data[:self.count]
+
+
+class LuxStore:
+    def __init__(self, path=STORE_DIR, readonly=False, levels=LEVELS, flush_sec=FLUSH_SEC):
+        self.path = path
+        self.flush_sec = flush_sec
+        self._lock_file = None
+        if not readonly:
+            os.makedirs(path, exist_ok=True)
+            self._lock_file = open(os.path.join(path, "lock"), "w")
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:             # ほかのプログラムが記録中
+                self._lock_file.close()
+                self._lock_file = None
+                readonly = True
+        self.readonly = readonly
+        self.raw = Series(os.path.join(path, "raw.bin"), RAW_DTYPE, readonly)
+        self.levels = {w: Series(os.path.join(path, f"level_{w}s.bin"), LEVEL_DTYPE, readonly)
+                       for w in sorted(levels)}
+        self._open = {}                 # 区切り幅 -> 集計中の [区切り番号, 最小, 最大, 合計, 件数]
+        self._wall_offset = time.time() - time.monotonic()
+        self._next_flush = time.monotonic() + flush_sec
+        if not readonly:
+            self._resume()
+
+    # ---- 書き込み ----
+    def append(self, sample):
+        """LuxSample（timestamp は time.monotonic）を1件追記する"""
+        if self.readonly:
+            raise RuntimeError("読み取り専用で開いています")
+        t = sample.timestamp + self._wall_offset
+        raw = sample.raw
+        self.raw.append((t, sample.lux, raw.ch0, raw.ch1, raw.gain, raw.atime))
+        for w in self.levels:
+            self._accumulate(w, t, sample.lux)
+        if time.monotonic() >= self._next_flush:
+            self.flush()
+
+    def _accumulate(self, w, t, lux):
+        bucket = int(t // w)
+        acc = self._open.get(w)
+        if acc is not None and acc[0] != bucket:
+            b, lo, hi, total, n = acc
+            self.levels[w].append((b * w, lo, hi, total / n, n))
+            acc = None
+        if acc is None:
+            self._open[w] = [bucket, lux, lux, lux, 1]
+        else:
+            acc[1] = min(acc[1], lux)
+            acc[2] = max(acc[2], lux)
+            acc[3] += lux
+            acc[4] += 1
+
+    def _resume(self):
+        """前回の終了時に集計途中だった区切りを、raw の末尾から作り直す"""
+        raw = self.raw.view()
+        for w, series in self.levels.items():
+            done = series.view()
+            start = done["t"][-1] + w if len(done) else -np.inf
+            i = search(raw["t"], start)
+            for t, lux in zip(raw["t"][i:].tolist(), raw["lux"][i:].tolist()):
+                self._accumulate(w, t, lux)
+
+    def flush(self):
+        self.raw.flush()
+        for series in self.levels.values():
+            series.flush()
+        self._next_flush = time.monotonic() + self.flush_sec
+
+    def close(self):
+        if not self.readonly:
+            self.flush()
+            self._lock_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---- 読み出し ----
+    def wall_time(self, monotonic):
+        """time.monotonic() の値 → UNIX 時刻"""
+        return monotonic + self._wall_offset
+
+    def query(self, t0, t1, max_points=1000):
+        """
+        t0 <= t < t1（UNIX 時刻）の様子を max_points 点以内で返す
+        （LEVEL_DTYPE の配列。生データのときは min = max = mean = lux, count = 1）
+        """
+        raw = self.raw.view()
+        i0, i1 = search(raw["t"], t0), search(raw["t"], t1)
+        if i1 - i0 <= max_points:
+            r = raw[i0:i1]
+            out = np.empty(len(r), LEVEL_DTYPE)
+            out["t"] = r["t"]
+            out["min"] = out["max"] = out["mean"] = r["lux"]
+            out["count"] = 1
+            return out
+
+        widths = list(self.levels)
+        w = next((w for w in widths if (t1 - t0) / w <= max_points), widths[-1])
+        lv = self.levels[w].view()
+        j0, j1 = search(lv["t"], t0), search(lv["t"], t1)
+        out = np.array(lv[j0:j1])
+        acc = self._open.get(w)
+        if acc is not None and t0 <= acc[0] * w < t1:     # まだ閉じていない最新の区切り
+            b, lo, hi, total, n = acc
+            out = np.append(out, np.array([(b * w, lo, hi, total / n, n)], LEVEL_DTYPE))
+        return out
+
+
+if __name__ == "__main__":
+    # 直近 N 秒（既定 1時間）を 24 区切りで表示
+    span = float(sys.argv[1]) if len(sys.argv) > 1 else 3600.0
+    store = LuxStore(readonly=True)
+    now = time.time()
+    rows = store.query(now - span, now, max_points=24)
+    print(f"{store.raw.count} サンプル記録済み（{store.path}）")
+    print("時刻                  最小      平均      最大   件数")
+    for r in rows:
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(r["t"]))
+        print(f"{stamp}  {r['min']:8.1f}  {r['mean']:8.1f}  {r['max']:8.1f}  {r['count']:5d}")
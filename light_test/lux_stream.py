@@ -0,0 +1,228 @@
+"""
+TSL2591 の照度を「タイムスタンプ付きサンプルの流れ」として受け取る
+
+ポイント
+- LuxStream がバックグラウンドのスレッドでセンサを読み（連続変換モード）、
+  新しい変換結果が出るたびに購読者（Subscription）へ配る
+  → メインの処理は time.sleep で止まらないので、カメラ・音声・サーボと同じループで扱える
+- 受け取り方は2通り
+    for s in stream.subscribe():            # ふつうのイテレータ（スレッド向け）
+    async for s in stream.subscribe():      # asyncio のイベントループ向け
+- rate_hz で配る頻度の上限を決める（None ならセンサの変換ごと。同じ変換を2回配ることはない）
+- 読み手が遅いときの扱い（バックプレッシャー）は購読者ごとに選ぶ
+    policy="drop_oldest" … maxlen 個までためて、あふれたら古いものから捨てる
+    policy="latest"      … いつも最新の1個だけ（遅れて読んでも古い値は来ない）
+- ema(alpha) / median(n) などの処理段を stages=[...] で順につなげられる
+  （処理段は状態を持つので、購読者ごとに新しく作って渡す）
+- 待たずに最新値だけ欲しいときは stream.latest を読む（ロックなし。1回の代入で差し替わる）
+
+使い方
+    stream = LuxStream(sensor, rate_hz=10).start()
+    for s in stream.subscribe(stages=[median(5), ema(0.2)]):
+        print(s.timestamp, s.lux, s.raw.range_name)
+    stream.stop()
+"""
+
+import asyncio
+import statistics
+import threading
+import time
+from collections import deque, namedtuple
+
+POLICIES = ("drop_oldest", "latest")
+ERROR_RETRY_SEC = 0.5       # 読み取りに失敗したときの待ち時間
+
+# timestamp: 変換が終わった時刻（time.monotonic）、lux: 照度（処理段を通った値）、
+# raw: TSL2591.RawSample（生のカウント・ゲイン・積分時間）
+LuxSample = namedtuple("LuxSample", "timestamp lux raw")
+
+
+# ===== 処理段（サンプル → サンプル。None を返すとそのサンプルは捨てる） =====
+def ema(alpha):
+    """指数移動平均（alpha: 0〜1、小さいほどなめらか）"""
+    value = None
+
+    def stage(sample):
+        nonlocal value
+        value = sample.lux if value is None else (1 - alpha) * value + alpha * sample.lux
+        return sample._replace(lux=value)
+    return stage
+
+
+def median(n):
+    """直近 n 個の中央値（ときどき混ざる外れ値を消す）"""
+    window = deque(maxlen=n)
+
+    def stage(sample):
+        window.append(sample.lux)
+        return sample._replace(lux=statistics.median(window))
+    return stage
+
+
+# ===== 購読者 =====
+class Subscription:
+    def __init__(self, stream, maxlen=64, policy="drop_oldest", stages=()):
+        if policy not in POLICIES:
+            raise ValueError(f"policy は {POLICIES} のどれか: {policy!r}")
+        self.stream = stream
+        self.policy = policy
+        self.stages = list(stages)
+        self.queue = deque(maxlen=1 if policy == "latest" else maxlen)
+        self.dropped = 0            # 読まれる前に捨てられた数
+        self.closed = False
+        self._cond = threading.Condition()
+        self._async = None          # async for 中なら (イベントループ, asyncio.Event)
+
+    def _put(self, sample):
+        """読み取りスレッドから呼ばれる"""
+        for stage in self.stages:
+            sample = stage(sample)
+            if sample is None:
+                return
+        with self._cond:
+            if len(self.queue) == self.queue.maxlen:
+                self.dropped += 1
+            self.queue.append(sample)
+            self._cond.notify()
+        self._wake()
+
+    def _wake(self):
+        waiter = self._async
+        if waiter is not None:
+            loop, event = waiter
+            loop.call_soon_threadsafe(event.set)
+
+    def get(self, timeout=None):
+        """次のサンプルを待って返す（時間切れ・close 後は None）"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.queue or self.closed, timeout)
+            return self.queue.popleft() if self.queue else None
+
+    def close(self):
+        self.stream._unsubscribe(self)
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        self._wake()
+
+    def __iter__(self):
+        while True:
+            sample = self.get()
+            if sample is None:
+                return
+            yield sample
+
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        self._async = (loop, event)
+        try:
+            while True:
+                with self._cond:
+                    sample = self.queue.popleft() if self.queue else None
+                    closed = self.closed
+                if sample is not None:
+                    yield sample
+                elif closed:
+                    return
+                else:
+                    await event.wait()
+                    event.clear()
+        finally:
+            self._async = None
+
+
+# ===== 読み取りスレッド =====
+class LuxStream:
+    def __init__(self, sensor, rate_hz=None):
+        self.sensor = sensor
+        self.period = 1.0 / rate_hz if rate_hz else 0.0
+        self.samples = 0            # 配ったサンプル数
+        self.latest = None          # 最新の LuxSample（読み取りスレッドが丸ごと差し替える）
+        self.errors = 0
+        self._subs = []
+        self._subs_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._own_continuous = False
+
+    def subscribe(self, maxlen=64, policy="drop_oldest", stages=()):
+        sub = Subscription(self, maxlen, policy, stages)
+        with self._subs_lock:
+            self._subs.append(sub)
+        return sub
+
+    def _unsubscribe(self, sub):
+        with self._subs_lock:
+            if sub in self._subs:
+                self._subs.remove(sub)
+
+    def __iter__(self):
+        return iter(self.subscribe())
+
+    def __aiter__(self):
+        return self.subscribe().__aiter__()
+
+    # ---- 開始・停止 ----
+    def start(self):
+        if not self.sensor.Continuous:
+            self.sensor.Start_Continuous()
+            self._own_continuous = True
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="LuxStream", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """読み取りを止め、購読者のループを終わらせる"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._own_continuous:
+            self.sensor.Stop_Continuous()
+            self._own_continuous = False
+        with self._subs_lock:
+            subs = list(self._subs)
+        for sub in subs:
+            sub.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ---- 本体 ----
+    def _run(self):
+        sensor = self.sensor
+        last_stamp = None
+        next_pub = 0.0
+        while not self._stop_event.is_set():
+            # 次の変換が終わる時刻（と rate_hz の間隔）まで眠る
+            due = max(sensor.Next_Due, sensor.Settle_Until, next_pub)
+            wait = due - time.monotonic()
+            if wait > 0 and self._stop_event.wait(wait):
+                break
+            try:
+                lux, stamp = sensor.Read_Latest()
+            except (OSError, RuntimeError) as e:
+                self.errors += 1
+                print("センサ読み取りエラー:", e)
+                self._stop_event.wait(ERROR_RETRY_SEC)
+                continue
+            if lux is None or stamp == last_stamp:
+                # まだ変換が終わっていない（STATUS が未更新）: 少しだけ待って読み直す
+                self._stop_event.wait(0.005)
+                continue
+            last_stamp = stamp
+            next_pub = stamp + self.period
+            self._publish(LuxSample(stamp, lux, sensor.Last_Sample))
+
+    def _publish(self, sample):
+        self.latest = sample
+        self.samples += 1
+        with self._subs_lock:
+            subs = list(self._subs)
+        for sub in subs:
+            sub._put(sample)
@@ -0,0 +1,67 @@
+"""
+lux_daemon.py の "rate <Hz>" 要求で、自動レンジの積分時間に上限がかかることの確認
+
+実機なしで動かす（i2c_sim のシミュレータ、暗い部屋 = 0.01 lux）
+暗いと自動レンジはいちばん長い積分時間（600ms）を選ぼうとするので、
+5Hz を要求した購読者がいる間は 200ms 以下に抑えられていることを見る
+
+使い方
+    $ python3 -m unittest test_lux_daemon
+"""
+
+import os
+import tempfile
+import threading
+import unittest
+
+os.environ["I2C_BACKEND"] = "sim"
+os.environ["I2C_SIM_LUX"] = "0.01"
+
+import TSL2591
+from lux_daemon import LuxDaemon, LuxClient, daemon_running, rate_to_integral_time
+
+
+class RateRequestTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.socket_path = os.path.join(tmp.name, "tsl2591.sock")
+        self.shm_path = os.path.join(tmp.name, "tsl2591_latest")
+        self.sensor = TSL2591.TSL2591()
+        self.sensor.Auto_Range = True
+        self.daemon = LuxDaemon(self.sensor, self.socket_path, self.shm_path)
+        thread = threading.Thread(target=self.daemon.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(self.daemon.stop)
+        for _ in range(100):
+            if daemon_running(self.socket_path):
+                break
+            threading.Event().wait(0.05)
+
+    def test_rate_caps_integral_time(self):
+        with LuxClient(min_rate_hz=5, socket_path=self.socket_path,
+                       shm_path=self.shm_path) as client:
+            samples = [client.get(timeout=2) for _ in range(6)]
+            self.assertEqual(self.sensor.Max_IntegralTime, rate_to_integral_time(5))
+            self.assertEqual(rate_to_integral_time(5), TSL2591.ATIME_200MS)
+            self.assertNotIn(None, samples)
+            # 最初の数回はレンジを決めている途中。落ち着いたあとは上限いっぱい（暗いので）
+            for s in samples[-3:]:
+                self.assertEqual(s.raw.atime, TSL2591.ATIME_200MS)
+            self.assertLessEqual(self.sensor.IntegralTime, TSL2591.ATIME_200MS)
+
+    def test_limit_released_on_disconnect(self):
+        with LuxClient(min_rate_hz=5, socket_path=self.socket_path,
+                       shm_path=self.shm_path) as client:
+            client.get(timeout=2)
+            self.assertEqual(self.sensor.Max_IntegralTime, TSL2591.ATIME_200MS)
+        for _ in range(40):                         # 切断はデーモンのループが拾う
+            if self.sensor.Max_IntegralTime == TSL2591.ATIME_600MS:
+                break
+            threading.Event().wait(0.05)
+        self.assertEqual(self.sensor.Max_IntegralTime, TSL2591.ATIME_600MS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -16,21 +16,19 @@ import sys
 import time
 import cv2
 import mediapipe as mp
-from picamera2 import Picamera2
-from libcamera import controls
 from mediapipe.tasks import python
 from mediapipe.tasks.python import vision
 from utils import visualize
+from frame_source import open_source
+from buffer_pool import BufferPool
 
 # 任意の物体名を指定する変数（ここで変更可能）
 target_object = "person"  # ここを好きな物体名に変更できる
 
 # カメラの初期設定
-picam2 = Picamera2()
-picam2.configure(picam2.create_preview_configuration(
-    main={"format": 'XRGB8888', "size": (640, 480)}))
-picam2.start()
-picam2.set_controls({"AfMode": controls.AfModeEnum.Continuous})
+# フレームの取得は別スレッドで（上下左右の反転もそこで行う）
+# 環境変数 FRAME_SOURCE で動画ファイルや合成映像にも切り替えられる
+source = open_source((640, 480), 'XRGB8888', flip=-1)
 
 # FPS計算用のグローバル変数
 COUNTER, FPS = 0, 0
@@ -91,24 +89,32 @@ def run(model: str, max_results: int, score_threshold: float,
     font_size = 1
     font_thickness = 1
 
+    # リサイズの出力先（毎フレーム新しい配列を作らず使い回す）
+    buffers = BufferPool()
+
     # 検出結果を表示するウィンドウを作成
     cv2.namedWindow('object_detection', cv2.WINDOW_NORMAL)
     cv2.resizeWindow('object_detection', 800, 600)
 
     while True:
-        frame = picam2.capture_array()
-        frame = cv2.flip(frame,-1)
+        frame = source.read()
         if frame is None:
-            break
+            if source.finished:
+                break
+            continue
+        stamp_ms = int(frame.timestamp * 1000)
+        frame = frame.image
 
         # フレームをリサイズし、推論用に変換
-        image = cv2.resize(frame, (width, height))
+        # rgb_image は推論が終わるまで MediaPipe に渡したままなので、毎回新しく作る
+        image = cv2.resize(frame, (width, height),
+                           dst=buffers.get("image", (height, width, frame.shape[2])))
         rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
         mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_image)
 
         # 前回の推論が終了していれば、新しい推論を開始
         if not is_inference_in_flight:
-            detector.detect_async(mp_image, time.time_ns() // 1_000_000)
+            detector.detect_async(mp_image, stamp_ms)
             is_inference_in_flight = True
 
         # FPSを画像上に描画
@@ -134,7 +140,7 @@ def run(model: str, max_results: int, score_threshold: float,
             break
 
     detector.close()
-    picam2.stop()
+    source.stop()
     cv2.destroyAllWindows()
 
 def main():
@@ -6,23 +6,18 @@ import sys
 import time
 import cv2
 import mediapipe as mp
-from picamera2 import Picamera2
-from libcamera import controls
 from mediapipe.tasks import python
 from mediapipe.tasks.python import vision
 from utils import visualize  # MediaPipe サンプル付属の可視化関数
+from frame_source import open_source  # カメラ（別スレッド取得）・動画・合成映像を切り替え
+from buffer_pool import BufferPool     # 毎フレームの作業用配列を使い回す
 
 # ===== カメラ初期化（プレビュー用途の軽量設定） =====
 # XRGB8888 は 4ch（BGRA相当：使わないAが先頭/末尾に乗る）で返る点に注意
-picam2 = Picamera2()
-picam2.configure(
-    picam2.create_preview_configuration(
-        main={"format": "XRGB8888", "size": (640, 480)}
-    )
-)
-picam2.start()
-# レンズ付きモジュールなら AF を連続モードに
-picam2.set_controls({"AfMode": controls.AfModeEnum.Continuous})
+# レンズ付きモジュールなら AF を連続モードにし、取得は別スレッドで行う
+# （取り付け向きに応じた上下反転もそこで行う）
+# 環境変数 FRAME_SOURCE で動画ファイルや合成映像にも切り替えられる
+source = open_source((640, 480), "XRGB8888", flip=0)
 
 # ===== FPS 計測用のグローバル（可視化のため） =====
 COUNTER, FPS = 0, 0.0
@@ -92,27 +87,36 @@ def run(model: str, max_results: int, score_threshold: float,
     font_size = 1
     font_thickness = 1
 
+    # リサイズの出力先（1回目に確保し、あとは同じ配列に書き込む）
+    buffers = BufferPool()
+
     try:
         while True:
             # ====== フレーム取得 ======
             # XRGB8888（4ch）で来る点に注意（BGRA相当）
-            frame = picam2.capture_array()
-            frame = cv2.flip(frame, 0)  # 取り付け向きに応じて上下反転
-
+            # 描画や推論の投入をしている間も、スレッドが次のフレームを撮っている
+            frame = source.read()
             if frame is None:
-                break
+                if source.finished:     # 動画・画像フォルダを最後まで読んだ
+                    break
+                continue
+            stamp_ms = int(frame.timestamp * 1000)
+            frame = frame.image
 
             # ====== MediaPipe 用の入力画像を作る ======
             # 1) 表示サイズとは別に、推論用に width×height へリサイズ
+            #    （出力先は使い回しの配列。表示用の描画もこの image に行う）
             # 2) 4ch(BGRA) → RGB へ変換（XRGB8888 はアルファ(未使用)付き）
-            image = cv2.resize(frame, (width, height))
+            #    （rgb_image は推論が終わるまで MediaPipe に渡したままなので、毎回新しく作る）
+            image = cv2.resize(frame, (width, height),
+                               dst=buffers.get("image", (height, width, frame.shape[2])))
             rgb_image = cv2.cvtColor(image, cv2.COLOR_BGRA2RGB)
             mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_image)
 
             # ====== 非同期推論の投入制御 ======
             if not is_inference_in_flight:
-                # MediaPipe はタイムスタンプ(ms)の単調増加を要求
-                detector.detect_async(mp_image, time.time_ns() // 1_000_000)
+                # MediaPipe はタイムスタンプ(ms)の単調増加を要求（撮影時刻を使う）
+                detector.detect_async(mp_image, stamp_ms)
                 is_inference_in_flight = True
             # else: 推論中は何もしない（バックログの肥大化を防止）
 
@@ -141,7 +145,7 @@ def run(model: str, max_results: int, score_threshold: float,
     finally:
         # 必ずリソースを解放
         detector.close()
-        picam2.stop()
+        source.stop()
         cv2.destroyAllWindows()
 
 
@@ -2,7 +2,7 @@
 
 import time
 import math
-import smbus
+import i2c_bus
 
 # ============================================================================
 # Raspi PCA9685 16-Channel PWM Servo Driver
@@ -25,28 +25,74 @@ class PCA9685:
   __ALLLED_ON_H        = 0xFB
   __ALLLED_OFF_L       = 0xFC
   __ALLLED_OFF_H       = 0xFD
+  __MODE1_AI           = 0x20    # register auto-increment
+  __MODE1_RESTART      = 0x80    # self-clearing, never kept in the shadow
+  __BLOCK_MAX          = 32      # SMBus block write limit (bytes)
 
 
-  def __init__(self, address=0x40, debug=False):
-    self.bus = smbus.SMBus(1)
+  def __init__(self, address=0x40, debug=False, bus=None):
+    self.bus = i2c_bus.as_shared(bus)    # shared with other drivers on bus 1
     self.address = address
     self.debug = debug
+    self.writeCount = 0    # write transactions sent to the chip
+    self.skipCount = 0     # write transactions suppressed by the shadow
+    self.tables = {}       # channel -> angle-to-tick table (see servo_calib.py)
+    self.invalidateCache()
     if (self.debug):
       print("Reseting PCA9685")
-    self.write(self.__MODE1, 0x00)
+    self.write(self.__MODE1, self.__MODE1_AI)
+
+  def invalidateCache(self):
+    "Forgets the register shadow, e.g. after the chip was reset or written by someone else"
+    self.shadow = [None] * 256
 	
-  def write(self, reg, value):
+  def write(self, reg, value, force=False):
     "Writes an 8-bit value to the specified register/address"
-    self.bus.write_byte_data(self.address, reg, value)
+    with self.bus.lock:
+      if not force and self.shadow[reg] == value:
+        self.skipCount += 1
+        return
+      self.bus.write_byte_data(self.address, reg, value)
+      self.writeCount += 1
+      self.shadow[reg] = value & ~self.__MODE1_RESTART if reg == self.__MODE1 else value
     if (self.debug):
       print("I2C: Write 0x%02X to register 0x%02X" % (value, reg))
 	  
+  def writeBlock(self, reg, values, force=False):
+    "Writes consecutive registers starting at reg in one transaction (MODE1 AI must be set)"
+    values = list(values)
+    with self.bus.lock:
+      if not force:
+        # Only send the span that differs from what the chip already holds
+        first = 0
+        last = len(values)
+        while first < last and self.shadow[reg+first] == values[first]:
+          first += 1
+        while last > first and self.shadow[reg+last-1] == values[last-1]:
+          last -= 1
+        if first == last:
+          self.skipCount += 1
+          return
+        reg += first
+        values = values[first:last]
+      self.bus.write_i2c_block_data(self.address, reg, values)
+      self.writeCount += 1
+      self.shadow[reg:reg+len(values)] = values
+    if (self.debug):
+      print("I2C: Write %s to registers 0x%02X.." % (" ".join("0x%02X" % v for v in values), reg))
+
   def read(self, reg):
     "Read an unsigned byte from the I2C device"
     result = self.bus.read_byte_data(self.address, reg)
     if (self.debug):
       print("I2C: Device 0x%02X returned 0x%02X from reg 0x%02X" % (self.address, result & 0xFF, reg))
     return result
+
+  def readCached(self, reg):
+    "Returns the shadowed register value, reading the chip only if it was never written"
+    if self.shadow[reg] is None:
+      self.shadow[reg] = self.read(reg)
+    return self.shadow[reg]
 	
   def setPWMFreq(self, freq):
     "Sets the PWM frequency"
@@ -61,35 +107,88 @@ class PCA9685:
     if (self.debug):
       print("Final pre-scale: %d" % prescale)
 
-    oldmode = self.read(self.__MODE1);
-    newmode = (oldmode & 0x7F) | 0x10        # sleep
-    self.write(self.__MODE1, newmode)        # go to sleep
-    self.write(self.__PRESCALE, int(math.floor(prescale)))
-    self.write(self.__MODE1, oldmode)
-    time.sleep(0.005)
-    self.write(self.__MODE1, oldmode | 0x80)
-    self.write(self.__MODE2, 0x04)
+    with self.bus.lock:
+      if self.shadow[self.__PRESCALE] == prescale:
+        self.skipCount += 1                    # already running at this frequency
+        self.write(self.__MODE2, 0x04)
+        return
+
+      oldmode = self.readCached(self.__MODE1)
+      newmode = (oldmode & 0x7F) | 0x10        # sleep
+      self.write(self.__MODE1, newmode)        # go to sleep
+      self.write(self.__PRESCALE, int(math.floor(prescale)))
+      self.write(self.__MODE1, oldmode)
+      time.sleep(0.005)
+      self.write(self.__MODE1, oldmode | 0x80)
+      self.write(self.__MODE2, 0x04)
 
   def setPWM(self, channel, on, off):
     "Sets a single PWM channel"
-    self.write(self.__LED0_ON_L+4*channel, on & 0xFF)
-    self.write(self.__LED0_ON_H+4*channel, on >> 8)
-    self.write(self.__LED0_OFF_L+4*channel, off & 0xFF)
-    self.write(self.__LED0_OFF_H+4*channel, off >> 8)
+    self.writeBlock(self.__LED0_ON_L+4*channel, [on & 0xFF, on >> 8, off & 0xFF, off >> 8])
     if (self.debug):
       print("channel: %d  LED_ON: %d LED_OFF: %d" % (channel,on,off))
+
+  def setPWMs(self, pwms):
+    "Sets several PWM channels, pwms = {channel: (on, off)}. Adjacent channels share one block write"
+    start = None
+    data = []
+    for channel in sorted(pwms):
+      on, off = pwms[channel]
+      if data and (channel != start + len(data) // 4 or len(data) + 4 > self.__BLOCK_MAX):
+        self.writeBlock(self.__LED0_ON_L+4*start, data)
+        data = []
+      if not data:
+        start = channel
+      data += [on & 0xFF, on >> 8, off & 0xFF, off >> 8]
+    if data:
+      self.writeBlock(self.__LED0_ON_L+4*start, data)
+
+  def setAllPWM(self, on, off):
+    "Sets all 16 channels at once through the ALL_LED registers"
+    data = [on & 0xFF, on >> 8, off & 0xFF, off >> 8]
+    leds = self.__LED0_ON_L
+    with self.bus.lock:
+      if self.shadow[leds:leds+64] == data * 16:
+        self.skipCount += 1
+        return
+      self.writeBlock(self.__ALLLED_ON_L, data, force=True)
+      self.shadow[leds:leds+64] = data * 16
+    if (self.debug):
+      print("all channels  LED_ON: %d LED_OFF: %d" % (on,off))
 	  
+  def pulseToTick(self, pulse):
+    "Quantizes a servo pulse (us) to a 12-bit tick, the PWM frequency must be 50HZ"
+    return int(pulse*4096/20000)    #PWM frequency is 50HZ,the period is 20000us
+
   def setServoPulse(self, channel, pulse):
     "Sets the Servo Pulse,The PWM frequency must be 50HZ"
-    pulse = pulse*4096/20000        #PWM frequency is 50HZ,the period is 20000us
-    self.setPWM(channel, 0, int(pulse))
+    self.setPWM(channel, 0, self.pulseToTick(pulse))
     
-  def setRotationAngle(self, channel, Angle): 
-    if(Angle >= 0 and Angle <= 180):
-        temp = Angle * (2000 / 180) + 501
-        self.setServoPulse(channel, temp)
+  def setServoPulses(self, pulses):
+    "Sets several servo pulses (us) at once, pulses = {channel: pulse}"
+    self.setPWMs({channel: (0, self.pulseToTick(pulse)) for channel, pulse in pulses.items()})
+
+  def setAngleTable(self, channel, table):
+    "Uses a precomputed angle-to-tick table (with soft limits) for the channel, None restores the default"
+    if table is None:
+      self.tables.pop(channel, None)
     else:
-        print("Angle out of range")
+      self.tables[channel] = table
+
+  def angleToTick(self, channel, Angle):
+    "Converts an angle to a 12-bit tick, clamping to the channel's limits"
+    table = self.tables.get(channel)
+    if table is not None:
+      return table.tick(Angle)
+    Angle = min(180, max(0, Angle))
+    return self.pulseToTick(Angle * (2000 / 180) + 501)
+
+  def setRotationAngle(self, channel, Angle): 
+    self.setPWM(channel, 0, self.angleToTick(channel, Angle))
+
+  def setRotationAngles(self, angles):
+    "Sets several servo angles in as few I2C transactions as possible, angles = {channel: angle}"
+    self.setPWMs({channel: (0, self.angleToTick(channel, Angle)) for channel, Angle in angles.items()})
         
   def start_PCA9685(self):
     self.write(self.__MODE2, 0x04)
@@ -0,0 +1,107 @@
+"""
+I2C バスを複数のドライバ・スレッドで安全に共有するためのマネージャ
+
+ポイント
+- get_bus(1) はバス番号ごとに SMBus を1つだけ開き、PCA9685 と TSL2591 で使い回す
+- 1回の読み書き（トランザクション）はロックで直列化されるので、
+  サーボ出力スレッドとセンサ読み取りが同時に動いても転送が混ざらない
+- 「読み出し→書き込み」のように途中で割り込まれたくない一連の操作は
+  `with bus.lock:` で囲む（RLock なので中で通常の読み書きを呼んでよい）
+- 環境変数 I2C_BACKEND=sim のときは実機の代わりに i2c_sim のシミュレータを使う
+  （set_backend() でテスト用のバスを直接差し込むこともできる）
+- 環境変数 I2C_TRACE を付けると全転送を i2c_trace で記録する（get_trace() で取り出せる）
+"""
+
+import atexit
+import os
+import threading
+
+_buses = {}
+_buses_lock = threading.Lock()
+
+
+class SharedBus:
+    """smbus.SMBus と同じ呼び方ができる、ロック付きのバス"""
+
+    def __init__(self, backend, busnum=None):
+        self.backend = backend
+        self.busnum = busnum
+        self.lock = threading.RLock()
+
+    def read_byte_data(self, addr, reg):
+        with self.lock:
+            return self.backend.read_byte_data(addr, reg)
+
+    def write_byte_data(self, addr, reg, value):
+        with self.lock:
+            self.backend.write_byte_data(addr, reg, value)
+
+    def read_word_data(self, addr, reg):
+        with self.lock:
+            return self.backend.read_word_data(addr, reg)
+
+    def write_word_data(self, addr, reg, value):
+        with self.lock:
+            self.backend.write_word_data(addr, reg, value)
+
+    def read_i2c_block_data(self, addr, reg, length):
+        with self.lock:
+            return self.backend.read_i2c_block_data(addr, reg, length)
+
+    def write_i2c_block_data(self, addr, reg, values):
+        with self.lock:
+            self.backend.write_i2c_block_data(addr, reg, values)
+
+    def close(self):
+        with self.lock:
+            self.backend.close()
+
+
+def open_backend(busnum):
+    """実際のバスを開く（Raspberry Pi では /dev/i2c-<busnum>）"""
+    if os.environ.get("I2C_BACKEND") == "sim":
+        import i2c_sim
+        backend = i2c_sim.from_env()
+    else:
+        import smbus
+        backend = smbus.SMBus(busnum)
+
+    trace = os.environ.get("I2C_TRACE")
+    if trace:
+        import i2c_trace
+        backend = i2c_trace.TracingBus(backend)
+        atexit.register(backend.dump, trace)
+    return backend
+
+
+def set_backend(backend, busnum=1):
+    """バス番号 busnum の中身を差し替える（ドライバを作る前に呼ぶ）"""
+    with _buses_lock:
+        bus = _buses[busnum] = SharedBus(backend, busnum)
+        return bus
+
+
+def get_bus(busnum=1):
+    """バス番号ごとに共有の SharedBus を返す（初回だけ開く）"""
+    with _buses_lock:
+        bus = _buses.get(busnum)
+        if bus is None:
+            bus = _buses[busnum] = SharedBus(open_backend(busnum), busnum)
+        return bus
+
+
+def get_trace(busnum=1):
+    """トレース中なら TracingBus を返す（I2C_TRACE が無ければ None）"""
+    bus = _buses.get(busnum)
+    if bus is not None and hasattr(bus.backend, "summary"):
+        return bus.backend
+    return None
+
+
+def as_shared(bus=None, busnum=1):
+    """ドライバ用: None なら共有バス、ロックを持たない SMBus なら SharedBus で包んで返す"""
+    if bus is None:
+        return get_bus(busnum)
+    if not hasattr(bus, "lock"):
+        return SharedBus(bus, busnum)
+    return bus
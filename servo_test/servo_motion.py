@@ -0,0 +1,147 @@
+"""
+サーボの動き（モーションプロファイル）を事前計算して再生するモジュール
+
+ポイント
+- 速度・加速度の上限からなめらかな角度の列を NumPy 配列で一度に計算する
+  - "trapezoid": 台形速度（加速 → 等速 → 減速）
+  - "scurve"   : S字（加速度も連続。躍度最小の5次多項式）
+- 複数軸の動きは、いちばん時間のかかる軸に合わせて同時に始まり同時に終わる
+- 再生は「開始時刻 + k * dt」の絶対時刻で行うので、sleep の誤差が積み重ならない
+
+使い方
+    traj = plan_move({0: 30, 1: 30}, {0: 150, 1: 90}, v_max=120, a_max=400)
+    play(pwm, traj)
+"""
+
+import time
+import numpy as np
+
+DEFAULT_DT = 0.02        # 1ステップの時間（秒）= 50Hz のサーボ周期
+DEFAULT_V_MAX = 120.0    # 最大角速度（度/秒）
+DEFAULT_A_MAX = 400.0    # 最大角加速度（度/秒^2）
+
+# 躍度最小（5次）プロファイルのピーク速度・加速度係数（距離 d, 時間 T に対して）
+_SCURVE_V_PEAK = 1.875          # v_peak = 1.875 * d / T
+_SCURVE_A_PEAK = 5.7735         # a_peak = 5.7735 * d / T^2
+
+
+class Trajectory:
+    """事前計算済みの多軸の動き。angles[k, i] が k ステップ目の channels[i] の角度。"""
+
+    def __init__(self, channels, angles, dt, tables=None):
+        self.channels = tuple(channels)
+        self.angles = angles
+        self.dt = dt
+        self.ticks = angles_to_ticks(angles, self.channels, tables)
+
+    def __len__(self):
+        return len(self.angles)
+
+    @property
+    def duration(self):
+        return (len(self.angles) - 1) * self.dt
+
+
+def angles_to_ticks(angles, channels, tables=None):
+    """
+    角度の表 angles[k, i] を 12bit の PWM カウントにまとめて変換する。
+    tables（PCA9685.tables）に校正済みの変換表があるチャネルは表引き、
+    無いチャネルは PCA9685.setRotationAngle の既定の式を使う。
+    """
+    ticks = np.empty(angles.shape, dtype=np.int32)
+    for i, ch in enumerate(channels):
+        table = tables.get(ch) if tables else None
+        if table is not None:
+            ticks[:, i] = table.ticks(angles[:, i])
+        else:
+            pulse = np.clip(angles[:, i], 0.0, 180.0) * (2000.0 / 180.0) + 501.0
+            ticks[:, i] = (pulse * 4096.0 / 20000.0).astype(np.int32)
+    return ticks
+
+
+def min_duration(distance, v_max=DEFAULT_V_MAX, a_max=DEFAULT_A_MAX, kind="trapezoid"):
+    """距離 distance（度）を速度・加速度の上限内で動くのに必要な最短時間（秒）"""
+    d = abs(float(distance))
+    if d == 0.0:
+        return 0.0
+    if kind == "scurve":
+        return max(_SCURVE_V_PEAK * d / v_max, np.sqrt(_SCURVE_A_PEAK * d / a_max))
+    if d >= v_max * v_max / a_max:
+        return d / v_max + v_max / a_max     # 等速区間あり
+    return 2.0 * np.sqrt(d / a_max)          # 三角形（最高速度に届かない）
+
+
+def profile(distance, duration, dt=DEFAULT_DT, a_max=DEFAULT_A_MAX, kind="trapezoid"):
+    """
+    0 から distance まで duration 秒で動く位置の列を返す（最後の要素は必ず distance）。
+    duration は min_duration() 以上であること。
+    """
+    n = max(int(np.ceil(duration / dt)), 1)
+    if distance == 0.0 or duration <= 0.0:
+        return np.full(n + 1, float(distance))
+
+    t = np.minimum(np.arange(n + 1) * dt, duration)
+    d = abs(float(distance))
+
+    if kind == "scurve":
+        tau = t / duration
+        s = d * tau ** 3 * (10.0 - 15.0 * tau + 6.0 * tau * tau)
+    else:
+        # duration で d を動くための巡航速度（加速度 a_max の台形）
+        disc = max((a_max * duration) ** 2 - 4.0 * a_max * d, 0.0)
+        v = (a_max * duration - np.sqrt(disc)) / 2.0
+        ta = v / a_max                        # 加速にかかる時間
+        s = np.where(
+            t < ta, 0.5 * a_max * t * t,
+            np.where(t < duration - ta,
+                     0.5 * a_max * ta * ta + v * (t - ta),
+                     d - 0.5 * a_max * (duration - t) ** 2))
+
+    s[-1] = d
+    return np.sign(distance) * s
+
+
+def plan_move(starts, goals, v_max=DEFAULT_V_MAX, a_max=DEFAULT_A_MAX,
+              dt=DEFAULT_DT, kind="trapezoid", tables=None):
+    """
+    複数軸の同期移動を計算する。
+    starts, goals : {channel: 角度}
+    v_max, a_max  : 全軸共通の値、または {channel: 値}
+    tables        : 校正済みの変換表（pwm.tables を渡す）
+    """
+    channels = sorted(goals)
+
+    def limit(value, ch):
+        return value[ch] if isinstance(value, dict) else value
+
+    # いちばん時間がかかる軸に全体の時間をそろえる
+    duration = max(min_duration(goals[ch] - starts[ch], limit(v_max, ch), limit(a_max, ch), kind)
+                   for ch in channels)
+    n = max(int(np.ceil(duration / dt)), 1)
+
+    angles = np.empty((n + 1, len(channels)))
+    for i, ch in enumerate(channels):
+        s = profile(goals[ch] - starts[ch], duration, dt, limit(a_max, ch), kind)
+        angles[:, i] = starts[ch] + s[:n + 1]
+    return Trajectory(channels, angles, dt, tables)
+
+
+def play(pwm, traj, t0=None):
+    """
+    事前計算した動きを PCA9685 に流す。
+    各ステップは t0 + k*dt の時刻に書き込み、遅れたときは現在時刻のステップまで飛ばす。
+    """
+    if t0 is None:
+        t0 = time.perf_counter()
+    ticks = traj.ticks.tolist()
+    channels = traj.channels
+    k = 0
+    while k < len(ticks):
+        pwm.setPWMs({ch: (0, tick) for ch, tick in zip(channels, ticks[k])})
+        if k == len(ticks) - 1:
+            break
+        now = time.perf_counter()
+        k = min(max(k + 1, int((now - t0) / traj.dt)), len(ticks) - 1)
+        delay = t0 + k * traj.dt - now
+        if delay > 0:
+            time.sleep(delay)
@@ -7,10 +7,19 @@ PCA9685 を使ってサーボモーターを動かすサンプル
 - PCA9685 は I2C 接続の 16チャネルPWMドライバ
 - setRotationAngle(チャネル, 角度) で簡単にサーボを動かせる
 - 角度は 0〜180 の範囲（サーボによって有効範囲は異なる）
+- 往復の動きは servo_motion で「加速→等速→減速」の角度列を先に計算して流す
+  （sleep を繰り返すより動きがなめらかで、時間もずれにくい）
 """
 
 import time
 from PCA9685 import PCA9685
+import servo_motion
+
+
+SWEEP_MIN = 30           # 往復の下限角度
+SWEEP_MAX = 150          # 往復の上限角度
+SWEEP_V_MAX = 10.0       # 最大角速度（度/秒）… 元の「1度/0.1秒」と同じ速さ
+SWEEP_A_MAX = 20.0       # 最大角加速度（度/秒^2）
 
 
 # ==========================================
@@ -33,19 +42,27 @@ try:
     # ==========================================
     # ② メインループ：角度をゆっくり往復させる
     # ==========================================
+    # ---- 0度 → 30度 へ（往復の開始位置まで）----
+    servo_motion.play(pwm, servo_motion.plan_move(
+        {0: 0, 1: 0}, {0: SWEEP_MIN, 1: SWEEP_MIN},
+        v_max=SWEEP_V_MAX * 3, a_max=SWEEP_A_MAX * 3))
+
+    # 往復の動きは毎回同じなので、ループの前に一度だけ計算しておく
+    # （チャネル0とチャネル1は同じタイミングで動く）
+    go = servo_motion.plan_move(
+        {0: SWEEP_MIN, 1: SWEEP_MIN}, {0: SWEEP_MAX, 1: SWEEP_MAX},
+        v_max=SWEEP_V_MAX, a_max=SWEEP_A_MAX, kind="scurve")
+    back = servo_motion.plan_move(
+        {0: SWEEP_MAX, 1: SWEEP_MAX}, {0: SWEEP_MIN, 1: SWEEP_MIN},
+        v_max=SWEEP_V_MAX, a_max=SWEEP_A_MAX, kind="scurve")
+
     while True:
 
-        # ---- 0度 → 150度 へゆっくり動かす ----
-        for angle in range(30, 150, 1):
-            pwm.setRotationAngle(0, angle)   # チャネル0を動かす
-            pwm.setRotationAngle(1, angle)   # チャネル1も同じ動作
-            time.sleep(0.1)                  # 100ms待つ（ゆっくり動かすため）
+        # ---- 30度 → 150度 へゆっくり動かす ----
+        servo_motion.play(pwm, go)
 
         # ---- 150度 → 30度 に戻す ----
-        for angle in range(150, 30, -1):
-            pwm.setRotationAngle(0, angle)
-            pwm.setRotationAngle(1, angle)
-            time.sleep(0.1)
+        servo_motion.play(pwm, back)
 
 except KeyboardInterrupt:
     # Ctrl+C で止めたときに安全に終了
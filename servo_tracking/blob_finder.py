@@ -0,0 +1,122 @@
+"""
+2値マスクから「面積の大きい順に K 個」の物体だけを取り出す（ラベル画像を作らない）
+
+ポイント
+- connectedComponentsWithStats は、ほしいのが一番大きい1個だけでも
+    画素ごとのラベル番号（int32 = 1画素4バイト）の画像
+  を毎フレーム書き出し、すべての物体の統計を作る
+  （640x480 なら 1.2 MB の確保と書き込み。Pi 4 ではメモリの速さが効いてくる）
+- largest_blobs は物体の外周と穴のまわり（findContours の RETR_CCOMP の2階層）をたどり、
+  輪郭のモーメント（外周 − 穴）から面積・重心、boundingRect から外接矩形を求める
+    輪郭の点だけを扱うので、物体の中身の画素には触らない
+- 外接矩形の面積は物体の面積より必ず大きいので、外接矩形の面積が
+  「今の K 番目の面積」以下の輪郭はモーメントを計算せずに捨てる（早めの打ち切り）
+- 面積は輪郭（画素の中心を結んだ多角形）の面積なので、画素数より外周の半画素ぶん小さい
+  線や点のような面積 0 の輪郭は数えない（開処理をしたマスクならノイズだけ）
+- 結果は1行 = (cx, cy, x, y, w, h, area) の配列（roi_tracker.Blob と同じ並び）
+  scale・offset を渡すと、縮小したマスクや探索窓の座標を画面全体の座標に直して返す
+
+使い方
+    blobs = largest_blobs(mask, k=1, scale=0.5, offset=(x0, y0))
+    if len(blobs):
+        blob = Blob(*blobs[0])
+"""
+
+import numpy as np
+import cv2
+
+COLUMNS = ("cx", "cy", "x", "y", "w", "h", "area")
+
+
+def largest_blobs(mask, k=1, min_area=0.0, scale=1.0, offset=(0, 0)):
+    """
+    mask（0 / 255 の uint8）の中で面積の大きい順に最大 k 個の物体を返す
+    戻り値: shape (n, 7) の float64 配列（n <= k。列は COLUMNS の順、面積の大きい順）
+    min_area はマスクの画素で数えた面積、戻り値は scale・offset で直した座標・面積
+    """
+    contours, hierarchy = cv2.findContours(mask, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+    if hierarchy is None:
+        return np.empty((0, len(COLUMNS)), np.float64)
+    hierarchy = hierarchy[0]    # 輪郭ごとに [次, 前, 最初の子（穴）, 親]
+    best = []                   # [(area, 輪郭の番号, 外接矩形)] を面積の大きい順に最大 k 個
+    floor = min_area            # これ以下の面積の物体は要らない
+    for i, contour in enumerate(contours):
+        if hierarchy[i][3] >= 0:            # 穴のまわりの輪郭は、外周の側でまとめて扱う
+            continue
+        x, y, w, h = cv2.boundingRect(contour)
+        if w * h <= floor:                  # 外接矩形に収まらない＝K 番目に届かない
+            continue
+        area = cv2.contourArea(contour)
+        area -= sum(cv2.contourArea(contours[j]) for j in _holes(hierarchy, i))
+        if area <= floor:
+            continue
+        best.append((area, i, (x, y, w, h)))
+        best.sort(key=lambda b: b[0], reverse=True)
+        if len(best) > k:
+            best.pop()
+        if len(best) == k:
+            floor = max(min_area, best[-1][0])
+
+    out = np.empty((len(best), len(COLUMNS)), np.float64)
+    for row, (area, i, rect) in zip(out, best):
+        m00, m10, m01 = _moments(contours[i])
+        for j in _holes(hierarchy, i):
+            h00, h10, h01 = _moments(contours[j])
+            m00, m10, m01 = m00 - h00, m10 - h10, m01 - h01
+        row[0] = m10 / m00
+        row[1] = m01 / m00
+        row[2:6] = rect
+        row[6] = area
+    if scale != 1.0:
+        s = 1.0 / scale
+        out[:, :6] *= s
+        out[:, 6] *= s * s
+    out[:, 0:4] += (offset[0], offset[1], offset[0], offset[1])
+    return out
+
+
+def _holes(hierarchy, i):
+    """外周の輪郭 i の中にある穴の輪郭の番号"""
+    j = hierarchy[i][2]
+    while j >= 0:
+        yield j
+        j = hierarchy[j][0]
+
+
+def _moments(contour):
+    m = cv2.moments(contour)
+    return m["m00"], m["m10"], m["m01"]
+
+
+if __name__ == "__main__":
+    # connectedComponentsWithStats との速さ・結果の比較（合成映像の赤い円）
+    import time
+    from frame_source import SyntheticSource
+    from color_lut import ColorLUT
+
+    RED = [((0, 120, 70), (10, 255, 255)), ((170, 120, 70), (179, 255, 255))]
+    lut = ColorLUT({"red": RED}, order="BGR")
+    source = SyntheticSource(pace="fast")
+    masks = [lut.mask(source.read().image, "red").copy() for _ in range(100)]
+
+    def by_labels(mask):
+        n, labels, stats, centroids = cv2.connectedComponentsWithStats(mask)
+        if n < 2:
+            return None
+        i = int(np.argmax(stats[1:, cv2.CC_STAT_AREA])) + 1
+        return centroids[i], stats[i]
+
+    for label, func in [("connectedComponentsWithStats", by_labels),
+                        ("largest_blobs(k=1)", lambda m: largest_blobs(m, k=1))]:
+        func(masks[0])
+        t0 = time.perf_counter()
+        for m in masks:
+            func(m)
+        print(f"{label}: {(time.perf_counter() - t0) / len(masks) * 1e3:.3f} ms/フレーム")
+
+    errors = []
+    for m in masks:
+        ref, got = by_labels(m), largest_blobs(m, k=1)
+        if ref is not None and len(got):
+            errors.append(np.hypot(*(got[0, :2] - ref[0])))
+    print(f"重心の差: 平均 {np.mean(errors):.3f} px、最大 {np.max(errors):.3f} px")
@@ -0,0 +1,177 @@
+"""
+HSV の色範囲を「色 → 分類番号」の表（ルックアップテーブル）にしておき、1回の表引きで色を分ける
+
+ポイント
+- これまでの red_mask_rgb は毎フレーム
+    ぼかし → HSV 変換 → inRange ×2 → bitwise_or → 開処理 → 閉処理
+  と画像全体を何度もなめていた
+- ColorLUT は起動時に1回だけ、量子化した RGB のすべての色（既定は各 6bit = 64段階）を
+  HSV に変換して範囲に入るかを調べ、表にしておく（作り直しは色の範囲を変えたときだけ）
+- 毎フレームの処理は
+    縮小（INTER_AREA。ぼかしの代わりにもなる）→ 表引き1回 → 開処理・閉処理（小さい画像で）
+  開処理・閉処理の核も scale 倍にする（元の大きさで 3x3 なら、1/2 で 2x2、1/4 では 1x1 = しない）
+  縮小した画像に 3x3 のままかけると、元の大きさでは 6x6・12x12 の核と同じになり、
+  まだらな物体が細かく割れてしまう（割れた小さい方を「いちばん大きい物体」と取り違える）
+  縮小しないとき（scale=1.0）は、これまでと同じ GaussianBlur(5, 5) を縮小の代わりにかける
+  （blur=None でぼかしなし）
+- 表の番号は「3ch まとめて右シフト1回 → cv2.transform で重み付きの和1回」で作る
+- 速くなるのは縮小したとき（320x240 でこれまでの 1/3〜1/4 ほどの時間）
+  640x480 のままだと、表引きは HSV 変換＋inRange より速いが、ぼかしのぶんでほぼ同じ時間になる
+- 範囲の決め方（OpenCV の HSV。H は 0〜179）とマスクの意味（0 / 255）はこれまでと同じ
+- 色を変えたいときはコードではなく範囲を渡して表を作り直すだけ。複数の色も1枚の表で分けられる
+- 入力の色の並びは order で指定する（スクリプトによって違うので注意）
+    order="RGB" … cvtColor(BGR2RGB) した frame_rgb を渡す場合（red_color_tracking.py など）
+    order="BGR" … Picamera2 の "RGB888" をそのまま渡す場合（メモリ上は B, G, R の順。
+                  pid_red_color_servo_tracking.py は COLOR_BGR2HSV で処理していた）
+
+使い方
+    RED = [((0, 120, 70), (10, 255, 255)), ((170, 120, 70), (179, 255, 255))]
+    lut = ColorLUT({"red": RED}, order="RGB")
+    mask = lut.mask(frame_rgb, "red", scale=0.5)      # 320x240 のマスク（0 / 255）
+    labels = lut.classify(frame_rgb)                   # 分類番号（0 = どれでもない）
+
+    $ python3 color_lut.py          # これまでの処理との速さ・一致率の比較
+"""
+
+import time
+
+import numpy as np
+import cv2
+
+from buffer_pool import BufferPool
+
+ORDERS = {"RGB": cv2.COLOR_RGB2HSV, "BGR": cv2.COLOR_BGR2HSV}
+
+
+class ColorLUT:
+    def __init__(self, classes, order="RGB", bits=6, kernel_size=(3, 3), blur=(5, 5)):
+        """
+        classes: {名前: [(HSV下限, HSV上限), ...]}（範囲のどれかに入れば、その色）
+        先に書いた色が優先。分類番号は書いた順に 1, 2, ...（0 = どれでもない）
+        blur: 縮小しないときにかける GaussianBlur の大きさ（None でかけない）
+        """
+        if order not in ORDERS:
+            raise ValueError(f"order は {tuple(ORDERS)} のどちらか: {order!r}")
+        self.order = order
+        self.bits = bits
+        self.names = list(classes)
+        self.kernel_size = tuple(kernel_size)
+        self.kernel = np.ones(kernel_size, np.uint8)
+        self._kernels = {1.0: self.kernel}      # scale -> その大きさの画像で使う核（None = しない）
+        self.blur = blur
+        self._buffers = BufferPool()    # 作業用の配列（毎フレーム確保しない。大きさが変わっても使い回す）
+        self.build(classes)
+
+    # ---- 表を作る ----
+    def build(self, classes):
+        """範囲から表を作り直す（色を変えたいときはこれを呼ぶ）"""
+        self.names = list(classes)
+        n = 1 << self.bits
+        shift = 8 - self.bits
+        # 量子化したそれぞれの区間のまん中の色を、表の並び（c0, c1, c2）で並べる
+        levels = (np.arange(n, dtype=np.uint16) << shift) + ((1 << shift) >> 1)
+        c0, c1, c2 = np.meshgrid(levels, levels, levels, indexing="ij")
+        grid = np.stack([c0, c1, c2], axis=-1).astype(np.uint8).reshape(n * n, n, 3)
+        hsv = cv2.cvtColor(grid, ORDERS[self.order])
+
+        table = np.zeros(n * n * n, np.uint8)
+        for class_id, name in reversed(list(enumerate(self.names, 1))):   # 先の色が上書きして優先
+            hit = np.zeros(hsv.shape[:2], np.uint8)
+            for lower, upper in classes[name]:
+                hit |= cv2.inRange(hsv, np.array(lower, np.uint8), np.array(upper, np.uint8))
+            table[hit.reshape(-1) > 0] = class_id
+        self.table = table
+        self.mask_tables = {name: np.where(table == i, 255, 0).astype(np.uint8)
+                            for i, name in enumerate(self.names, 1)}
+        self._shift = shift
+        # 量子化した (c0, c1, c2) → 表の番号 の重み（XRGB8888 の4ch目は重み 0 で使わない）
+        weights = [1 << (2 * self.bits), 1 << self.bits, 1]
+        self._weights = {3: np.array([weights], np.float32),
+                         4: np.array([weights + [0]], np.float32)}
+
+    # ---- 1フレーム ----
+    def classify(self, img, scale=1.0, out="out"):
+        """
+        画素ごとの分類番号（uint8。0 = どれでもない）
+        返す配列は、同じ out（置き場所の名前）での次の呼び出しで上書きされる
+        """
+        return self._lookup(img, self.table, scale, out)
+
+    def mask(self, img, name, scale=1.0, clean=True, out="out"):
+        """
+        name の色の2値マスク（0 / 255）。scale < 1 なら縮小した大きさで返す
+        clean=True で小ノイズ除去＆穴埋め（開→閉）も行う（核は kernel_size を scale 倍したもの）
+        返す配列は、同じ out（置き場所の名前）での次の呼び出しで上書きされる
+        （前の結果を残しておきたいときは、別の out を渡す）
+        """
+        mask = self._lookup(img, self.mask_tables[name], scale, out)
+        kernel = self._kernel(scale) if clean else None
+        if kernel is not None:
+            cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, dst=mask)
+            cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, dst=mask)
+        return mask
+
+    def _kernel(self, scale):
+        """元の大きさの kernel_size と同じ広さになる、scale 倍の画像用の核（1x1 になるなら None）"""
+        if scale not in self._kernels:
+            size = tuple(max(1, int(round(k * scale))) for k in self.kernel_size)
+            self._kernels[scale] = np.ones(size, np.uint8) if max(size) > 1 else None
+        return self._kernels[scale]
+
+    def _lookup(self, img, table, scale, out):
+        h, w = img.shape[:2]
+        if scale != 1.0:
+            h, w = int(h * scale), int(w * scale)
+            small = self._buffers.get("small", (h, w, img.shape[2]))
+            img = cv2.resize(img, (w, h), dst=small, interpolation=cv2.INTER_AREA)
+        elif self.blur:
+            img = cv2.GaussianBlur(img, self.blur, 0, dst=self._buffers.like("blur", img))
+
+        # 表の番号 = (c0 >> s) << 2b | (c1 >> s) << b | (c2 >> s)
+        # 右シフトは全チャンネルまとめて1回、和は cv2.transform 1回（2^18 未満なので float32 で正確）
+        quant = np.right_shift(img, self._shift, out=self._buffers.like("quant", img))
+        quant_f = self._buffers.get("quant_f", img.shape, np.float32)
+        np.copyto(quant_f, quant)
+        index_f = cv2.transform(quant_f, self._weights[img.shape[2]],
+                                dst=self._buffers.get("index_f", (h, w), np.float32))
+        index = self._buffers.get("index", (h, w), np.int32)
+        np.copyto(index, index_f, casting="unsafe")
+        return np.take(table, index, out=self._buffers.get(out, (h, w)))
+
+
+if __name__ == "__main__":
+    # これまでの red_mask_rgb と比べる（合成映像の赤い円、RGB の並びで）
+    from frame_source import SyntheticSource
+
+    RED = [((0, 120, 70), (10, 255, 255)), ((170, 120, 70), (179, 255, 255))]
+    kernel = np.ones((3, 3), np.uint8)
+
+    def red_mask_classic(img_rgb):
+        blur = cv2.GaussianBlur(img_rgb, (5, 5), 0)
+        hsv = cv2.cvtColor(blur, cv2.COLOR_RGB2HSV)
+        mask = cv2.bitwise_or(cv2.inRange(hsv, np.array(RED[0][0], np.uint8), np.array(RED[0][1], np.uint8)),
+                              cv2.inRange(hsv, np.array(RED[1][0], np.uint8), np.array(RED[1][1], np.uint8)))
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+        return cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+
+    t0 = time.perf_counter()
+    lut = ColorLUT({"red": RED}, order="RGB")
+    print(f"表の作成: {(time.perf_counter() - t0) * 1e3:.0f} ms（{lut.table.nbytes // 1024} KB）")
+    lut_no_blur = ColorLUT({"red": RED}, order="RGB", blur=None)
+
+    source = SyntheticSource(pace="fast")
+    frames = [cv2.cvtColor(source.read().image, cv2.COLOR_BGR2RGB) for _ in range(100)]
+    tests = [("これまで（640x480）", red_mask_classic),
+             ("表引き（640x480）", lambda im: lut.mask(im, "red")),
+             ("表引き（640x480・ぼかしなし）", lambda im: lut_no_blur.mask(im, "red")),
+             ("表引き（320x240）", lambda im: lut.mask(im, "red", scale=0.5))]
+    for label, func in tests:
+        func(frames[0])
+        t0 = time.perf_counter()
+        for im in frames:
+            func(im)
+        dt = (time.perf_counter() - t0) / len(frames)
+        # 一致率（縮小したマスクは元の大きさに戻して比べる）
+        ref = red_mask_classic(frames[-1]) > 0
+        got = cv2.resize(func(frames[-1]), ref.shape[::-1], interpolation=cv2.INTER_NEAREST) > 0
+        print(f"{label}: {dt * 1e3:.2f} ms/フレーム  一致率 {np.mean(ref == got) * 100:.2f}%")
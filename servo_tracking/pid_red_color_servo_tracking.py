@@ -7,14 +7,23 @@ Raspberry Pi + PiCamera2 + OpenCV + PCA9685 (2軸サーボ)
 - PID（比例・積分・微分）で「1フレームあたりの角度変化 Δθ」を求める
 - 現在角度に Δθ を足して更新（角度は物理範囲内にクリップ）
 - 積分は風上制御（アンチワインドアップ）付き、微分は簡易フィルタ付き
+- フレームは frame_grabber が別スレッドで撮り続け、PID の dt は撮影時刻の差で計る
+- 2回目以降は前回見つかったあたり（roi_tracker の探索窓）だけを処理する
+- 最大の物体は blob_finder が輪郭から求める（ラベル画像を作らない）
+- 探すのは縮小した画像、重心は元の大きさの画像で求め直す（pyramid。TIME_BUDGET_MS で縮小率を自動に）
 """
 
 import time
 import numpy as np
 import cv2
-from picamera2 import Picamera2
-from libcamera import controls
+from frame_source import open_source
+from color_lut import ColorLUT
+from roi_tracker import RoiTracker, Blob
+from blob_finder import largest_blobs
+from pyramid import ScaleChooser, refine_centroid
 from PCA9685 import PCA9685
+from servo_worker import ServoWorker
+from servo_calib import load_calibration, apply_calibration
 
 # ====== 基本設定 ======
 FRAME_SIZE = (640, 480)      # 取得フレーム (W, H)
@@ -25,13 +34,12 @@ WINDOW_CAMERA = 'RaspiCam_Live'
 SERVO_FREQ_HZ = 50
 SERVO_CH_X = 0                # 左右
 SERVO_CH_Y = 1                # 上下
-SERVO_MIN = 30
-SERVO_MAX = 150
-SERVO_CENTER_X = 90
-SERVO_CENTER_Y = 90
+# 角度の範囲・中心・回転の向きはサーボごとに servo_calib.json で設定する
 
 # 画像処理（赤色抽出）用パラメータ
-GAUSS_KERNEL = (5, 5)
+MASK_SCALE = 0.5              # マスクを作る大きさ（縮小はぼかしの代わりにもなる。0.25 / 0.5 / 1.0）
+TIME_BUDGET_MS = None         # 例: 5 → マスク作成〜重心の計算がこの時間に収まるよう MASK_SCALE を自動で選ぶ
+ROI_TRACKING = True           # True: 前回見つかったあたりだけを処理（roi_tracker）
 MORPH_KERNEL = (3, 3)
 HSV_RED_RANGE_1 = (np.array([0,   120, 70],  dtype=np.uint8),
                    np.array([10,  255, 255], dtype=np.uint8))
@@ -41,8 +49,7 @@ HSV_RED_RANGE_2 = (np.array([170, 120, 70],  dtype=np.uint8),
 # 追尾安定化
 CENTER_DEADBAND_PX = 12       # 中心まわりのデッドバンド（この範囲内の誤差は0扱い）
 MAX_DEG_PER_FRAME = 6.0       # 1フレームに追加できる角度の上限（暴れ防止）
-SIGN_X = 1   # X方向の追従向き。逆なら -1、合っていれば +1
-SIGN_Y = 1   # Y方向の追従向き。逆なら -1、合っていれば +1
+# 追従の向きが逆なら servo_calib.json の "direction" を -1 にする
 
 # ====== PID コントローラ ======
 class PIDController:
@@ -107,38 +114,36 @@ class PIDController:
         return u
 
 
-# ====== 赤色マスク作成（入力はRGB） ======
-def red_mask_rgb(img_rgb: np.ndarray) -> np.ndarray:
-    blur = cv2.GaussianBlur(img_rgb, GAUSS_KERNEL, 0)
-    hsv = cv2.cvtColor(blur, cv2.COLOR_BGR2HSV)
+# ====== 赤色マスク作成 ======
+# このスクリプトはカメラのフレームを変換せずに渡す（"RGB888" はメモリ上 B, G, R の順）。
+# これまでも COLOR_BGR2HSV で変換していたので、表も order="BGR" で作る
+red_lut = ColorLUT({"red": [HSV_RED_RANGE_1, HSV_RED_RANGE_2]}, order="BGR",
+                   kernel_size=MORPH_KERNEL)
 
-    (l1, u1) = HSV_RED_RANGE_1
-    (l2, u2) = HSV_RED_RANGE_2
-    m1 = cv2.inRange(hsv, l1, u1)
-    m2 = cv2.inRange(hsv, l2, u2)
-    mask = cv2.bitwise_or(m1, m2)
 
-    kernel = np.ones(MORPH_KERNEL, np.uint8)
-    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
-    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=1)
-    return mask
+def red_mask_rgb(img_rgb: np.ndarray, scale: float = MASK_SCALE) -> np.ndarray:
+    """縮小 → 表引き1回 → 開→閉（マスクは入力の scale 倍の大きさ）"""
+    return red_lut.mask(img_rgb, "red", scale=scale)
 
 
 # ====== カメラ & サーボ初期化 ======
-picam2 = Picamera2()
-picam2.configure(picam2.create_preview_configuration(
-    main={"format": "RGB888", "size": FRAME_SIZE}
-))
-picam2.start()
-picam2.set_controls({"AfMode": controls.AfModeEnum.Continuous})
+# 取得は別スレッド（上下反転もそこで）。FRAME_SOURCE=synth なら合成映像
+source = open_source(FRAME_SIZE, "RGB888", flip=0)
 
 pwm = PCA9685()
 pwm.setPWMFreq(SERVO_FREQ_HZ)
+calib = apply_calibration(pwm, load_calibration())
+cal_x = calib[SERVO_CH_X]
+cal_y = calib[SERVO_CH_Y]
 
-sx = SERVO_CENTER_X
-sy = SERVO_CENTER_Y
-pwm.setRotationAngle(SERVO_CH_X, sx)
-pwm.setRotationAngle(SERVO_CH_Y, sy)
+sx = cal_x.center
+sy = cal_y.center
+pwm.setRotationAngles({SERVO_CH_X: sx, SERVO_CH_Y: sy})  # 2軸まとめて1回のI2C転送
+
+# サーボへの書き込みは別スレッドで 50Hz ごとに最新の目標だけを反映
+# （メインループは I2C の完了を待たない）
+servo = ServoWorker(pwm, rate_hz=SERVO_FREQ_HZ)
+servo.start()
 
 # ====== PID ゲイン（最初はPとDだけでOK） ======
 # 画面誤差(px) → 角度変化(°)に換算する係数として機能します。
@@ -150,48 +155,73 @@ pid_y = PIDController(kp=0.035, ki=0.000, kd=0.001,
                       out_min=-MAX_DEG_PER_FRAME, out_max=MAX_DEG_PER_FRAME,
                       i_min=-15.0, i_max=15.0, d_alpha=0.25)
 
-# 時間計測
-t_prev = time.perf_counter()
+# 時間計測（前に処理したフレームの撮影時刻）
+t_prev = None
+
+# 縮小率（TIME_BUDGET_MS が None なら MASK_SCALE のまま）
+chooser = ScaleChooser(TIME_BUDGET_MS, scale=MASK_SCALE)
+
+# 探索窓（座標は縮小したマスクの画素にそろうよう、1/縮小率 の倍数に）
+tracker = RoiTracker(FRAME_SIZE)
 
 try:
     while True:
         # === フレーム取得（RGB） ===
-        frame_rgb = picam2.capture_array()
-        frame_rgb = cv2.flip(frame_rgb, 0)  # 取り付け向きに合わせて
+        frame = source.read()
+        if frame is None:
+            if source.finished:
+                break
+            continue
+        frame_rgb = frame.image  # 取り付け向きに合わせて反転済み
+
+        # === 赤マスク & 最大の物体 ===
+        # 前回の位置・大きさ・速さから決めた窓の中だけを処理する（見失うと広げ、やがて画面全体）
+        scale = chooser.scale
+        tracker.align = int(round(1 / scale))
+        if ROI_TRACKING:
+            x0, y0, x1, y1 = tracker.window(frame.timestamp)
+        else:
+            x0, y0, x1, y1 = tracker.full_frame()
+        t_start = time.perf_counter()
+        mask = red_mask_rgb(frame_rgb[y0:y1, x0:x1], scale)
+        cv2.imshow(WINDOW_MASK, mask)
+        # 面積の大きい順に1個（座標・大きさ・面積は scale と窓の位置から画面全体のものに直してある）
+        blobs = largest_blobs(mask, k=1, scale=scale, offset=(x0, y0))
 
-        # === 赤マスク & ラベリング ===
-        mask = red_mask_rgb(frame_rgb)
-        nLabels, labelImg, stats, centroids = cv2.connectedComponentsWithStats(mask)
+        blob = None
+        if len(blobs):
+            cx, cy = blobs[0, 0], blobs[0, 1]
+            x, y, w, h, area = (int(v) for v in blobs[0, 2:])
+
+            # 縮小したマスクの重心は粗いので、元の画像の外接矩形のまわりだけで求め直す
+            if scale < 1.0:
+                refined = refine_centroid(red_lut, "red", frame_rgb, x, y, w, h, pad=2 * tracker.align)
+                if refined is not None:
+                    cx, cy = refined
+            blob = Blob(cx, cy, x, y, w, h, area)
+
+        # 処理時間から次のフレームの縮小率を決める（TIME_BUDGET_MS があるときだけ変わる）
+        chooser.update(time.perf_counter() - t_start)
 
         # 表示用に変換（OpenCVのimshowはBGR）
         frame_bgr = frame_rgb
 #        frame_bgr = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2BGR)
-        cv2.imshow(WINDOW_MASK, mask)
 
         # 画面中心
         x_center = FRAME_SIZE[0] / 2.0
         y_center = FRAME_SIZE[1] / 2.0
 
-        # 経過時間
-        t_now = time.perf_counter()
-        dt = t_now - t_prev
-        t_prev = t_now
+        # 経過時間（撮影時刻の差。処理が遅れて間のフレームを飛ばしても正しい dt になる）
+        dt = frame.timestamp - t_prev if t_prev is not None else 0.0
+        t_prev = frame.timestamp
 
-        if nLabels > 1:
-            # 背景を除いて最大面積のラベルを選択
-            areas = stats[1:, cv2.CC_STAT_AREA]
-            max_idx = int(np.argmax(areas)) + 1
-            cx, cy = centroids[max_idx]
+        if blob is not None:
+            cx, cy, x, y, w, h, area = blob
 
             # 可視化（バウンディングボックスなど）
-            x = int(stats[max_idx, cv2.CC_STAT_LEFT])
-            y = int(stats[max_idx, cv2.CC_STAT_TOP])
-            w = int(stats[max_idx, cv2.CC_STAT_WIDTH])
-            h = int(stats[max_idx, cv2.CC_STAT_HEIGHT])
-            area = int(stats[max_idx, cv2.CC_STAT_AREA])
             cv2.circle(frame_bgr, (int(cx), int(cy)), 10, (0, 255, 0), 2)
             cv2.rectangle(frame_bgr, (x, y), (x + w, y + h), (0, 255, 0), 2)
-            cv2.putText(frame_bgr, f"area:{area}",
+            cv2.putText(frame_bgr, f"area:{area} scale:{scale:g}",
                         (x, max(0, y - 5)),
                         cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1, cv2.LINE_AA)
 
@@ -199,17 +229,21 @@ try:
             err_x = (cx - x_center)
             err_y = (cy - y_center)
 
-            # …PIDの出力を適用するときに向きを乗じる
-            dtheta_x = SIGN_X * pid_x.update(error=err_x, meas=cx, dt=dt)
-            dtheta_y = SIGN_Y * pid_y.update(error=err_y, meas=cy, dt=dt)
+            # …PIDの出力（向きは校正値の direction で反映される）
+            dtheta_x = pid_x.update(error=err_x, meas=cx, dt=dt)
+            dtheta_y = pid_y.update(error=err_y, meas=cy, dt=dt)
 
-            sx = float(np.clip(sx + dtheta_x, SERVO_MIN, SERVO_MAX))
-            sy = float(np.clip(sy + dtheta_y, SERVO_MIN, SERVO_MAX))
+            sx = cal_x.clamp(sx + dtheta_x)
+            sy = cal_y.clamp(sy + dtheta_y)
 
 
             # 実機に反映
-            pwm.setRotationAngle(SERVO_CH_X, sx)
-            pwm.setRotationAngle(SERVO_CH_Y, sy)
+            servo.set_angles({SERVO_CH_X: sx, SERVO_CH_Y: sy})
+
+        # 探索窓を更新し、画面に描く（画面全体を探しているときは描かない）
+        tracker.update(blob, frame.timestamp)
+        if (x0, y0, x1, y1) != tracker.full_frame():
+            cv2.rectangle(frame_bgr, (x0, y0), (x1 - 1, y1 - 1), (200, 200, 200), 1)
 
         cv2.imshow(WINDOW_CAMERA, frame_bgr)
 
@@ -219,6 +253,7 @@ try:
 
 finally:
     # 後始末（例外があっても必ず通る）
+    servo.stop()
     pwm.exit_PCA9685()
-    picam2.stop()
+    source.stop()
     cv2.destroyAllWindows()
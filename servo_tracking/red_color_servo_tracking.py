@@ -6,6 +6,15 @@ Raspberry Pi + PiCamera2 + OpenCV + PCA9685 (サーボ2軸) で
 - PiCamera2 は RGB でフレームを返すので、処理用は RGB のまま扱う。
 - OpenCV の表示は BGR 前提なので、表示直前にだけ BGR に変換する。
 - 例外が起きても確実にリソース解放できるよう try/finally を使う。
+- フレームは frame_grabber が別スレッドで撮り続ける。処理中も撮影が進むので、
+  ループは待たずに最新のフレームを受け取れる。
+- 環境変数 FRAME_SOURCE=synth などで、カメラの代わりに合成映像や動画ファイルを使える。
+- 一度見つけたら、前回の位置のまわり（roi_tracker の探索窓）だけを処理する。
+  見失うと窓を広げ、何回か続けて見失うと画面全体を探し直す。
+- 最大の物体は blob_finder が輪郭から求める（画素ごとのラベル画像は作らない）。
+- 色の変換の出力先は buffer_pool の配列を使い回す（フレームごとに新しい配列を確保しない）。
+- 物体は縮小した画像で探し、重心だけ元の大きさの画像で求め直す（pyramid）。
+  TIME_BUDGET_MS を決めると、その時間に収まるよう縮小率（1, 1/2, 1/4）を自動で選ぶ。
 """
 
 # ===== ライブラリ読み込み =====
@@ -14,11 +23,17 @@ import numpy as np
 import cv2
 
 # PiCamera2（カメラ制御）
-from picamera2 import Picamera2
-from libcamera import controls
+from frame_source import open_source
+from color_lut import ColorLUT
+from roi_tracker import RoiTracker, Blob
+from blob_finder import largest_blobs
+from pyramid import ScaleChooser, refine_centroid
+from buffer_pool import BufferPool
 
 # サーボ制御（PCA9685）
 from PCA9685 import PCA9685
+from servo_worker import ServoWorker
+from servo_calib import load_calibration, apply_calibration
 
 # ===== 定数（意味のある名前をつける） =====
 FRAME_SIZE = (640, 480)          # 取得するフレームの解像度 (幅, 高さ)
@@ -30,125 +45,136 @@ HSV_RED_RANGE_2 = (np.array([170, 120, 70], dtype=np.uint8),
 SERVO_FREQ_HZ = 50               # PCA9685 のPWM周波数（サーボは一般に 50Hz）
 SERVO_CH_X = 0                   # X方向（左右）サーボのチャンネル番号
 SERVO_CH_Y = 1                   # Y方向（上下）サーボのチャンネル番号
-SERVO_MIN = 30                   # 物理的に無理のない最小角度（環境に応じて調整）
-SERVO_MAX = 150                  # 物理的に無理のない最大角度（環境に応じて調整）
-SERVO_CENTER_X = 90              # 初期角度（X）
-SERVO_CENTER_Y = 90              # 初期角度（Y）
+# 無理のない角度の範囲・初期角度・回転の向きは servo_calib.json で設定する
 SERVO_STEP = 2                   # 1回の更新で動かす角度（大きいと速いが振動しやすい）
 
 CENTER_MARGIN_PX = 20            # 画面中心の「許容マージン」（ピクセル）
-MORPH_KERNEL_SIZE = (3, 3)       # ノイズ除去のカーネルサイズ
-GAUSS_KERNEL_SIZE = (5, 5)       # ぼかしのカーネルサイズ
+MORPH_KERNEL_SIZE = (3, 3)       # ノイズ除去のカーネルサイズ（元の大きさで。縮小したマスクには縮小率ぶん小さくしてかける）
+MASK_SCALE = 0.5                 # マスクを作る大きさ（縮小はぼかしの代わりにもなる。0.25 / 0.5 / 1.0）
+TIME_BUDGET_MS = None            # 例: 5 → マスク作成〜重心の計算がこの時間に収まるよう MASK_SCALE を自動で選ぶ
+ROI_TRACKING = True              # True: 前回見つかったあたりだけを処理（roi_tracker）
 WINDOW_MASK = 'Mask_Live'        # マスク表示ウィンドウ名
 WINDOW_CAMERA = 'RaspiCam_Live'  # カメラ表示ウィンドウ名
 
 
 # ===== 赤色領域を2値マスクで取り出す関数（入力は RGB） =====
-def red_mask_rgb(img_rgb: np.ndarray) -> np.ndarray:
+# 赤は色相が 0 近傍 と 179 近傍 に分布するため、2つの範囲のどちらかに入れば赤
+# 「色 → 赤かどうか」を起動時に表にしておく（frame_rgb は RGB の並びなので order="RGB"）
+red_lut = ColorLUT({"red": [HSV_RED_RANGE_1, HSV_RED_RANGE_2]}, order="RGB",
+                   kernel_size=MORPH_KERNEL_SIZE)
+
+
+def red_mask_rgb(img_rgb: np.ndarray, scale: float = MASK_SCALE) -> np.ndarray:
     """
     入力:  RGB画像 (H, W, 3)  例: dtype=uint8, 0-255
-    出力:  赤色っぽい部分の2値マスク (uint8, 0 or 255)
+    出力:  赤色っぽい部分の2値マスク (uint8, 0 or 255)。大きさは入力の scale 倍
 
-    手順:
-    1) ぼかしでノイズを軽減
-    2) RGB -> HSV へ変換（OpenCVのHは0-179）
-    3) 赤は色相が 0 近傍 と 179 近傍 に分布するため、2つの範囲を OR 結合
-    4) 形態学的処理（開閉）で小ノイズ除去＆穴埋め
+    手順（ColorLUT がまとめて行う）:
+    1) 縮小でノイズを軽減（ぼかしの代わり）
+    2) 表引き1回（RGB -> HSV 変換と2つの範囲の判定を前もって表にしてある。OpenCVのHは0-179）
+    3) 形態学的処理（開閉）で小ノイズ除去＆穴埋め
     """
-    # 1) ノイズ軽減（ガウシアンぼかし）
-    blur = cv2.GaussianBlur(img_rgb, GAUSS_KERNEL_SIZE, 0)
-
-    # 2) 色空間変換（RGB -> HSV）
-    hsv = cv2.cvtColor(blur, cv2.COLOR_RGB2HSV)
-
-    # 3) 赤の2レンジを inRange でそれぞれ抽出して OR
-    (lower1, upper1) = HSV_RED_RANGE_1
-    (lower2, upper2) = HSV_RED_RANGE_2
-    mask1 = cv2.inRange(hsv, lower1, upper1)
-    mask2 = cv2.inRange(hsv, lower2, upper2)
-    mask = cv2.bitwise_or(mask1, mask2)
-
-    # 4) 小ノイズ除去＆穴埋め（開→閉）
-    kernel = np.ones(MORPH_KERNEL_SIZE, np.uint8)
-    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
-    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=1)
-
-    return mask
+    return red_lut.mask(img_rgb, "red", scale=scale)
 
 
 # ===== 初期化：カメラ & サーボ =====
-picam2 = Picamera2()
-# 取得するフレームのフォーマットを「RGB888」、サイズを指定
-picam2.configure(
-    picam2.create_preview_configuration(
-        main={"format": "RGB888", "size": FRAME_SIZE}
-    )
-)
-picam2.start()
-
-# オートフォーカスを連続モードに設定（レンズ付きモジュール向け）
-picam2.set_controls({"AfMode": controls.AfModeEnum.Continuous})
+# 取得するフレームのフォーマットを「RGB888」、サイズを指定して起動
+# （オートフォーカスの連続モード設定と、別スレッドでの取得開始までまとめて行う）
+# 天地反転も取得のときに行う
+# flip 引数: 0: X軸回りで上下反転、1: Y軸回りで左右反転, -1: 180度回転
+source = open_source(FRAME_SIZE, "RGB888", flip=0)
 
 # PCA9685（PWMドライバ）初期化
 pwm = PCA9685()
 pwm.setPWMFreq(SERVO_FREQ_HZ)
 
+# サーボごとの校正値を読み込んで登録（角度→PWMの変換表とクランプ範囲）
+calib = apply_calibration(pwm, load_calibration())
+cal_x = calib[SERVO_CH_X]
+cal_y = calib[SERVO_CH_Y]
+
 # サーボの初期角度（中央）にセット
-sx = SERVO_CENTER_X
-sy = SERVO_CENTER_Y
-pwm.setRotationAngle(SERVO_CH_X, sx)
-pwm.setRotationAngle(SERVO_CH_Y, sy)
+sx = cal_x.center
+sy = cal_y.center
+pwm.setRotationAngles({SERVO_CH_X: sx, SERVO_CH_Y: sy})  # 2軸まとめて1回のI2C転送
+
+# サーボへの書き込みは別スレッドで 50Hz ごとに最新の目標だけを反映
+# （メインループは I2C の完了を待たない）
+servo = ServoWorker(pwm, rate_hz=SERVO_FREQ_HZ)
+servo.start()
+
+# 縮小率（TIME_BUDGET_MS が None なら MASK_SCALE のまま）
+chooser = ScaleChooser(TIME_BUDGET_MS, scale=MASK_SCALE)
+
+# 探索窓（座標は縮小したマスクの画素にそろうよう、1/縮小率 の倍数に）
+tracker = RoiTracker(FRAME_SIZE)
+
+# 色の変換の出力先（1回目に確保し、あとは同じ配列に書き込む）
+buffers = BufferPool()
 
 try:
     while True:
         # ===== フレーム取得（RGB） =====
-        frame_rgb = picam2.capture_array()  # PiCamera2 は RGB で返す
-
-        # 必要に応じて天地反転（カメラの取り付け向きに合わせる）
-        # 0: X軸回りで上下反転、1: Y軸回りで左右反転, -1: 180度回転
-        frame_rgb = cv2.flip(frame_rgb, 0)
-        frame_rgb = cv2.cvtColor(frame_rgb, cv2.COLOR_BGR2RGB)
+        frame = source.read()  # いちばん新しいフレーム（天地反転済み）
+        if frame is None:
+            if source.finished:  # 動画・画像フォルダを最後まで読んだ
+                break
+            continue
+        frame_rgb = frame.image
+
+        frame_rgb = cv2.cvtColor(frame_rgb, cv2.COLOR_BGR2RGB, dst=buffers.like("rgb", frame_rgb))
         # ===== 赤色マスクの作成 =====
-        mask = red_mask_rgb(frame_rgb)
+        # 前回の位置・大きさ・速さから決めた窓の中だけを処理する（見失うと広げ、やがて画面全体）
+        scale = chooser.scale
+        tracker.align = int(round(1 / scale))
+        if ROI_TRACKING:
+            x0, y0, x1, y1 = tracker.window(frame.timestamp)
+        else:
+            x0, y0, x1, y1 = tracker.full_frame()
+        t_start = time.perf_counter()
+        mask = red_mask_rgb(frame_rgb[y0:y1, x0:x1], scale)
 
         # マスクのライブ表示（デバッグ用）
         cv2.imshow(WINDOW_MASK, mask)
 
-        # ===== ラベリング（連結成分の抽出）=====
-        # 返り値:
-        # nLabels: ラベル数（背景を含む）
-        # labelImg: 各画素のラベルID
-        # stats: 各ラベルの外接矩形と面積など [x, y, w, h, area]
-        # centroids: 重心座標 [cx, cy]
-        nLabels, labelImg, stats, centroids = cv2.connectedComponentsWithStats(mask)
+        # ===== 最も面積が大きい物体を探す =====
+        # 返り値: 面積の大きい順に k 個（ここでは 1 個）、1行 = (cx, cy, x, y, w, h, area)
+        # マスクは探索窓を scale 倍にしたものなので、座標・大きさ・面積は画面全体のものに戻してもらう
+        blobs = largest_blobs(mask, k=1, scale=scale, offset=(x0, y0))
+
+        blob = None
+        if len(blobs):
+            # 重心座標
+            cx, cy = blobs[0, 0], blobs[0, 1]
+
+            # 外接矩形と面積
+            x, y, w, h, area = (int(v) for v in blobs[0, 2:])
+
+            # 縮小したマスクの重心は粗いので、元の画像の外接矩形のまわりだけで求め直す
+            if scale < 1.0:
+                refined = refine_centroid(red_lut, "red", frame_rgb, x, y, w, h, pad=2 * tracker.align)
+                if refined is not None:
+                    cx, cy = refined
+            blob = Blob(cx, cy, x, y, w, h, area)
+
+        # 処理時間から次のフレームの縮小率を決める（TIME_BUDGET_MS があるときだけ変わる）
+        chooser.update(time.perf_counter() - t_start)
 
         # 描画用に BGR に変換（表示はBGR前提）
-        frame_bgr = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2BGR)
+        frame_bgr = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2BGR, dst=buffers.like("disp", frame_rgb))
 
         # 画面中心（ピクセル）
         x_center = FRAME_SIZE[0] / 2
         y_center = FRAME_SIZE[1] / 2
 
-        if nLabels > 1:
-            # 背景(ラベル0)を除いた領域の中で最も面積が大きいものを選択
-            areas = stats[1:, cv2.CC_STAT_AREA]
-            max_idx = int(np.argmax(areas)) + 1  # +1 で実ラベルに戻す
-
-            # 重心座標
-            cx, cy = centroids[max_idx]
-
-            # 外接矩形と面積
-            x = int(stats[max_idx, cv2.CC_STAT_LEFT])
-            y = int(stats[max_idx, cv2.CC_STAT_TOP])
-            w = int(stats[max_idx, cv2.CC_STAT_WIDTH])
-            h = int(stats[max_idx, cv2.CC_STAT_HEIGHT])
-            area = int(stats[max_idx, cv2.CC_STAT_AREA])
+        if blob is not None:
+            cx, cy, x, y, w, h, area = blob
 
             # 検出結果の描画（見やすさのため）
             cv2.circle(frame_bgr, (int(cx), int(cy)), 10, (0, 255, 0), 2)
             cv2.rectangle(frame_bgr, (x, y), (x + w, y + h), (0, 255, 0), 2)
             cv2.putText(
-                frame_bgr, f"area:{area}",
+                frame_bgr, f"area:{area} scale:{scale:g}",
                 (x, max(0, y - 5)),
                 cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1, cv2.LINE_AA
             )
@@ -167,12 +193,16 @@ try:
                 sy -= SERVO_STEP
 
             # 角度を物理範囲にクリップ（無理な角度を防止）
-            sx = max(SERVO_MIN, min(SERVO_MAX, sx))
-            sy = max(SERVO_MIN, min(SERVO_MAX, sy))
+            sx = cal_x.clamp(sx)
+            sy = cal_y.clamp(sy)
 
             # 実際にサーボを動かす
-            pwm.setRotationAngle(SERVO_CH_X, sx)
-            pwm.setRotationAngle(SERVO_CH_Y, sy)
+            servo.set_angles({SERVO_CH_X: sx, SERVO_CH_Y: sy})
+
+        # 探索窓を更新し、画面に描く（画面全体を探しているときは描かない）
+        tracker.update(blob, frame.timestamp)
+        if (x0, y0, x1, y1) != tracker.full_frame():
+            cv2.rectangle(frame_bgr, (x0, y0), (x1 - 1, y1 - 1), (200, 200, 200), 1)
 
         # カメラ画像の表示（BGR）
         cv2.imshow(WINDOW_CAMERA, frame_bgr)
@@ -184,6 +214,7 @@ try:
 
 finally:
     # ===== 後始末：例外があっても必ず通る =====
+    servo.stop()
     pwm.exit_PCA9685()
-    picam2.stop()
+    source.stop()
     cv2.destroyAllWindows()
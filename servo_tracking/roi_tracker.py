@@ -0,0 +1,92 @@
+"""
+色の追尾で「前のフレームで見つかったあたり」だけを処理するための探索窓（ROI）
+
+ポイント
+- 物体は1フレームのあいだに数ピクセルしか動かないので、毎回画面全体を
+  マスク作成・ラベリングするのはむだが多い
+- RoiTracker は前回の重心・外接矩形・速さ（撮影時刻から求める px/秒）から、
+  今回のフレームで物体がいそうな窓を決める
+    窓の大きさ = 前回の外接矩形 × (1 + margin) + 移動量（速さ × 経過時間）
+    窓の中心   = 前回の重心 + 速さ × 経過時間（動いている向きへ先回り）
+- 見失ったら窓を grow 倍ずつ広げ、max_misses 回続けて見失ったら画面全体を探す
+- 1フレームの処理量が「画面の大きさ」ではなく「物体の大きさ」で決まるので、
+  そのぶんフレームレートを上げられる
+- 窓の座標は align の倍数にそろえる（マスクを縮小して作るときに、座標がずれないように）
+
+使い方
+    tracker = RoiTracker(FRAME_SIZE, align=2)
+    x0, y0, x1, y1 = tracker.window(frame.timestamp)
+    mask = red_mask_rgb(frame_rgb[y0:y1, x0:x1])
+    ...（窓の中で物体を探し、座標は画面全体の座標に直す）
+    tracker.update(Blob(cx, cy, x, y, w, h, area) か None, frame.timestamp)
+"""
+
+from collections import namedtuple
+
+# 見つかった物体（座標は画面全体のもの）: 重心 (cx, cy)、外接矩形 (x, y, w, h)、面積
+Blob = namedtuple("Blob", "cx cy x y w h area")
+
+
+class RoiTracker:
+    def __init__(self, frame_size, margin=1.0, min_size=64, grow=1.6, max_misses=5, align=1):
+        self.frame_w, self.frame_h = frame_size
+        self.margin = margin            # 外接矩形のまわりに足す余白（矩形の大きさに対する割合）
+        self.min_size = min_size        # 窓の最小の幅・高さ（ピクセル）
+        self.grow = grow                # 見失ったときに窓を広げる倍率
+        self.max_misses = max_misses    # この回数続けて見失ったら画面全体を探す
+        self.align = align
+        self.blob = None                # 最後に見つかった物体
+        self.velocity = (0.0, 0.0)      # 重心の速さ（px/秒）
+        self.misses = 0                 # 続けて見失った回数
+        self.last_time = None           # 最後に見つかったフレームの撮影時刻
+        self.roi = self.full_frame()
+
+    @property
+    def searching(self):
+        """True: 画面全体を探している（まだ見つけていない・見失った）"""
+        return self.blob is None or self.misses >= self.max_misses
+
+    def full_frame(self):
+        return (0, 0, self.frame_w, self.frame_h)
+
+    def window(self, timestamp):
+        """timestamp（撮影時刻）のフレームで処理する範囲 (x0, y0, x1, y1)"""
+        if self.searching:
+            self.roi = self.full_frame()
+            return self.roi
+        blob = self.blob
+        dt = max(0.0, timestamp - self.last_time)
+        vx, vy = self.velocity
+        # 動いた向きへ先回りし、動いた量のぶんだけ窓を広げる
+        cx, cy = blob.cx + vx * dt, blob.cy + vy * dt
+        scale = (1.0 + self.margin) * self.grow ** self.misses
+        half_w = max(self.min_size, blob.w * scale) / 2 + abs(vx) * dt
+        half_h = max(self.min_size, blob.h * scale) / 2 + abs(vy) * dt
+        self.roi = self._clip(cx - half_w, cy - half_h, cx + half_w, cy + half_h)
+        return self.roi
+
+    def update(self, blob, timestamp):
+        """このフレームの結果を渡す（blob は画面全体の座標の Blob、見つからなければ None）"""
+        if blob is None:
+            self.misses += 1
+            if self.misses >= self.max_misses:
+                self.velocity = (0.0, 0.0)
+            return
+        if self.blob is not None and not self.searching and timestamp > self.last_time:
+            dt = timestamp - self.last_time
+            self.velocity = ((blob.cx - self.blob.cx) / dt, (blob.cy - self.blob.cy) / dt)
+        else:
+            self.velocity = (0.0, 0.0)
+        self.blob = blob
+        self.last_time = timestamp
+        self.misses = 0
+
+    def _clip(self, x0, y0, x1, y1):
+        a = self.align
+        x0 = max(0, int(x0) // a * a)
+        y0 = max(0, int(y0) // a * a)
+        x1 = min(self.frame_w, -(-int(x1 + 1) // a) * a)
+        y1 = min(self.frame_h, -(-int(y1 + 1) // a) * a)
+        if x1 - x0 < a or y1 - y0 < a:      # 画面の外に出た（予測が外れた）
+            return self.full_frame()
+        return (x0, y0, x1, y1)
@@ -0,0 +1,105 @@
+"""
+サーボごとの校正値（キャリブレーション）と、角度 → PWM カウントの変換表
+
+ポイント
+- サーボは個体ごとにパルス幅と角度の対応が少しずつ違うので、チャネルごとに
+  min_pulse / max_pulse（0度・180度のパルス幅 us）、center（基準角度）、
+  direction（回転の向き, +1 または -1）、soft_min / soft_max（動かしてよい範囲）を持つ
+- 校正値は servo_calib.json から読み込む（ファイルが無ければ既定値）
+- 読み込んだ値から 0.1度刻みの変換表を一度だけ作るので、
+  角度 → PWM カウントの変換は表を1回引くだけ
+- 範囲外の角度は soft_min〜soft_max に丸めて（クランプして）使う
+
+servo_calib.json の例
+    {
+      "0": {"min_pulse": 501, "max_pulse": 2501, "center": 90,
+            "direction": 1, "soft_min": 30, "soft_max": 150},
+      "1": {"soft_min": 30, "soft_max": 150}
+    }
+"""
+
+import json
+import os
+import numpy as np
+
+CALIB_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "servo_calib.json")
+RESOLUTION = 0.1        # 変換表の刻み（度）
+
+
+class ServoCalibration:
+    """1チャネル分の校正値。compile() で変換表（AngleTable）を作る。"""
+
+    def __init__(self, min_pulse=501.0, max_pulse=2501.0, center=90.0, direction=1,
+                 soft_min=0.0, soft_max=180.0):
+        self.min_pulse = float(min_pulse)
+        self.max_pulse = float(max_pulse)
+        self.center = float(center)
+        self.direction = 1 if direction >= 0 else -1
+        self.soft_min = float(max(0.0, soft_min))
+        self.soft_max = float(min(180.0, soft_max))
+
+    def clamp(self, angle):
+        return min(self.soft_max, max(self.soft_min, angle))
+
+    def pulse(self, angle):
+        """角度（配列可）→ パルス幅(us)。direction=-1 のときは center を軸に反転する。"""
+        physical = self.center + self.direction * (np.asarray(angle, dtype=np.float64) - self.center)
+        physical = np.clip(physical, 0.0, 180.0)
+        return self.min_pulse + physical * (self.max_pulse - self.min_pulse) / 180.0
+
+    def compile(self, resolution=RESOLUTION):
+        return AngleTable(self, resolution)
+
+    def to_dict(self):
+        return {
+            "min_pulse": self.min_pulse, "max_pulse": self.max_pulse,
+            "center": self.center, "direction": self.direction,
+            "soft_min": self.soft_min, "soft_max": self.soft_max,
+        }
+
+
+class AngleTable:
+    """soft_min〜soft_max を resolution 刻みで並べた「角度 → 12bit PWM カウント」の表"""
+
+    def __init__(self, calib, resolution=RESOLUTION):
+        self.calib = calib
+        self.lo = calib.soft_min
+        self.step = resolution
+        n = int(round((calib.soft_max - calib.soft_min) / resolution)) + 1
+        angles = calib.soft_min + np.arange(n) * resolution
+        # PWM周波数は 50Hz（周期 20000us）前提
+        self.table = (calib.pulse(angles) * 4096.0 / 20000.0).astype(np.uint16)
+        self._list = self.table.tolist()      # 1点ずつ引くときは Python の list が速い
+        self._last = n - 1
+
+    def tick(self, angle):
+        """角度1つ → PWM カウント（範囲外はクランプ）"""
+        i = int((angle - self.lo) / self.step + 0.5)
+        return self._list[0 if i < 0 else (self._last if i > self._last else i)]
+
+    def ticks(self, angles):
+        """角度の配列 → PWM カウントの配列（まとめて変換）"""
+        i = np.rint((np.asarray(angles, dtype=np.float64) - self.lo) / self.step)
+        return self.table[np.clip(i, 0, self._last).astype(np.intp)]
+
+
+def load_calibration(path=CALIB_FILE, channels=(0, 1)):
+    """校正ファイルを読み込み {channel: ServoCalibration} を返す（無いチャネルは既定値）"""
+    calibs = {ch: ServoCalibration() for ch in channels}
+    if os.path.exists(path):
+        with open(path) as f:
+            for ch, params in json.load(f).items():
+                calibs[int(ch)] = ServoCalibration(**params)
+    return calibs
+
+
+def save_calibration(calibs, path=CALIB_FILE):
+    with open(path, "w") as f:
+        json.dump({str(ch): c.to_dict() for ch, c in sorted(calibs.items())}, f, indent=2)
+
+
+def apply_calibration(pwm, calibs):
+    """PCA9685 に各チャネルの変換表を登録する（以後 setRotationAngle は表引き＋クランプ）"""
+    for ch, calib in calibs.items():
+        pwm.setAngleTable(ch, calib.compile())
+    return calibs
@@ -0,0 +1,50 @@
+"""
+毎フレームの画像処理で使う作業用の配列（cvtColor や resize の出力先）を使い回すための入れ物
+
+ポイント
+- cv2.cvtColor(img, code) のように出力先を渡さないと、OpenCV は毎回新しい配列を確保する
+  （640x480x3 で約 0.9 MB。これがフレームごと・処理ごとに何枚も確保され、
+   確保・解放のばらつきがそのまま1フレームの時間のばらつきになる）
+- BufferPool は名前ごとに1枚の配列を持っておき、dst= に渡す出力先として返す
+    buffers.get("rgb", shape) … shape の大きさの配列（2回目からは同じ配列）
+    buffers.like("rgb", img)  … img と同じ大きさ・型の配列
+- 大きさが毎フレーム変わる処理（探索窓の中だけの処理など）でも、
+  それまでで一番大きい配列の左上の部分（ビュー）を返すので、足りなくなったときだけ確保し直す
+- 返した配列は、同じ名前で次に get() したときに上書きされる
+  （別々に使いたい結果には別々の名前を付ける）
+
+使い方
+    buffers = BufferPool()
+    while True:
+        frame = source.read()
+        rgb = cv2.cvtColor(frame.image, cv2.COLOR_BGR2RGB, dst=buffers.like("rgb", frame.image))
+"""
+
+import numpy as np
+
+
+class BufferPool:
+    def __init__(self):
+        self._buffers = {}
+
+    def get(self, name, shape, dtype=np.uint8):
+        """name の作業用配列のうち、左上 shape の部分（ビュー）を返す"""
+        shape = tuple(shape)
+        dtype = np.dtype(dtype)
+        h, w = shape[:2]
+        buf = self._buffers.get(name)
+        if buf is not None and buf.shape[2:] == shape[2:] and buf.dtype == dtype:
+            if buf.shape[0] >= h and buf.shape[1] >= w:
+                return buf[:h, :w]
+            h, w = max(h, buf.shape[0]), max(w, buf.shape[1])
+        buf = self._buffers[name] = np.empty((h, w) + shape[2:], dtype)
+        return buf[:shape[0], :shape[1]]
+
+    def like(self, name, img):
+        """img と同じ大きさ・型の作業用配列"""
+        return self.get(name, img.shape, img.dtype)
+
+    @property
+    def nbytes(self):
+        """確保している配列の合計バイト数"""
+        return sum(buf.nbytes for buf in self._buffers.values())
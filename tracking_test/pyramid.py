@@ -0,0 +1,108 @@
+"""
+色の物体探しを「粗い画像で探す → 元の画像で仕上げる」の2段で行うための道具
+
+ポイント
+- サーボを動かすのに必要なのは「重心が数ピクセルの精度でわかること」だけなので、
+  マスク作成とラベリングは 1/2 や 1/4 に縮小した画像で十分
+  （1/4 なら処理する画素は 1/16）
+- 見つかった物体（いちばん大きいもの）だけ、元の大きさの画像から外接矩形のまわりを切り出し、
+  その中のいちばん大きい物体の画素から重心を小数点以下まで求め直す → 縮小による重心のずれを取り戻す
+    縮小したマスクでは物体の一部しか見えていないことがある（まだらな物体が割れたときなど）
+    ので、元の大きさの物体が切り出した範囲の縁に触れている間は、その向きに範囲を広げて求め直す
+- 縮小率は設定で固定するか、ScaleChooser に1フレームの処理時間の予算を渡して自動で選ばせる
+    予算を超えたら1段粗く、1段細かくしても予算に余裕で収まりそうなら1段細かく
+    （処理時間はおおよそ画素数に比例する＝縮小率を 1/2 にすると 1/4 になる、として見積もる）
+
+使い方
+    chooser = ScaleChooser(budget_ms=8)           # 固定なら ScaleChooser(scale=0.5)
+    t0 = time.perf_counter()
+    mask = lut.mask(img, "red", scale=chooser.scale)
+    ...（mask で一番大きい物体を探し、外接矩形を元の画像の座標に直す）
+    cx, cy = refine_centroid(lut, "red", img, x, y, w, h)
+    chooser.update(time.perf_counter() - t0)
+"""
+
+import numpy as np
+import cv2
+
+SCALES = (1.0, 0.5, 0.25)       # 選べる縮小率（細かい順）
+
+
+class ScaleChooser:
+    def __init__(self, budget_ms=None, scale=0.5, scales=SCALES, alpha=0.2, headroom=0.7, settle=10):
+        """
+        budget_ms: 1フレームの処理時間の予算（ミリ秒）。None なら scale に固定
+        headroom:  細かくするのは、見積もりが予算 × headroom に収まるときだけ（行ったり来たり防止）
+        settle:    縮小率を変えたあと、次に変えるまで待つフレーム数
+        """
+        self.budget = budget_ms / 1000.0 if budget_ms else None
+        self.scales = tuple(sorted(scales, reverse=True))
+        self.scale = min(self.scales, key=lambda s: abs(s - scale))
+        self.alpha = alpha
+        self.headroom = headroom
+        self.settle = settle
+        self.elapsed = None             # 処理時間の指数移動平均（秒）
+        self.changes = 0                # 縮小率を変えた回数
+        self._hold = 0
+
+    @property
+    def auto(self):
+        return self.budget is not None
+
+    def update(self, elapsed):
+        """このフレームの処理時間（秒）を渡す。次のフレームの縮小率を返す"""
+        a = self.alpha
+        self.elapsed = elapsed if self.elapsed is None else (1 - a) * self.elapsed + a * elapsed
+        if not self.auto:
+            return self.scale
+        if self._hold > 0:
+            self._hold -= 1
+            return self.scale
+        i = self.scales.index(self.scale)
+        if self.elapsed > self.budget and i + 1 < len(self.scales):
+            self._switch(self.scales[i + 1])
+        elif i > 0:
+            finer = self.scales[i - 1]
+            if self.elapsed * (finer / self.scale) ** 2 < self.budget * self.headroom:
+                self._switch(finer)
+        return self.scale
+
+    def _switch(self, scale):
+        # 処理時間の見積もりも画素数の比で直しておく
+        self.elapsed *= (scale / self.scale) ** 2
+        self.scale = scale
+        self.changes += 1
+        self._hold = self.settle
+
+
+def refine_centroid(lut, name, img, x, y, w, h, pad=4, max_grow=4):
+    """
+    元の大きさの img から矩形 (x, y, w, h) のまわり pad ピクセルを切り出し、
+    その中で name の色のいちばん大きい物体の重心 (cx, cy) を求める（画面全体の座標。見つからなければ None）
+    物体が切り出した範囲の縁（画面の端は除く）に触れていたら、その向きに範囲の幅・高さぶん広げて
+    やり直す（最大 max_grow 回）
+    切り出したマスクは別の置き場所（out="refine"）に作るので、呼び出し側の縮小マスクは上書きしない
+    """
+    img_h, img_w = img.shape[:2]
+    x0, y0 = max(0, int(x) - pad), max(0, int(y) - pad)
+    x1, y1 = min(img_w, int(x + w) + pad), min(img_h, int(y + h) + pad)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    for _ in range(max_grow + 1):
+        mask = lut.mask(img[y0:y1, x0:x1], name, out="refine")
+        # 切り出した範囲は小さいので、ラベル画像を作っても安い（画素から正確な重心が出る）
+        n, _, stats, centroids = cv2.connectedComponentsWithStats(mask)
+        if n < 2:
+            return None
+        i = int(np.argmax(stats[1:, cv2.CC_STAT_AREA])) + 1
+        cx, cy = x0 + centroids[i][0], y0 + centroids[i][1]
+        bx, by, bw, bh = stats[i, :4]
+        pw, ph = x1 - x0, y1 - y0
+        grown = (max(0, x0 - pw) if bx == 0 else x0,
+                 max(0, y0 - ph) if by == 0 else y0,
+                 min(img_w, x1 + pw) if bx + bw == pw else x1,
+                 min(img_h, y1 + ph) if by + bh == ph else y1)
+        if grown == (x0, y0, x1, y1):      # 物体がまるごと入っている（または画面の端まで来た）
+            break
+        x0, y0, x1, y1 = grown
+    return cx, cy
@@ -5,110 +5,137 @@ PiCamera2 + OpenCV で「赤色領域を検出→最大領域を表示する」
 ポイント
 - PiCamera2 は RGB でフレームを返す → 画像処理は RGB のまま実施
 - OpenCV の imshow は BGR 前提 → 表示直前だけ RGB→BGR 変換
-- connectedComponentsWithStats で最大面積のラベルを選び、矩形・重心を描く
+- 赤の判定は color_lut の表引き1回（HSV の範囲は起動時に表にしておく）。縮小した画像で行う
+- blob_finder で最大面積の物体（輪郭から求める。ラベル画像は作らない）を選び、矩形・重心を描く
+- 一度見つけたら、前回の位置のまわりの窓（roi_tracker）だけを処理する（灰色の枠）
+- 探すのは縮小した画像、重心は元の大きさの画像で求め直す（pyramid）
+  TIME_BUDGET_MS を決めると、その時間に収まるよう縮小率（1, 1/2, 1/4）を自動で選ぶ
+- フレームは frame_grabber が別スレッドで撮り続け、ループは最新の1枚を処理する
+- 環境変数 FRAME_SOURCE=synth（動く色つきの円）や動画ファイルでカメラなしでも試せる
+- 色の変換の出力先は buffer_pool の配列を使い回す（フレームごとに新しい配列を確保しない）
 """
 
+import time
 import numpy as np
 import cv2
-from picamera2 import Picamera2
-from libcamera import controls
+from frame_source import open_source
+from color_lut import ColorLUT
+from roi_tracker import RoiTracker, Blob
+from blob_finder import largest_blobs
+from pyramid import ScaleChooser, refine_centroid
+from buffer_pool import BufferPool
 
 # ===== 画面サイズや表示名などの定数 =====
 FRAME_SIZE = (640, 480)               # フレームサイズ (幅, 高さ)
 WINDOW_MASK = 'Mask_Live'             # マスク表示ウィンドウ名
 WINDOW_CAMERA = 'RaspiCam_Live'       # カメラ表示ウィンドウ名
+MASK_SCALE = 0.5                      # マスクを作る大きさ（0.5 = 320x240、0.25 = 160x120、1.0 = そのまま）
+TIME_BUDGET_MS = None                 # 例: 5 → マスク作成〜重心の計算がこの時間に収まるよう MASK_SCALE を自動で選ぶ
+ROI_TRACKING = True                   # True: 前回見つかったあたりだけを処理（roi_tracker）
 
-def red_mask_rgb(img_rgb: np.ndarray) -> np.ndarray:
+# 赤の2レンジ（HSV。OpenCVのHは0~179。赤は 0 近傍 と 179 近傍に分かれる）
+HSV_RED_RANGES = [((0,   120, 70), (10,  255, 255)),
+                  ((170, 120, 70), (179, 255, 255))]
+
+# 「色 → 赤かどうか」の表を起動時に1回だけ作る（frame_rgb は RGB の並びなので order="RGB"）
+red_lut = ColorLUT({"red": HSV_RED_RANGES}, order="RGB")
+
+def red_mask_rgb(img_rgb: np.ndarray, scale: float = MASK_SCALE) -> np.ndarray:
     """
     入力: RGB画像 (H, W, 3), dtype=uint8
-    出力: 赤色領域の2値マスク (0 or 255, dtype=uint8)
+    出力: 赤色領域の2値マスク (0 or 255, dtype=uint8)。大きさは入力の scale 倍
 
-    手順:
-    1) ガウシアンぼかしでノイズ軽減
-    2) RGB -> HSV 変換  ※OpenCVのHは0~179
-    3) 赤は 0 近傍 と 179 近傍の2レンジを inRange で抽出し OR 結合
-    4) 形態学的処理（開→閉）で小ノイズ除去＆穴埋め
+    手順（ColorLUT がまとめて行う）:
+    1) 縮小（平均をとるのでぼかしと同じくノイズ軽減になる）
+    2) 表引き1回（RGB -> HSV 変換・2レンジの inRange・OR 結合の結果を前もって表にしてある）
+    3) 形態学的処理（開→閉）で小ノイズ除去＆穴埋め
+    ※返すマスクは次の呼び出しで上書きされる
     """
-    # 1) ノイズ軽減
-    blur = cv2.GaussianBlur(img_rgb, (5, 5), 0)
-
-    # 2) 色空間変換（RGB→HSV）
-    hsv = cv2.cvtColor(blur, cv2.COLOR_RGB2HSV)
-
-    # 3) 赤の2レンジを抽出
-    lower1 = np.array([0,   120, 70],  dtype=np.uint8)
-    upper1 = np.array([10,  255, 255], dtype=np.uint8)
-    lower2 = np.array([170, 120, 70],  dtype=np.uint8)
-    upper2 = np.array([179, 255, 255], dtype=np.uint8)
-
-    mask1 = cv2.inRange(hsv, lower1, upper1)
-    mask2 = cv2.inRange(hsv, lower2, upper2)
-    mask = cv2.bitwise_or(mask1, mask2)
-
-    # 4) 小ノイズ除去＆穴埋め（開→閉）
-    kernel = np.ones((3, 3), np.uint8)
-    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
-    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=1)
-    return mask
+    return red_lut.mask(img_rgb, "red", scale=scale)
 
 
 # ===== カメラ初期化 =====
-picam2 = Picamera2()
 # 取得するフレームは RGB888（=RGBの8bit×3ch）で 640x480
-picam2.configure(picam2.create_preview_configuration(
-    main={"format": "RGB888", "size": FRAME_SIZE}
-))
-picam2.start()
+# （AFの連続モード設定と、別スレッドでの取得開始までまとめて行う）
+# 取り付け向きの補正もそこで行う
+# flip 引数: 0=上下反転, 1=左右反転, -1=上下左右反転, None=そのまま
+source = open_source(FRAME_SIZE, "RGB888", flip=0)
+
+# 縮小率（TIME_BUDGET_MS が None なら MASK_SCALE のまま）
+chooser = ScaleChooser(TIME_BUDGET_MS, scale=MASK_SCALE)
 
-# レンズ付きモジュールの場合に有効：AFを連続モードに
-picam2.set_controls({"AfMode": controls.AfModeEnum.Continuous})
+# 探索窓（座標は縮小したマスクの画素にそろうよう、1/縮小率 の倍数に）
+tracker = RoiTracker(FRAME_SIZE)
+
+# 色の変換の出力先（1回目に確保し、あとは同じ配列に書き込む）
+buffers = BufferPool()
 
 try:
     while True:
         # ---- フレーム取得（PiCamera2はRGBで返す） ----
-        frame_rgb = picam2.capture_array()
-
-        # 取り付け向きにより上下/左右が逆なら flip で補正
-        # 引数: 0=上下反転, 1=左右反転, -1=上下左右反転
-        frame_rgb = cv2.flip(frame_rgb, 0)  
-        frame_rgb = cv2.cvtColor(frame_rgb, cv2.COLOR_BGR2RGB)
+        frame = source.read()
+        if frame is None:
+            if source.finished:     # 動画・画像フォルダを最後まで読んだ
+                break
+            continue
+        frame_rgb = frame.image
+
+        frame_rgb = cv2.cvtColor(frame_rgb, cv2.COLOR_BGR2RGB, dst=buffers.like("rgb", frame_rgb))
         
         # ---- 赤マスク作成（処理はRGBで統一）----
-        mask = red_mask_rgb(frame_rgb)
+        # 前回の位置・大きさ・速さから決めた窓の中だけを処理する（見失うと広げ、やがて画面全体）
+        scale = chooser.scale
+        tracker.align = int(round(1 / scale))
+        if ROI_TRACKING:
+            x0, y0, x1, y1 = tracker.window(frame.timestamp)
+        else:
+            x0, y0, x1, y1 = tracker.full_frame()
+        t_start = time.perf_counter()
+        mask = red_mask_rgb(frame_rgb[y0:y1, x0:x1], scale)
 
         # ---- マスクを表示（デバッグ用）----
         cv2.imshow(WINDOW_MASK, mask)
 
-        # ---- ラベリング（連結成分）----
-        # nLabels: ラベル数（背景を含む）
-        # stats:   各ラベルの [x, y, w, h, area]
-        # centroids: 各ラベルの重心 (cx, cy)
-        nLabels, labelImg, stats, centroids = cv2.connectedComponentsWithStats(mask)
+        # ---- 最大の物体を探す ----
+        # 面積の大きい順に k 個（ここでは 1 個）だけ、1行 = (cx, cy, x, y, w, h, area)
+        # マスクは探索窓を scale 倍にしたものなので、座標・大きさ・面積は画面全体のものに戻してもらう
+        blobs = largest_blobs(mask, k=1, scale=scale, offset=(x0, y0))
 
-        # 表示用に BGR へ変換（imshowはBGR前提）
-        disp_bgr = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2BGR)
+        blob = None
+        if len(blobs):
+            # 最大の物体の重心と外接矩形
+            cx, cy = blobs[0, 0], blobs[0, 1]
+            x, y, w, h, area = (int(v) for v in blobs[0, 2:])
 
-        if nLabels > 1:
-            # 背景(0)以外の面積を取り出し、最大のラベルを選ぶ
-            areas = stats[1:, cv2.CC_STAT_AREA]
-            max_idx = int(np.argmax(areas)) + 1  # +1で実ラベル番号に戻す
+            # 縮小したマスクの重心は粗いので、元の画像の矩形のまわりだけで求め直す
+            if scale < 1.0:
+                refined = refine_centroid(red_lut, "red", frame_rgb, x, y, w, h, pad=2 * tracker.align)
+                if refined is not None:
+                    cx, cy = refined
+            blob = Blob(cx, cy, x, y, w, h, area)
 
-            # 最大ラベルの重心と外接矩形
-            cx, cy = centroids[max_idx]
-            x = int(stats[max_idx, cv2.CC_STAT_LEFT])
-            y = int(stats[max_idx, cv2.CC_STAT_TOP])
-            w = int(stats[max_idx, cv2.CC_STAT_WIDTH])
-            h = int(stats[max_idx, cv2.CC_STAT_HEIGHT])
-            area = int(stats[max_idx, cv2.CC_STAT_AREA])
+        # 処理時間から次のフレームの縮小率を決める（TIME_BUDGET_MS があるときだけ変わる）
+        chooser.update(time.perf_counter() - t_start)
+
+        # 表示用に BGR へ変換（imshowはBGR前提）
+        disp_bgr = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2BGR, dst=buffers.like("disp", frame_rgb))
+
+        if blob is not None:
+            cx, cy, x, y, w, h, area = blob
 
             # 可視化（重心マーク、矩形、面積テキスト）
             cv2.circle(disp_bgr, (int(cx), int(cy)), 10, (0, 255, 0), 2)
             cv2.rectangle(disp_bgr, (x, y), (x + w, y + h), (0, 255, 0), 2)
-            cv2.putText(disp_bgr, f"area:{area}",
+            cv2.putText(disp_bgr, f"area:{area} scale:{scale:g}",
                         (x, max(0, y - 5)),
                         cv2.FONT_HERSHEY_SIMPLEX, 0.5,
                         (0, 255, 0), 1, cv2.LINE_AA)
 
+        # 探索窓を更新し、画面に描く（画面全体を探しているときは描かない）
+        tracker.update(blob, frame.timestamp)
+        if (x0, y0, x1, y1) != tracker.full_frame():
+            cv2.rectangle(disp_bgr, (x0, y0), (x1 - 1, y1 - 1), (200, 200, 200), 1)
+
         # ---- カメラ画像を表示（BGR）----
         cv2.imshow(WINDOW_CAMERA, disp_bgr)
 
@@ -119,5 +146,5 @@ try:
 
 finally:
     # 例外が起きても確実に後始末
-    picam2.stop()
+    source.stop()
     cv2.destroyAllWindows()